@@ -1,18 +1,31 @@
 import streamlit as st
 import random
 import time
+import threading
 import json
 import base64
 from collections import defaultdict
-import pandas as pd
-import plotly.express as px
 from datetime import datetime, timedelta
 import os
+import uuid
+import metrics
+from guest_store import GuestStore
+from session_budget import SessionBudget
+from recipes import get_recipe_book, match_recipes, use_first_urgency, what_to_buy
+from recommender import (
+    candidate_foods, rank_foods, diversify, score_food, get_slot_recommendations, get_ranked_entry, fill_calorie_budget
+)
 from database import (
-    get_connection, initialize_and_seed_database, verify_user, create_user,
+    DB_PATH, GUEST_USER, get_connection, initialize_and_seed_database, verify_user, create_user, get_active_foods,
+    get_foods_by_ids, get_blacklist, record_meal, get_eat_frequency, FOOD_ATTRIBUTES, attribute_mask, attribute_names,
+    set_food_attributes, set_food_nutrition, get_calories_eaten, add_foods,
+    add_to_blacklist, remove_from_blacklist, get_pantry_ingredients, get_meal_plan, save_meal_plan, add_pantry_item, cook_recipe,
+    get_expiring_items, get_pantry_forecast, EXPIRY_WARNING_DAYS, get_trending_foods, TRENDING_WINDOW_DAYS,
     get_user_preferences, update_user_preferences, get_user_avatar, update_user_avatar, update_password
 ) 
 
+_script_start = time.perf_counter()
+
 # 页面配置
 st.set_page_config(
     page_title="HoneyEat - 亲爱的今天吃什么",
@@ -21,129 +34,25 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# 极简风格CSS
-st.markdown("""
-<style>
-    /* 全局样式 */
-    body {
-        font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", "PingFang SC", "Microsoft YaHei";
-        background: #f8f9fa;
-    }
-    
-    /* 主标题 */
-    .main-title {
-        font-size: 2.5rem;
-        font-weight: 300;
-        color: #2c3e50;
-        text-align: center;
-        margin: 2rem 0 1rem;
-        letter-spacing: 2px;
-    }
-    
-    /* 卡片样式 */
-    .card {
-        background: white;
-        border-radius: 12px;
-        padding: 1.5rem;
-        margin: 1rem 0;
-        box-shadow: 0 2px 8px rgba(0,0,0,0.08);
-    }
-    
-    /* 按钮样式 */
-    .stButton>button {
-        background: #ecf0f1;
-        color: #2c3e50;
-        border: none;
-        border-radius: 8px;
-        padding: 0.75rem 1.5rem;
-        font-weight: 500;
-        transition: all 0.3s;
-        width: 100%;
-    }
-    
-    .stButton>button:hover {
-        background: #bdc3c7;
-        transform: translateY(-2px);
-    }
-    
-    /* 主操作按钮 */
-    .primary-btn {
-        background: #3498db !important;
-        color: white !important;
-        font-size: 1.1rem;
-        padding: 1rem 2rem;
-    }
-    
-    .primary-btn:hover {
-        background: #2980b9 !important;
-    }
-    
-    /* 结果展示 */
-    .result-box {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        padding: 2rem;
-        border-radius: 16px;
-        text-align: center;
-        font-size: 2rem;
-        font-weight: 600;
-        margin: 2rem 0;
-        animation: fadeIn 0.5s;
-    }
-    
-    @keyframes fadeIn {
-        from { opacity: 0; transform: scale(0.95); }
-        to { opacity: 1; transform: scale(1); }
-    }
-    
-    /* 健康提示 */
-    .health-tip {
-        background: #fff3cd;
-        border-left: 4px solid #ffc107;
-        padding: 1rem;
-        border-radius: 4px;
-        margin: 1rem 0;
-    }
+# 运行指标（注册是幂等的，rerun 不会重复创建）
+LOGINS = metrics.counter("honeyeat_logins_total", "登录次数", ("result",))
+RECOMMEND_SECONDS = metrics.histogram("honeyeat_recommendation_seconds", "智能推荐单次计算耗时")
+COLD_START_SECONDS = metrics.histogram("honeyeat_cold_start_seconds", "进程内第一次渲染完成的耗时（含模块导入和数据库初始化）")
+FIRST_PAINT_SECONDS = metrics.histogram("honeyeat_first_paint_seconds", "每个会话第一次渲染完成的耗时")
+# 依赖冰箱库存算出的结果，库存变化后清掉重算
+PANTRY_DERIVED_KEYS = ("pantry_recommendations", "meal_plan", "buy_next")
+# 会话超出内存上限时可以丢弃的 session_state 键（都能重新计算）
+SESSION_DROPPABLE_KEYS = PANTRY_DERIVED_KEYS
+SUGGESTION_COLUMNS = 5  # 冰箱添加框下最多显示的候选食材数
+metrics.REGISTRY.start_flusher()
 
-    /* 头像样式 */
-    .user-nav-container {
-        display: flex;
-        flex-direction: column;
-        align-items: center;
-        text-align: center;
-    }
-    .avatar-image {
-        width: 108px;
-        height: 108px;
-        border-radius: 50%;
-        object-fit: cover;
-        margin-bottom: 0.5rem;
-        display: block;
-        margin-left: auto;
-        margin-right: auto;
-    }
-    .user-nav-logout-btn {
-        width: 120px; /* 设置一个固定宽度或相对宽度 */
-        margin-top: 0.5rem;
-    }
-    .user-nav-name {
-        font-weight: bold;
-        text-align: center;
-    }
-    
-    /* 隐藏streamlit默认元素 */
-    #MainMenu {visibility: hidden;}
-    footer {visibility: hidden;}
-    
-    /* 移动端适配 */
-    @media (max-width: 768px) {
-        .main-title { font-size: 1.8rem; }
-        .result-box { font-size: 1.5rem; padding: 1.5rem; }
-    }
-</style>
-""", unsafe_allow_html=True)
+# 极简风格CSS：作为静态文件由 Streamlit 提供，浏览器缓存后每次 rerun 只需发送一个 <link> 标签
+st.markdown('<link rel="stylesheet" href="app/static/honeyeat.css">', unsafe_allow_html=True)
 
 # Session state 初始化
+# 食物、对决名单、配餐结果只保存 id / 名称等紧凑数据，展示时再从共享的食物库缓存补齐
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
 if 'current_user' not in st.session_state:
@@ -152,12 +61,14 @@ if 'pk_round' not in st.session_state:
     st.session_state.pk_round = []
 if 'lazy_level' not in st.session_state:
     st.session_state.lazy_level = 5
-if 'recommended_food' not in st.session_state:
-    st.session_state.recommended_food = None
+if 'recommended_food_id' not in st.session_state:
+    st.session_state.recommended_food_id = None
 if 'recommended_reason' not in st.session_state:
     st.session_state.recommended_reason = ""
 if 'recommended_time' not in st.session_state:
     st.session_state.recommended_time = ""
+if 'calorie_combo' not in st.session_state:
+    st.session_state.calorie_combo = None  # {'ids', 'calories', 'budget'}
 if 'show_logout_confirmation' not in st.session_state:
     st.session_state.show_logout_confirmation = False
 
@@ -177,6 +88,57 @@ def get_db_connection():
         
     return conn
 
+@st.cache_resource
+def get_guest_store():
+    """所有游客会话共用的内存库管理器"""
+    return GuestStore(DB_PATH)
+
+def get_user_connection():
+    """
+    当前会话读写用户数据所用的连接：
+    游客使用本会话独立的内存库，其他用户使用共享的数据库连接。
+    """
+    user = st.session_state.get('current_user') or {}
+    guest_session_id = st.session_state.get('guest_session_id')
+    if user.get('username') == GUEST_USER and guest_session_id:
+        get_db_connection()  # 确保正式库已初始化，内存库要以只读方式附加它
+        return get_guest_store().connection(guest_session_id)
+    return get_db_connection()
+
+@st.cache_resource
+def get_session_budget():
+    """所有会话共用的 session_state 内存记账"""
+    return SessionBudget()
+
+def end_guest_session():
+    """退出登录时释放游客的内存库"""
+    guest_session_id = st.session_state.pop('guest_session_id', None)
+    if guest_session_id:
+        get_guest_store().discard(guest_session_id)
+
+@st.cache_resource
+def warm_up():
+    """
+    预热：每个进程只执行一次。
+    在后台线程里打开数据库、跑迁移并加载食物库缓存，
+    登录页无需等待，用户登录时缓存已经就绪。
+    """
+    def prime():
+        try:
+            get_active_foods(get_db_connection())
+            import personalization  # 提前导入 NumPy，第一次推荐时不必再等
+            from similar_foods import refresh_index
+            refresh_index(get_db_connection())  # 建好“更多类似的”索引
+            import pinyin_index
+            pinyin_index.refresh_index(get_db_connection())  # 建好食物名称的拼音索引
+        except Exception as e:
+            print(f"Error warming up: {e}")
+
+    threading.Thread(target=prime, name="honeyeat-warm-up", daemon=True).start()
+    return {"cold_start_recorded": False}
+
+_warm_state = warm_up()
+
 # ============ 登录界面 ============
 def login_page():
     st.markdown('<h1 class="main-title">🍽️ HoneyEat</h1>', unsafe_allow_html=True)
@@ -197,6 +159,7 @@ def login_page():
                     conn = get_db_connection()
                     result = verify_user(conn, username, password)
                     if result["success"]:
+                        LOGINS.inc(result="success")
                         user = result["user"]
                         st.session_state.logged_in = True
                         st.session_state.current_user = user
@@ -204,14 +167,17 @@ def login_page():
                         time.sleep(0.5)
                         st.rerun()
                     else:
+                        LOGINS.inc(result="failure")
                         st.error(result["message"]) # 显示更详细的错误信息
                 else:
                     st.warning("请输入用户名和密码")
         
         with col_b:
             if st.button("游客模式", use_container_width=True, key="guest_btn"):
+                LOGINS.inc(result="guest")
                 st.session_state.logged_in = True
-                st.session_state.current_user = {'username': 'guest', 'name': '游客'}
+                st.session_state.current_user = {'username': GUEST_USER, 'name': '游客'}
+                st.session_state.guest_session_id = uuid.uuid4().hex
                 st.rerun()
 
         st.write("") # 增加一些间距
@@ -257,7 +223,7 @@ def main_app():
             st.markdown('<div class="user-nav-container">', unsafe_allow_html=True)
             
             user_id = st.session_state.current_user['username']
-            if user_id != 'guest':
+            if user_id != GUEST_USER:
                 conn = get_db_connection()
                 avatar = get_user_avatar(conn, user_id)
                 if avatar:
@@ -291,6 +257,7 @@ def main_app():
                 btn_col1, btn_col2 = st.columns(2)
                 with btn_col1:
                     if st.button("确认", key="confirm_logout_dialog", use_container_width=True, type="primary"):
+                        end_guest_session()
                         st.session_state.logged_in = False
                         st.session_state.current_user = None
                         st.session_state.show_logout_confirmation = False
@@ -304,6 +271,8 @@ def main_app():
 
     # 健康打卡栏
     show_health_checkin()
+    # 健康提醒（与打卡无关，放在片段外，打卡时不必重新统计）
+    show_health_reminder()
     
     # 主功能标签页
     tabs = st.tabs([
@@ -334,14 +303,16 @@ def main_app():
         settings_page()
 
 # ============ 健康打卡 ============
+@st.fragment
+@metrics.track_page("health_checkin")
 def show_health_checkin():
-    """首页健康打卡"""
+    """首页健康打卡（片段：勾选打卡只重跑这一栏）"""
     col1, col2, col3 = st.columns([2, 1, 1])
     
     with col1:
         st.write("### 今日健康打卡")
     
-    conn = get_db_connection()
+    conn = get_user_connection()
     cursor = conn.cursor()
     today = datetime.now().date()
     user_id = st.session_state.current_user['username']
@@ -375,13 +346,10 @@ def show_health_checkin():
                 VALUES (?, ?, ?, ?)
             """, (today.isoformat(), user_id, int(water), int(fruit)))
         conn.commit() # 仅在数据变化时提交
-    
-    # 健康提醒
-    show_health_reminder()
 
 def show_health_reminder():
     """显示健康提醒"""
-    conn = get_db_connection()
+    conn = get_user_connection()
     cursor = conn.cursor()
     user_id = st.session_state.current_user['username']
     
@@ -405,6 +373,7 @@ def show_health_reminder():
         """, unsafe_allow_html=True)
 
 # ============ 智能推荐 ============
+@metrics.track_page("smart_recommendation")
 def smart_recommendation_page():
     st.write("### 🎲 智能推荐")
     st.caption("像朋友一样聊聊天，帮你找到最适合今天的美食")
@@ -462,17 +431,29 @@ def smart_recommendation_page():
         )
     
     with col6:
-        exclude_recent = st.checkbox("排除最近3天吃过的", value=True)
+        exclude_recent = st.checkbox("少推荐最近吃过的", value=True, help="最近吃得越多、越近的菜扣分越多，但不会完全排除")
     
-    if st.button("🤖 帮我推荐", key="smart_rec", use_container_width=True):
-        with st.spinner("正在分析你的需求..."):
-            result = get_smart_recommendation_v2(
-                time_of_day, mood, appetite, flavor_prefer, time_constraint, exclude_recent
-            )
+    must_have = st.multiselect("🏷️ 一定要满足（可选）", list(FOOD_ATTRIBUTES), key="must_have_attrs")
+    
+    col_rec, col_quick = st.columns([2, 1])
+    with col_rec:
+        smart_clicked = st.button("🤖 帮我推荐", key="smart_rec", use_container_width=True)
+    with col_quick:
+        # 预先算好的该时间段推荐，不看心情等问答，点了立即出结果
+        quick_clicked = st.button("⚡ 直接来一个", key="quick_rec", use_container_width=True)
+    
+    if smart_clicked or quick_clicked:
+        with st.spinner("正在分析你的需求..."), RECOMMEND_SECONDS.time():
+            if quick_clicked:
+                result = get_quick_recommendation(time_of_day)
+            else:
+                result = get_smart_recommendation_v2(
+                    time_of_day, mood, appetite, flavor_prefer, time_constraint, exclude_recent, must_have
+                )
             
             if result:
                 # 将结果存入 session_state
-                st.session_state.recommended_food = result['food']
+                st.session_state.recommended_food_id = result['food']['id']
                 st.session_state.recommended_reason = result['reason']
                 st.session_state.recommended_time = time_of_day
                 st.rerun()
@@ -480,180 +461,65 @@ def smart_recommendation_page():
                 st.warning("没有找到合适的食物，试试放宽条件？")
     
     # 显示推荐结果
-    if 'recommended_food' in st.session_state and st.session_state.recommended_food:
+    food_id = st.session_state.recommended_food_id
+    recommended = get_foods_by_ids(get_db_connection(), [food_id]) if food_id else []
+    if recommended:
         st.divider()
         st.success(st.session_state.recommended_reason)
-        show_food_result_v2(st.session_state.recommended_food, st.session_state.recommended_time)
+        show_food_result_v2(recommended[0], st.session_state.recommended_time)
+    
+    calorie_combo_section(time_of_day)
+    trending_section(time_of_day)
 
-def get_smart_recommendation_v2(time_of_day, mood, appetite, flavor_prefer, time_constraint, exclude_recent=False):
+def get_smart_recommendation_v2(time_of_day, mood, appetite, flavor_prefer, time_constraint, exclude_recent=False, must_have=()):
     """基于多维度问答的智能推荐算法 v3 (逻辑增强版)"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    conn = get_user_connection()
     user_id = st.session_state.current_user['username']
-    user_prefs = get_user_preferences(conn, user_id)
-    
-    # 1. 构建基础查询，排除最近吃过的
-    query = "SELECT * FROM foods WHERE active = 1"
-    params = []
-    if exclude_recent:
-        three_days_ago = (datetime.now() - timedelta(days=3)).date()
-        query += " AND id NOT IN (SELECT food_id FROM eat_history WHERE user_id = ? AND date >= ?)"
-        params.extend([user_id, three_days_ago.isoformat()])
     
-    cursor.execute(query, params)
-    foods = [dict(row) for row in cursor.fetchall()]
-    
-    if not foods:
-        return None
-    
-    # 2. 获取用户偏好和黑名单
-    blacklist = user_prefs.get('blacklist', [])
-    avoid_categories = user_prefs.get('avoid_category', [])
-    favorite_categories = user_prefs.get('favorite_category', [])
-    health_mode = user_prefs.get('health_mode', '普通模式')
-    
-    # 3. 智能评分系统
-    scored_foods = []
-    for food in foods:
-        # 黑名单和分类过滤
-        if food['name'] in blacklist or food['category'] in avoid_categories:
-            continue
-        
-        score = 50  # 基础分
-        reasons = []
-        food_name = food['name']
-        food_cat = food['category']
-        food_tag = food.get('health_tag', '')
-
-        # --- 组合规则 (高优先级) ---
-        if time_of_day == "早餐时间" and time_constraint == "很赶时间":
-            if food_cat in ['早餐', '速食', '轻食'] or any(k in food_name for k in ['包子', '面包', '三明治', '手抓饼']):
-                score += 50
-                reasons.append("为你找到了方便快捷的早餐")
-        
-        # --- 维度1: 时间段 (time_of_day) ---
-        if time_of_day == "早餐时间":
-            if food_cat in ['早餐', '速食'] or any(k in food_name for k in ['粥', '蛋', '包子', '面包']):
-                score += 35
-                reasons.append("这个当早餐很不错")
-            elif food_cat in ['大餐', '火锅', '烧烤', '中餐']:
-                score -= 50 # 大幅降低不合适早餐的权重
-        elif time_of_day == "午餐时间":
-            if food_cat in ['中餐', '家常菜', '快餐'] or any(k in food_name for k in ['饭', '面']):
-                score += 25
-                reasons.append("午餐吃这个能补充能量")
-        elif time_of_day == "下午茶":
-            if food_cat in ['甜品', '零食饮料', '轻食', '小吃']:
-                score += 40
-                reasons.append("下午茶时间，享受片刻悠闲")
-            elif food_cat in ['大餐', '家常菜']:
-                score -= 20
-        elif time_of_day == "晚餐时间":
-            if food_cat in ['中餐', '西餐', '日料', '大餐', '家常菜', '烧烤']:
-                score += 25
-                reasons.append("晚餐值得吃顿好的")
-        elif time_of_day == "夜宵时间":
-            if food_cat in ['烧烤', '速食', '小吃', '零食饮料'] or '面' in food_name:
-                score += 40
-                reasons.append("深夜的美味最治愈")
-            elif food_cat in ['大餐', '西餐']:
-                score -= 20
-
-        # --- 维度2: 心情 (mood) ---
-        if mood == "开心愉悦":
-            if food_cat in ['甜品', '大餐', '零食饮料']:
-                score += 20
-                reasons.append("开心就该吃点好的")
-        elif mood == "有点累":
-            if food_tag == 'Healthy' or '粥' in food_name or '汤' in food_name:
-                score += 25
-                reasons.append("有点累了，吃点健康的恢复一下")
-        elif mood == "压力山大":
-            if food_tag == 'CheatMeal' or food_cat in ['大餐', '快餐', '烧烤', '甜品']:
-                score += 30
-                reasons.append("用美食来释放所有压力吧")
-        elif mood == "平静放松":
-            if food_cat in ['家常菜', '轻食', '日料'] or food_tag == 'Light':
-                score += 20
-                reasons.append("平静的心情适合品尝细腻的味道")
-
-        # --- 维度3: 食欲 (appetite) ---
-        if appetite == "特别饿":
-            if food_tag == 'CheatMeal' or food_cat in ['快餐', '大餐', '烧烤'] or any(k in food_name for k in ['饭', '面', '汉堡']):
-                score += 30
-                reasons.append("饿的时候，就该吃点管饱的")
-        elif appetite == "不太饿":
-            if food_cat in ['轻食', '甜品', '零食饮料', '小吃'] or food_tag == 'Light':
-                score += 25
-                reasons.append("不太饿？来点小吃或轻食刚刚好")
-        elif appetite == "想吃点特别的":
-            if food_cat in ['日料', '西餐', '大餐'] or food.get('cost_level') == '$$$':
-                score += 30
-                reasons.append("满足你对特别美食的渴望")
-
-        # --- 维度4: 口味 (flavor_prefer) ---
-        if flavor_prefer == "清淡健康":
-            if food_tag in ['Healthy', 'Light']:
-                score += 30
-            elif food_tag in ['Spicy', 'CheatMeal'] or food_cat == '烧烤':
-                score -= 25
-        elif flavor_prefer == "重口味" or flavor_prefer == "香辣刺激":
-            if food_tag == 'Spicy' or any(k in food_name for k in ['辣', '麻', '香锅', '火锅']):
-                score += 40
-                reasons.append("够味才过瘾")
-        elif flavor_prefer == "酸甜口":
-            if food_tag == 'Sweet' or any(k in food_name for k in ['糖醋', '咕咾', '番茄']):
-                score += 25
-                reasons.append("酸酸甜甜就是我")
-
-        # --- 维度5: 时间约束 (time_constraint) ---
-        if time_constraint == "很赶时间":
-            if food_cat in ['快餐', '速食', '小吃', '轻食', '零食饮料']:
-                score += 35
-                reasons.append("时间紧，吃这个最快")
-        elif time_constraint == "时间充裕":
-            if food_cat in ['家常菜', '大餐', '西餐', '日料']:
-                score += 15
-                reasons.append("时间充裕，值得慢慢享受")
-
-        # --- 维度6: 用户个人偏好 (user_prefs) ---
-        if not user_prefs.get('spicy') and food_tag == 'Spicy':
-            score -= 20
-        if user_prefs.get('sweet') and food_tag == 'Sweet':
-            score += 15
-        if food_cat in favorite_categories:
-            score += 20
-            reasons.append(f"还是你最爱的{food_cat}")
-        
-        # --- 维度7: 健康模式 (health_mode) ---
-        if health_mode == "健康模式":
-            if food_tag == 'Healthy':
-                score += 25
-            elif food_tag == 'CheatMeal':
-                score -= 20
-        elif health_mode == "放纵模式":
-            if food_tag == 'CheatMeal':
-                score += 20
-                reasons.append("今天就要放纵一下")
+    def compute():
+        from personalization import personal_bonus
         
-        scored_foods.append({'food': food, 'score': score, 'reasons': list(set(reasons))})
+        user_prefs = get_user_preferences(conn, user_id)
+        # 1. 取候选：黑名单、饮食限制都在 SQL 中排除
+        foods = candidate_foods(conn, user_id, user_prefs, must_have)
+        # 2-3. 结合问答、用户偏好、最近吃过的频次和从评分中学到的口味打分，
+        #      取得分最高的一批，再兼顾分类多样性挑出 5 个
+        return diversify(rank_foods(
+            foods, user_prefs, time_of_day,
+            mood=mood, appetite=appetite, flavor_prefer=flavor_prefer, time_constraint=time_constraint,
+            frequency=get_eat_frequency(conn, user_id), avoid_recent=exclude_recent,
+            personal=personal_bonus(conn, user_id, foods)
+        ))
     
-    if not scored_foods:
-        return None
+    # 同样的回答再次点击时直接复用上次的候选列表
+    inputs = ("smart", time_of_day, mood, appetite, flavor_prefer, time_constraint, exclude_recent, tuple(sorted(must_have)))
+    entry = get_ranked_entry(conn, user_id, inputs, compute)
     
     # 4. 选择得分最高的候选者（加入随机性）
-    scored_foods.sort(key=lambda x: x['score'], reverse=True)
-    top_candidates = scored_foods[:5] # 扩大候选范围
-    
-    if not top_candidates:
-        return None
+    return describe_recommendation(entry.sample())
 
-    # 从最高分的几个候选者中，根据分数加权随机选择一个，避免每次都推荐同一个
-    scores = [c['score'] for c in top_candidates]
-    # 简单处理，避免分数为0或负数
-    weights = [max(s, 1) for s in scores]
+def get_quick_recommendation(time_of_day):
+    """不用回答问题：直接从该时间段预先算好的推荐里挑一个"""
+    conn = get_user_connection()
+    user_id = st.session_state.current_user['username']
     
-    selected = random.choices(top_candidates, weights=weights, k=1)[0]
+    def compute():
+        user_prefs = get_user_preferences(conn, user_id)
+        shortlist = diversify([
+            {'food': food, 'score': score, 'reasons': None}
+            for food, score in get_slot_recommendations(conn, user_id, time_of_day)
+        ])
+        for c in shortlist:
+            c['reasons'] = score_food(c['food'], user_prefs, time_of_day)[1]
+        return shortlist
+    
+    entry = get_ranked_entry(conn, user_id, ("quick", time_of_day), compute)
+    return describe_recommendation(entry.sample())
+
+def describe_recommendation(selected):
+    """为选中的候选者生成推荐理由"""
+    if selected is None:
+        return None
     
     reason_text = "这个应该不错"
     if selected['reasons']:
@@ -671,23 +537,131 @@ def get_smart_recommendation_v2(time_of_day, mood, appetite, flavor_prefer, time
         'score': selected['score']
     }
 
+TRENDING_SHOW = 5  # “大家最近都在吃”展示的菜数
+
+def _pick_trending(food_id, time_of_day):
+    st.session_state.recommended_food_id = food_id
+    st.session_state.recommended_reason = "👀 最近大家都在吃它，跟一波？"
+    st.session_state.recommended_time = time_of_day
+
+def trending_section(time_of_day):
+    """“大家最近都在吃”：全站最近几天吃得最多的菜（只读热门计数器，不扫描饮食历史）"""
+    conn = get_db_connection()
+    user_id = st.session_state.current_user['username']
+    blacklisted = {item['food_id'] for item in get_blacklist(get_user_connection(), user_id)}
+    trending = []
+    for food_id, count in get_trending_foods(conn, TRENDING_SHOW + len(blacklisted)):
+        foods = get_foods_by_ids(conn, [food_id])
+        if foods and foods[0]['active'] and food_id not in blacklisted:
+            trending.append((foods[0], count))
+    if not trending:
+        return
+    
+    st.divider()
+    st.write("#### 👀 大家最近都在吃")
+    st.caption(f"最近 {TRENDING_WINDOW_DAYS} 天大家记录得最多的菜，点一下就推荐给你")
+    cols = st.columns(TRENDING_SHOW)
+    for col, (food, count) in zip(cols, trending[:TRENDING_SHOW]):
+        with col:
+            st.button(food['name'], key=f"trending_{food['id']}", use_container_width=True,
+                      help=f"最近被吃了约 {count} 次",
+                      on_click=_pick_trending, args=(food['id'], time_of_day))
+
+COMBO_BUDGETS = {"经济（合计 $$$ 以内）": 3, "适中（合计 $$$$$ 以内）": 5, "不差钱": 9}
+
+def calorie_combo_section(time_of_day):
+    """按今天剩余的热量预算配一餐：一个主菜 + 至多两个配菜"""
+    conn = get_user_connection()
+    user_id = st.session_state.current_user['username']
+    goal = get_user_preferences(conn, user_id).get('daily_calorie_goal', 2000)
+    eaten = get_calories_eaten(conn, user_id)
+    remaining = goal - eaten
+    
+    st.divider()
+    st.write("#### 🔥 按剩余热量配一餐")
+    st.caption(f"今天已记录 {eaten} 千卡，目标 {goal} 千卡（可在设置里修改）")
+    if remaining < 100:
+        st.info("今天的热量预算已经用完啦，明天再来吧~")
+        return
+    
+    col_cost, col_btn = st.columns([2, 1])
+    with col_cost:
+        cost_label = st.selectbox("💰 这一餐的花费", list(COMBO_BUDGETS), index=1, key="combo_cost")
+    with col_btn:
+        st.write("")
+        st.write("")
+        clicked = st.button(f"🔥 配满剩下的 {remaining} 千卡", key="calorie_combo_btn", use_container_width=True)
+    
+    if clicked:
+        with RECOMMEND_SECONDS.time():
+            combo = get_calorie_combo(time_of_day, remaining, COMBO_BUDGETS[cost_label])
+        if combo is None:
+            st.session_state.calorie_combo = None
+            st.warning("剩下的热量不够配一餐，试试提高花费上限？")
+        else:
+            st.session_state.calorie_combo = {
+                'ids': [c['food']['id'] for c in combo['items']],
+                'calories': combo['calories'],
+                'budget': remaining,
+            }
+    
+    combo = st.session_state.calorie_combo
+    if combo:
+        foods = get_foods_by_ids(get_db_connection(), combo['ids'])
+        for i, food in enumerate(foods):
+            role = "主菜" if i == 0 else "配菜"
+            macros = " · ".join(
+                f"{label} {food[key]:g} 克" for label, key in (("蛋白质", 'protein'), ("脂肪", 'fat'), ("碳水", 'carbs'))
+                if food.get(key) is not None
+            )
+            st.write(f"**{role}：{food['name']}**　{food['calories']} 千卡　{food['cost_level']}")
+            if macros:
+                st.caption(macros)
+        st.progress(min(combo['calories'] / combo['budget'], 1.0),
+                    text=f"合计 {combo['calories']} / {combo['budget']} 千卡")
+
+def get_calorie_combo(time_of_day, budget, max_cost):
+    """给全部候选打分（不截断为 top-N），再解有界背包挑出主菜 + 配菜"""
+    from personalization import personal_bonus
+    
+    conn = get_user_connection()
+    user_id = st.session_state.current_user['username']
+    user_prefs = get_user_preferences(conn, user_id)
+    foods = candidate_foods(conn, user_id, user_prefs)
+    ranked = rank_foods(
+        foods, user_prefs, time_of_day, k=len(foods),
+        frequency=get_eat_frequency(conn, user_id), avoid_recent=True,
+        personal=personal_bonus(conn, user_id, foods)
+    )
+    return fill_calorie_budget(ranked, budget, max_cost)
+
 # ============ 美食大乱斗 ============
+def _pk_start():
+    # 随机选8个食物进行PK
+    catalog = get_active_foods(get_db_connection())
+    st.session_state.pk_round = [f['id'] for f in random.sample(catalog, min(8, len(catalog)))]
+
+def _pk_pick(winner_id, loser_id):
+    rest = [i for i in st.session_state.pk_round if i not in (winner_id, loser_id)]
+    st.session_state.pk_round = [winner_id] + rest
+
+def _pk_reset():
+    st.session_state.pk_round = []
+
+@st.fragment
+@metrics.track_page("food_pk")
 def food_pk_page():
+    """美食大乱斗（片段：每次选择只重跑对决区域，状态变更放在按钮回调里）"""
     st.write("### ⚔️ 美食大乱斗")
     st.caption("两两对决，选出你最想吃的！")
     
-    if not st.session_state.pk_round:
-        if st.button("🎮 开始PK", use_container_width=True):
-            # 随机选8个食物进行PK
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM foods WHERE active = 1 ORDER BY RANDOM() LIMIT 8")
-            foods = [dict(row) for row in cursor.fetchall()]
-            
-            st.session_state.pk_round = foods
-            st.rerun()
+    # 对决名单只存 id；期间被删除/停用的食物直接出局（食物库缓存含已停用的，按 active 过滤）
+    foods = [
+        food for food in get_foods_by_ids(get_db_connection(), st.session_state.pk_round or []) if food['active']
+    ]
+    if not foods:
+        st.button("🎮 开始PK", use_container_width=True, on_click=_pk_start)
     else:
-        foods = st.session_state.pk_round
         
         if len(foods) == 1:
             # 决出冠军
@@ -701,9 +675,7 @@ def food_pk_page():
             
             show_food_result(winner)
             
-            if st.button("再来一轮"):
-                st.session_state.pk_round = []
-                st.rerun()
+            st.button("再来一轮", on_click=_pk_reset)
         else:
             st.write(f"#### 第 {9 - len(foods)} 轮对决")
             
@@ -715,18 +687,15 @@ def food_pk_page():
             with col1:
                 st.write(f"### {food1['name']}")
                 st.caption(f"{food1['category']} | {food1['cost_level']}")
-                if st.button(f"选择 {food1['name']}", key="pk1", use_container_width=True):
-                    st.session_state.pk_round = [food1] + foods[2:]
-                    st.rerun()
+                st.button(f"选择 {food1['name']}", key="pk1", use_container_width=True, on_click=_pk_pick, args=(food1['id'], food2['id']))
             
             with col2:
                 st.write(f"### {food2['name']}")
                 st.caption(f"{food2['category']} | {food2['cost_level']}")
-                if st.button(f"选择 {food2['name']}", key="pk2", use_container_width=True):
-                    st.session_state.pk_round = [food2] + foods[2:]
-                    st.rerun()
+                st.button(f"选择 {food2['name']}", key="pk2", use_container_width=True, on_click=_pk_pick, args=(food2['id'], food1['id']))
 
 # ============ 做饭vs外卖 ============
+@metrics.track_page("cook_or_order")
 def cook_or_order_page():
     st.write("### ⚖️ 做饭 vs 外卖")
     st.caption("根据你的懒惰值推荐")
@@ -746,7 +715,7 @@ def cook_or_order_page():
         st.info("冰箱里有这些食材可以做：")
         user_id = st.session_state.current_user['username']
         
-        conn = get_db_connection()
+        conn = get_user_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM pantry WHERE user_id = ? AND quantity > 0 LIMIT 5", (user_id,))
         items = cursor.fetchall()
@@ -760,10 +729,7 @@ def cook_or_order_page():
     elif lazy_level <= 6:
         st.write("#### 🚶 推荐：简单速食")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM foods WHERE category = '速食' AND active = 1")
-        foods = [dict(row) for row in cursor.fetchall()]
+        foods = [f for f in get_active_foods(get_db_connection()) if f['category'] == '速食']
         
         if foods:
             food = random.choice(foods)
@@ -773,10 +739,7 @@ def cook_or_order_page():
     else:
         st.write("#### 🛋️ 推荐：直接外卖")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM foods WHERE category IN ('快餐', '大餐') AND active = 1")
-        foods = [dict(row) for row in cursor.fetchall()]
+        foods = [f for f in get_active_foods(get_db_connection()) if f['category'] in ('快餐', '大餐')]
         
         if foods:
             food = random.choice(foods)
@@ -785,125 +748,221 @@ def cook_or_order_page():
 # ============ 基于冰箱食材推荐 ============
 def recommend_from_pantry():
     """根据冰箱里的食材推荐菜谱 - v2.0 智能匹配版"""
-    # 扩充菜谱库，增加更多可能性
-    # v2.1: 大幅扩充菜谱库
-    recipe_book = {
-        # --- 经典家常 ---
-        "番茄炒蛋": ["番茄", "鸡蛋"],
-        "青椒肉丝": ["青椒", "猪肉"],
-        "鱼香肉丝": ["猪肉", "木耳", "胡萝卜"],
-        "红烧肉": ["五花肉", "姜", "葱"],
-        "糖醋排骨": ["排骨"],
-        "回锅肉": ["五花肉", "青椒"],
-        "麻婆豆腐": ["豆腐", "牛肉"],
-        "宫保鸡丁": ["鸡丁", "花生", "黄瓜"],
-        "可乐鸡翅": ["鸡翅", "可乐"],
-        "大盘鸡": ["鸡肉", "土豆", "青椒"],
-        "水煮牛肉": ["牛肉", "豆芽"],
-        "西红柿牛腩": ["牛腩", "番茄", "洋葱"],
-        "清蒸鱼": ["鱼", "葱", "姜"],
-        "红烧茄子": ["茄子", "猪肉"],
-        "地三鲜": ["土豆", "茄子", "青椒"],
-        "干煸豆角": ["四季豆", "猪肉"],
-        "手撕包菜": ["包菜", "蒜"],
-        "酸辣土豆丝": ["土豆"],
-        # --- 健康&素菜&蛋类 ---
-        "清炒西兰花": ["西兰花"],
-        "蒜蓉西兰花": ["西兰花", "蒜"],
-        "蚝油生菜": ["生菜", "蒜"],
-        "凉拌黄瓜": ["黄瓜", "蒜"],
-        "凉拌木耳": ["木耳", "蒜"],
-        "黄瓜炒鸡蛋": ["黄瓜", "鸡蛋"],
-        "洋葱炒蛋": ["洋葱", "鸡蛋"],
-        "韭菜炒蛋": ["韭菜", "鸡蛋"],
-        "秋葵炒蛋": ["秋葵", "鸡蛋"],
-        "蒸鸡蛋羹": ["鸡蛋"],
-        "皮蛋豆腐": ["皮蛋", "豆腐"],
-        # --- 快手主食 (面食) ---
-        "葱油拌面": ["面条", "葱"],
-        "西红柿鸡蛋面": ["面条", "番茄", "鸡蛋"],
-        "炸酱面": ["面条", "猪肉", "黄瓜"],
-        "阳春面": ["面条", "葱"],
-        "雪菜肉丝面": ["面条", "猪肉", "雪菜"],
-        # --- 汤羹 ---
-        "排骨汤": ["排骨", "玉米", "胡萝卜"],
-        "冬瓜排骨汤": ["冬瓜", "排骨"],
-        "紫菜蛋花汤": ["紫菜", "鸡蛋"],
-        # --- 方便速成 ---
-        "香煎鸡胸肉": ["鸡胸肉"],
-        "白灼虾": ["虾"],
-        "火腿炒蛋": ["火腿", "鸡蛋"],
-        "咖喱鸡肉": ["鸡肉", "土豆", "胡萝卜", "洋葱"],
-    }
+    conn = get_user_connection()
+    user_id = st.session_state.current_user['username']
+    # 内置菜谱与用户自定义菜谱合并，用户菜谱优先级更高
+    recipe_book = get_recipe_book(conn, user_id)
+    # 查询冰箱食材时必须指定当前用户
+    available_ingredients = get_pantry_ingredients(conn, user_id)
+    if not available_ingredients:
+        return []
+    # 用到快过期食材的菜排在前面
+    urgency = use_first_urgency(get_expiring_items(conn, user_id))
+    return match_recipes(recipe_book, available_ingredients, urgency)
+
+def _meal_time_now():
+    """按当前时间推断是哪一餐（下午茶计入午餐）"""
+    hour = datetime.now().hour
+    if 5 <= hour < 10:
+        return "早餐"
+    if 10 <= hour < 17:
+        return "午餐"
+    if 17 <= hour < 21:
+        return "晚餐"
+    return "夜宵"
+
+def clear_pantry_derived():
+    """库存变了：清掉按旧库存算出的配餐、菜单和“下一步买什么”"""
+    for key in PANTRY_DERIVED_KEYS:
+        st.session_state.pop(key, None)
 
-    # 从数据库加载用户自定义菜谱
+def _cook_recipe(name):
+    """“我做了这道菜”按钮回调：一次事务扣掉用到的食材并记入饮食日历，再清掉依赖冰箱库存的配餐结果"""
+    conn = get_user_connection()
     user_id = st.session_state.current_user['username']
-    conn_user_recipe = get_db_connection() # This is already cached, no need for a separate variable
-    cursor_user_recipe = conn_user_recipe.cursor()
-    cursor_user_recipe.execute("SELECT recipe_name, ingredients FROM user_recipes WHERE user_id = ?", (user_id,))
-    user_recipes = cursor_user_recipe.fetchall()
+    ingredients = get_recipe_book(conn, user_id).get(name, [])
+    # 食物库里有同名的菜时按这道菜记录（计入频次和推荐）
+    food = next((f for f in get_active_foods(get_db_connection()) if f['name'] == name), None)
+    meal_time = _meal_time_now()
+    cook_recipe(conn, user_id, name, ingredients, meal_time, food)
+    clear_pantry_derived()
+    st.toast(f"已用掉 {'、'.join(ingredients)}，“{name}” 已记入饮食日历（{meal_time}）")
 
-    for rec in user_recipes:
-        try:
-            # 将内置菜谱与用户菜谱合并，用户菜谱优先级更高
-            recipe_book[rec['recipe_name']] = json.loads(rec['ingredients'])
-        except json.JSONDecodeError:
-            continue # 如果JSON格式错误则跳过
+def buy_next_section():
+    """冰箱 -> 智能配餐：再买哪几样食材能多做出最多的菜"""
+    st.write("---")
+    st.write("#### 🛒 下一步买什么")
+    st.caption("算算再买哪几样食材，能让最多的菜（含你的自定义菜谱）变成万事俱备")
+    
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        k = st.number_input("最多买几样", min_value=1, max_value=10, value=3, key="buy_next_k")
+    with col2:
+        st.write("")
+        st.write("")
+        clicked = st.button("🧮 帮我算算", key="buy_next_btn", use_container_width=True)
+    
+    user_id = st.session_state.current_user['username']
+    if clicked:
+        conn = get_user_connection()
+        st.session_state.buy_next = what_to_buy(
+            get_recipe_book(conn, user_id), get_pantry_ingredients(conn, user_id), int(k)
+        )
+    
+    result = st.session_state.get('buy_next')
+    if not result:
+        return
+    if not result['unlocks']:
+        st.info("买这么几样还凑不齐任何一道菜，试试多买几样？")
+        return
+    buy_str = "、".join(result['buy'])
+    st.success(f"买 **{buy_str}**，就能多做 {len(result['unlocks'])} 道菜：{'、'.join(result['unlocks'])}")
+    if st.button("🛒 全部加入待买", key="buy_next_add", use_container_width=True):
+        conn = get_user_connection()
+        cursor = conn.cursor()
+        for item in result['buy']:
+            cursor.execute("INSERT OR IGNORE INTO shopping_list (item_name, user_id) VALUES (?, ?)", (item, user_id))
+        conn.commit()
+        st.session_state.buy_next = None
+        st.toast(f"“{buy_str}” 已加入待买清单！")
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    # 修复：查询冰箱食材时必须指定当前用户
-    cursor.execute("SELECT food_name FROM pantry WHERE quantity > 0 AND user_id = ?", (user_id,))
-    # 将食材名称转换为集合以便快速查找
-    available_ingredients = {item['food_name'] for item in cursor.fetchall()}
+# ============ 一周菜单 ============
+WEEK_BUDGETS = {"经济（一周合计 28 个 $）": 28, "适中（一周合计 42 个 $）": 42, "不限": None}
+WEEKDAYS = "一二三四五六日"
 
-    if not available_ingredients:
-        return []
+def meal_plan_tab():
+    """冰箱 -> 一周菜单：排出 7 天三餐，确认后保存菜单并把缺的食材一次性加入待买清单"""
+    from meal_planner import PLAN_MEALS, plan_week
+    
+    st.write("#### 一周菜单")
+    st.caption("按你的口味、热量目标和预算排好接下来 7 天的三餐，优先用冰箱里现有的食材")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        budget_label = st.selectbox("💰 一周预算", list(WEEK_BUDGETS), index=1, key="plan_budget")
+    with col2:
+        repeat_window = st.slider("🔁 同一道菜至少隔几天", 1, 7, 3, key="plan_repeat_window")
+    with col3:
+        st.write("")
+        prefer_pantry = st.checkbox("优先用冰箱里的食材", value=True, key="plan_prefer_pantry")
+    
+    user_id = st.session_state.current_user['username']
+    if st.button("🗓️ 生成一周菜单", key="plan_week_btn", use_container_width=True):
+        with st.spinner("正在排菜单..."), RECOMMEND_SECONDS.time():
+            plan = plan_week(
+                get_user_connection(), user_id, weekly_budget=WEEK_BUDGETS[budget_label],
+                repeat_window=repeat_window, prefer_pantry=prefer_pantry, seed=random.randrange(1 << 30)
+            )
+        # 只保存 id，展示时再从食物库缓存补齐
+        st.session_state.meal_plan = {
+            'days': [
+                (day.isoformat(), [food['id'] for food in items] if items else None) for day, items in plan['days']
+            ],
+            'shopping': plan['shopping'],
+            'cost': plan['cost'],
+        }
+    
+    meals = [meal for meal, _ in PLAN_MEALS]
+    plan = st.session_state.get('meal_plan')
+    if not plan:
+        saved_meal_plan(user_id, meals)
+        return
+    
+    meal_plan_table(plan['days'], meals)
+    
+    unplanned = sum(1 for _, ids in plan['days'] if not ids)
+    if unplanned:
+        st.warning(f"有 {unplanned} 天在当前条件下排不出来，试试放宽预算或缩短不重复的天数。")
+    st.caption(f"一周价位合计 {'$' * plan['cost']}（{plan['cost']} 个 $）")
+    
+    shopping = plan['shopping']
+    if shopping:
+        st.info("需要采购：" + "，".join(f"{item} ×{n}" for item, n in sorted(shopping.items())))
+    else:
+        st.success("冰箱里的食材够做菜单上的菜，不用额外采购！")
+    
+    st.button("💾 保存菜单并加入待买清单", key="save_meal_plan_btn", use_container_width=True,
+              on_click=_save_meal_plan, args=(meals,))
 
-    scored_dishes = []
-    for dish, required in recipe_book.items():
-        required_set = set(required)
-        have_set = available_ingredients.intersection(required_set)
-        missing_set = required_set - have_set
-        
-        # 计算匹配度
-        match_score = len(have_set) / len(required_set)
-        
-        # 只要拥有至少一个核心食材，就加入推荐列表
-        if match_score > 0:
-            scored_dishes.append({
-                'name': dish,
-                'score': match_score,
-                'have': list(have_set),
-                'missing': list(missing_set)
+def _save_meal_plan(meals):
+    """保存按钮回调：在页面重跑前写库，重跑时直接展示已保存的菜单"""
+    plan = st.session_state.get('meal_plan')
+    if not plan:
+        return
+    entries = [
+        (datetime.fromisoformat(day).date(), meal, food_id)
+        for day, ids in plan['days'] if ids
+        for meal, food_id in zip(meals, ids)
+    ]
+    save_meal_plan(get_user_connection(), st.session_state.current_user['username'], entries, plan['shopping'])
+    st.session_state.meal_plan = None
+    st.toast("菜单已保存，缺的食材已加入待买清单！")
+
+def meal_plan_table(days, meals):
+    """菜单表格：days 为 [(日期字符串, [各餐的食物id] 或 None)]，没排的餐显示 —"""
+    by_id = {food['id']: food for food in get_foods_by_ids(
+        get_db_connection(), [food_id for _, ids in days if ids for food_id in ids if food_id is not None]
+    )}
+    rows = []
+    for day, ids in days:
+        row = {"日期": f"{day[5:]} 周{WEEKDAYS[datetime.fromisoformat(day).weekday()]}"}
+        if ids:
+            foods = [by_id.get(food_id) for food_id in ids]
+            row.update({
+                meal: "—" if food_id is None else food['name'] if food else "（已删除）"
+                for meal, food_id, food in zip(meals, ids, foods)
             })
+            row["热量"] = sum(food['calories'] or 0 for food in foods if food)
+        else:
+            row.update({meal: "—" for meal in meals})
+        rows.append(row)
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+def saved_meal_plan(user_id, meals):
+    """没有新生成的菜单时，展示从今天起已保存的菜单"""
+    from meal_planner import PLAN_DAYS
     
-    # 按匹配度从高到低排序
-    scored_dishes.sort(key=lambda x: x['score'], reverse=True)
-    
-    return scored_dishes
+    today = datetime.now().date()
+    saved = get_meal_plan(get_user_connection(), user_id, today, PLAN_DAYS)
+    if not saved:
+        return
+    days = []
+    for d in range(PLAN_DAYS):
+        day = (today + timedelta(days=d)).isoformat()
+        ids = [saved.get((day, meal)) for meal in meals]
+        if any(food_id is not None for food_id in ids):
+            days.append((day, ids))
+    st.write("##### 📌 已保存的菜单")
+    meal_plan_table(days, meals)
 
 # ============ 数字冰箱 ============
+@metrics.track_page("digital_pantry")
 def digital_pantry_page():
+    # 按需导入：pypinyin 的词典较大，不拖慢页面冷启动
+    from pinyin_index import remember_ingredients, suggest_ingredients
+
     st.write("### 🥗 数字冰箱")
     
-    pantry_tabs = st.tabs(["库存管理", "智能配餐", "待买清单"])
+    pantry_tabs = st.tabs(["库存管理", "智能配餐", "一周菜单", "待买清单"])
     
     with pantry_tabs[0]:
         st.write("#### 当前库存")
         
-        conn = get_db_connection()
+        conn = get_user_connection()
         cursor = conn.cursor()
         user_id = st.session_state.current_user['username']
         cursor.execute("SELECT * FROM pantry WHERE user_id = ? ORDER BY updated_at DESC", (user_id,))
         items = cursor.fetchall()
         
+        expiring = get_expiring_items(conn, user_id)
+        if expiring:
+            st.warning("⏰ 快过期了，优先吃掉：" + "，".join(
+                f"{item['name']}（{_expiry_label(item['days_left'])}）" for item in expiring
+            ))
+        
         if not items:
             st.info("冰箱空空如也")
         else:
-            # 将数据转换为 Pandas DataFrame
-            df = pd.DataFrame(items, columns=[desc[0] for desc in cursor.description])
-
             # 表头
             col_h1, col_h2, col_h3, col_h4 = st.columns([4, 2, 3, 1])
             with col_h1:
@@ -911,59 +970,43 @@ def digital_pantry_page():
             with col_h2:
                 st.caption("数量")
             with col_h3:
-                st.caption("更新时间")
+                st.caption("保质期至")
             with col_h4:
                 st.caption("操作")
             st.divider()
 
-            # 遍历 DataFrame 来显示每一行
-            for index, item in df.iterrows():
-                col1, col2, col3, col4 = st.columns([4, 2, 3, 1])
-                with col1:
-                    st.markdown(f"<div style='padding-top: 8px;'>{item['food_name']}</div>", unsafe_allow_html=True)
-                with col2:
-                    st.markdown(f"<div style='text-align: center; padding-top: 8px; font-weight: bold;'>{item['quantity']}</div>", unsafe_allow_html=True)
-                with col3:
-                    update_time = pd.to_datetime(item['updated_at']).strftime('%Y-%m-%d %H:%M')
-                    st.markdown(f"<div style='padding-top: 8px; font-size: 0.9em; color: #888;'>{update_time}</div>", unsafe_allow_html=True)
-                
-                with col4:
-                    # 使用 popover 来放置操作按钮，使界面更紧凑
-                    with st.popover("操作", use_container_width=True):
-                        if st.button("➕ 增加", key=f"incr_pantry_{item['id']}", use_container_width=True):
-                            cursor.execute("UPDATE pantry SET quantity = quantity + 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?", (item['id'],))
-                            conn.commit()
-                            st.rerun()
-                        if st.button("➖ 减少", key=f"decr_pantry_{item['id']}", use_container_width=True):
-                            new_qty = item['quantity'] - 1
-                            if new_qty > 0:
-                                cursor.execute("UPDATE pantry SET quantity = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", (new_qty, item['id']))
-                            else: # 数量为0时直接删除
-                                cursor.execute("DELETE FROM pantry WHERE id = ?", (item['id'],))
-                            conn.commit()
-                            st.rerun()
-                        if st.button("🗑️ 删除", key=f"del_pantry_{item['id']}", use_container_width=True, type="primary"):
-                            cursor.execute("DELETE FROM pantry WHERE id = ?", (item['id'],))
-                            conn.commit()
-                            st.rerun()
+            # 逐行显示（每行是一个片段，增减只重跑这一行）；用完日期读夜间批处理的预测结果
+            forecast = get_pantry_forecast(conn, user_id)
+            for item in items:
+                pantry_row(dict(item), forecast.get(item['food_name']))
         
         st.divider()
         st.write("#### 添加库存")
-        col_a, col_b, col_c = st.columns([5, 2, 2])
+        col_a, col_b, col_c, col_d = st.columns([4, 2, 2, 2])
         with col_a:
-            new_food = st.text_input("食材名称", label_visibility="collapsed", placeholder="输入食材名称...")
+            new_food = st.text_input("食材名称", key="new_pantry_food", label_visibility="collapsed",
+                                     placeholder="输入食材名称或拼音首字母...")
         with col_b:
             new_qty = st.number_input("数量", min_value=1, value=1, label_visibility="collapsed")
         with col_c:
+            shelf_days = st.number_input("保质天数", min_value=0, value=0, label_visibility="collapsed",
+                                         help="能放几天，0 表示按食材自动估算")
+        with col_d:
             if st.button("➕ 添加到冰箱", key="add_pantry_item", use_container_width=True):
                 if new_food:
-                    cursor.execute("""
-                        INSERT INTO pantry (food_name, quantity, status, user_id)
-                        VALUES (?, ?, '充足', ?)
-                    """, (new_food, new_qty, user_id))
-                    conn.commit()
+                    expiry = datetime.now().date() + timedelta(days=shelf_days) if shelf_days else None
+                    add_pantry_item(conn, user_id, new_food, new_qty, expiry)
+                    remember_ingredients(user_id, [new_food])
+                    clear_pantry_derived()
                     st.success(f"已添加 {new_food}")
                     st.rerun()
+        # 输入拼音或首字母时给出候选，点一下填进输入框
+        if new_food:
+            suggestions = [name for name in suggest_ingredients(conn, user_id, new_food) if name != new_food]
+            for col, name in zip(st.columns(SUGGESTION_COLUMNS), suggestions[:SUGGESTION_COLUMNS]):
+                with col:
+                    st.button(name, key=f"pantry_suggest_{name}", use_container_width=True,
+                              on_click=_use_suggestion, args=("new_pantry_food", name))
     
     with pantry_tabs[1]:
         st.write("#### 智能配餐")
@@ -973,7 +1016,10 @@ def digital_pantry_page():
             with st.spinner("正在翻看冰箱和菜谱..."):
                 recommendations = recommend_from_pantry()
                 if recommendations:
-                    st.session_state.pantry_recommendations = recommendations
+                    # 只保存菜名和缺少的食材，分组时据此判断是否万事俱备
+                    st.session_state.pantry_recommendations = [
+                        (r['name'], tuple(r['missing']), tuple(r['use_first'])) for r in recommendations
+                    ]
                 else:
                     st.session_state.pantry_recommendations = []
                     st.warning("冰箱里的食材好像还不够做一道完整的菜哦，去“库存管理”看看吧！")
@@ -981,51 +1027,62 @@ def digital_pantry_page():
         if 'pantry_recommendations' in st.session_state and st.session_state.pantry_recommendations:
             st.write("---")
             
-            # 安全检查：确保 session 中的数据结构是新的（包含 'score' 键）
-            if 'score' not in st.session_state.pantry_recommendations[0]:
+            # 安全检查：确保 session 中的数据结构是新的（(菜名, 缺少的食材, 快过期食材) 元组）
+            if len(st.session_state.pantry_recommendations[0]) != 3:
                 st.session_state.pantry_recommendations = [] # 如果是旧数据，则清空
                 st.rerun()
 
             # 分为“万事俱备”和“就差一点”
-            ready_to_cook = [r for r in st.session_state.pantry_recommendations if r['score'] == 1.0]
-            almost_ready = [r for r in st.session_state.pantry_recommendations if 0 < r['score'] < 1.0]
+            recommendations = st.session_state.pantry_recommendations
+            ready_to_cook = [(name, use_first) for name, missing, use_first in recommendations if not missing]
+            almost_ready = [(name, missing) for name, missing, _ in recommendations if missing]
 
             if ready_to_cook:
                 st.success("🎉 万事俱备！这些菜可以直接做：")
-                for rec in ready_to_cook:
-                    col1, col2 = st.columns([3, 1])
+                for name, use_first in ready_to_cook:
+                    col1, col2, col3 = st.columns([3, 1, 1])
                     with col1:
-                        st.markdown(f"#### {rec['name']}")
+                        st.markdown(f"#### {name}")
+                        if use_first:
+                            st.caption(f"⏰ 顺便用掉快过期的 {'、'.join(use_first)}")
                     with col2:
-                        st.link_button("📕 小红书教程", f"https://www.xiaohongshu.com/search_result/?keyword={rec['name']} 做法", use_container_width=True)
+                        st.button("🍳 我做了这道菜", key=f"cooked_{name}", use_container_width=True,
+                                  on_click=_cook_recipe, args=(name,))
+                    with col3:
+                        st.link_button("📕 小红书教程", f"https://www.xiaohongshu.com/search_result/?keyword={name} 做法", use_container_width=True)
             
             if almost_ready:
                 st.info("💡 就差一点！补齐这些食材就能做：")
-                for rec in almost_ready:
-                    st.markdown(f"#### {rec['name']}")
+                for name, missing in almost_ready:
+                    st.markdown(f"#### {name}")
                     
                     col1, col2 = st.columns([2,1])
                     with col1:
-                        missing_str = ", ".join(rec['missing'])
+                        missing_str = ", ".join(missing)
                         st.caption(f"还差：<span style='color: red;'>**{missing_str}**</span>", unsafe_allow_html=True)
                     with col2:
-                        if st.button("🛒 加入待买", key=f"add_missing_{rec['name']}", use_container_width=True):
-                            conn = get_db_connection()
+                        if st.button("🛒 加入待买", key=f"add_missing_{name}", use_container_width=True):
+                            conn = get_user_connection()
                             cursor = conn.cursor()
                             user_id = st.session_state.current_user['username']
-                            for item in rec['missing']:
+                            for item in missing:
                                 # 简单处理：如果不存在则添加
                                 cursor.execute("INSERT OR IGNORE INTO shopping_list (item_name, user_id) VALUES (?, ?)", (item, user_id))
                             conn.commit()
                             st.toast(f"“{missing_str}” 已加入待买清单！")
                             time.sleep(0.5)
 
-                    st.link_button("📕 去小红书找灵感", f"https://www.xiaohongshu.com/search_result/?keyword={rec['name']} 做法", use_container_width=True)
+                    st.link_button("📕 去小红书找灵感", f"https://www.xiaohongshu.com/search_result/?keyword={name} 做法", use_container_width=True)
+        
+        buy_next_section()
     
     with pantry_tabs[2]:
+        meal_plan_tab()
+    
+    with pantry_tabs[3]:
         st.write("#### 待买清单")
         
-        conn = get_db_connection()
+        conn = get_user_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM shopping_list WHERE is_bought = 0")
         user_id = st.session_state.current_user['username']
@@ -1036,6 +1093,8 @@ def digital_pantry_page():
                 col1, col2, col3 = st.columns([3, 1, 1])
                 with col1:
                     st.write(f"✅ {item['item_name']}")
+                    if item['category'] == '预计用完':
+                        st.caption("📉 按最近的用量预计快用完了")
                 with col2:
                     st.caption(f"x{item['quantity']}")
                 with col3:
@@ -1061,17 +1120,86 @@ def digital_pantry_page():
                     st.success("已添加")
                     st.rerun()
 
+def _use_suggestion(target_key, value):
+    """候选按钮回调：把选中的候选填进输入框"""
+    st.session_state[target_key] = value
+
+def _expiry_label(days_left):
+    if days_left < 0:
+        return f"已过期 {-days_left} 天"
+    if days_left == 0:
+        return "今天过期"
+    return f"还剩 {days_left} 天"
+
+def _pantry_change(item_id, action):
+    """库存行按钮回调：数量增减以 SQL 自身为准，不依赖页面上可能过期的数值"""
+    conn = get_user_connection()
+    cursor = conn.cursor()
+    if action == "incr":
+        cursor.execute("UPDATE pantry SET quantity = quantity + 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?", (item_id,))
+    elif action == "decr":
+        cursor.execute("UPDATE pantry SET quantity = quantity - 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?", (item_id,))
+        # 数量为0时直接删除
+        cursor.execute("DELETE FROM pantry WHERE id = ? AND quantity <= 0", (item_id,))
+    else:
+        cursor.execute("DELETE FROM pantry WHERE id = ?", (item_id,))
+    conn.commit()
+    clear_pantry_derived()
+    st.session_state[f"pantry_row_dirty_{item_id}"] = True
+
+@st.fragment
+def pantry_row(item, forecast=None):
+    """冰箱库存中的一行（片段）；forecast 为该食材的用完预测"""
+    # 整页渲染时直接使用传入的行；行内操作后只重新读取这一行
+    if st.session_state.pop(f"pantry_row_dirty_{item['id']}", False):
+        cursor = get_user_connection().cursor()
+        cursor.execute("SELECT * FROM pantry WHERE id = ?", (item['id'],))
+        row = cursor.fetchone()
+        if row is None:
+            return
+        item = dict(row)
+    
+    col1, col2, col3, col4 = st.columns([4, 2, 3, 1])
+    with col1:
+        st.markdown(f"<div style='padding-top: 8px;'>{item['food_name']}</div>", unsafe_allow_html=True)
+    with col2:
+        st.markdown(f"<div style='text-align: center; padding-top: 8px; font-weight: bold;'>{item['quantity']}</div>", unsafe_allow_html=True)
+    with col3:
+        if item.get('expiry'):
+            days_left = (datetime.fromisoformat(str(item['expiry'])[:10]).date() - datetime.now().date()).days
+            color = "#e74c3c" if days_left <= EXPIRY_WARNING_DAYS else "#888"
+            label = f"{str(item['expiry'])[5:10]}（{_expiry_label(days_left)}）"
+        else:
+            # 旧数据没有过期日期，显示更新时间
+            color, label = "#888", f"更新于 {str(item['updated_at'])[:16]}"
+        st.markdown(f"<div style='padding-top: 8px; font-size: 0.9em; color: {color};'>{label}</div>", unsafe_allow_html=True)
+        if forecast and forecast['run_out_on']:
+            days = (forecast['run_out_on'] - datetime.now().date()).days
+            st.caption(f"📉 按最近的用量，约{f' {days} 天后' if days > 0 else '今天'}用完")
+    
+    with col4:
+        # 使用 popover 来放置操作按钮，使界面更紧凑
+        with st.popover("操作", use_container_width=True):
+            st.button("➕ 增加", key=f"incr_pantry_{item['id']}", use_container_width=True,
+                      on_click=_pantry_change, args=(item['id'], "incr"))
+            st.button("➖ 减少", key=f"decr_pantry_{item['id']}", use_container_width=True,
+                      on_click=_pantry_change, args=(item['id'], "decr"))
+            st.button("🗑️ 删除", key=f"del_pantry_{item['id']}", use_container_width=True, type="primary",
+                      on_click=_pantry_change, args=(item['id'], "delete"))
+
 # ============ 饮食日历 ============
+@metrics.track_page("calendar")
 def calendar_page():
     st.write("### 📅 饮食日历与统计")
     
-    cal_tabs = st.tabs(["🗓️ 日历视图", "📊 统计图表"])
+    # 用单选代替标签页：只渲染选中的视图，统计图表（pandas/plotly）按需加载
+    cal_view = st.radio("视图", ["🗓️ 日历视图", "📊 统计图表"], horizontal=True, label_visibility="collapsed", key="cal_view")
     user_id = st.session_state.current_user['username']
 
-    with cal_tabs[0]:
+    if cal_view == "🗓️ 日历视图":
         st.caption("查看过去30天的饮食记录")
         
-        conn = get_db_connection()
+        conn = get_user_connection()
         cursor = conn.cursor()
         
         # 获取最近30天的记录
@@ -1101,10 +1229,13 @@ def calendar_page():
         else:
             st.info("还没有饮食记录哦")
 
-    with cal_tabs[1]:
+    else:
+        import pandas as pd
+        import plotly.express as px
+
         st.caption("通过图表回顾你的饮食习惯")
         
-        conn = get_db_connection()
+        conn = get_user_connection()
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -1153,16 +1284,22 @@ def calendar_page():
                 st.plotly_chart(fig_bar, use_container_width=True)
 
 # ============ 设置页面 ============
+@metrics.track_page("settings")
 def settings_page():
+    from pinyin_index import forget_recipe, remember_recipe, suggest_foods, suggest_recipes
+
     st.write("### ⚙️ 设置")
     
     user_id = st.session_state.current_user['username']
-    conn = get_db_connection()
+    conn = get_user_connection()
     cursor = conn.cursor()
-    prefs = get_user_preferences(conn, user_id) # get_user_preferences doesn't need the cursor, but other parts of the page do.
+    prefs = get_user_preferences(conn, user_id) # 共享缓存，只读；修改请调用 update_user_preferences
     
-    # 创建标签页
-    tabs = st.tabs(["🌶️ 口味偏好", "📖 我的菜谱", "🍽️ 食物管理", "🚫 黑名单", "👤 账户信息"])
+    # 创建标签页（运行指标仅对 admin 可见）
+    tab_names = ["🌶️ 口味偏好", "📖 我的菜谱", "🍽️ 食物管理", "🚫 黑名单", "👤 账户信息"]
+    if user_id == 'admin':
+        tab_names.append("📈 运行指标")
+    tabs = st.tabs(tab_names)
     
     # ==== 口味偏好 ====
     with tabs[0]:
@@ -1187,7 +1324,7 @@ def settings_page():
         with col5:
             avoid_category = st.multiselect(
                 "不想吃的类型（多选）",
-                ["海鲜", "火锅", "烧烤", "油炒", "生食"],
+                ["海鲜", "火锅", "烧烤", "油炒", "油炸", "生食", "辣"],
                 default=prefs.get('avoid_category', [])
             )
         
@@ -1242,6 +1379,7 @@ def settings_page():
                     if st.button("🗑️ 删除", key=f"del_recipe_{recipe['id']}", use_container_width=True):
                         cursor.execute("DELETE FROM user_recipes WHERE id = ?", (recipe['id'],))
                         conn.commit()
+                        forget_recipe(user_id, recipe['recipe_name'])
                         st.rerun()
                 st.divider()
         else:
@@ -1250,6 +1388,9 @@ def settings_page():
         # 添加新菜谱
         st.write("##### 添加新菜谱")
         new_recipe_name = st.text_input("菜谱名称", key="new_recipe_name")
+        similar_recipes = suggest_recipes(conn, user_id, new_recipe_name) if new_recipe_name else []
+        if similar_recipes:
+            st.caption("已有的菜谱：" + "、".join(similar_recipes))
         new_recipe_ingredients = st.text_input("所需食材（用逗号隔开）", key="new_recipe_ingredients", placeholder="例如: 猪肉, 青椒, 蒜")
 
         if st.button("💾 保存菜谱", key="add_my_recipe", use_container_width=True):
@@ -1262,275 +1403,56 @@ def settings_page():
                         (user_id, new_recipe_name, ingredients_json)
                     )
                     conn.commit()
+                    remember_recipe(user_id, new_recipe_name, ingredients_list)
                     st.success(f"菜谱 “{new_recipe_name}” 已保存！")
                     st.rerun()
                 except Exception as e:
                     st.error("保存失败，菜谱名称可能已存在。")
 
     with tabs[2]:
-        st.write("#### 🍽️ 食物管理")
-        
-        # 顶部统计
-        cursor.execute("SELECT COUNT(*) as total FROM foods")
-        total_count = cursor.fetchone()['total']
-        cursor.execute("SELECT COUNT(*) as active FROM foods WHERE active = 1")
-        active_count = cursor.fetchone()['active']
-        
-        col_stat1, col_stat2, col_stat3 = st.columns(3)
-        with col_stat1:
-            st.metric("🍴 总食物数", total_count)
-        with col_stat2:
-            st.metric("✅ 已启用", active_count)
-        with col_stat3:
-            st.metric("❌ 已禁用", total_count - active_count)
-        
-        st.divider()
-        
-        # 搜索和筛选区域
-        col_s1, col_s2, col_s3 = st.columns([2, 1, 1])
-        with col_s1:
-            search_term = st.text_input("🔍 搜索食物名称", key="search_food")
-        with col_s2:
-            filter_category = st.selectbox(
-                "🏷️ 筛选分类", 
-                ["全部", "中餐", "西餐", "日料", "快餐", "家常菜", "甜品", "轻食", "烧烤", "零食饮料"]
-            )
-        with col_s3:
-            filter_status = st.selectbox("🛡️ 状态", ["全部", "已启用", "已禁用"])
-        
-        # 排序选项
-        col_s4, col_s5 = st.columns([2, 1])
-        with col_s4:
-            sort_by = st.selectbox(
-                "🔄 排序方式",
-                ["最新添加", "名称A-Z", "名称Z-A", "价格从低到高", "价格从高到低"]
-            )
-        with col_s5:
-            limit = st.selectbox("📊 显示数量", [10, 20, 50, 100], index=1)
-        
-        # 构建查询
-        query = "SELECT * FROM foods WHERE 1=1"
-        params = []
-        
-        if search_term:
-            query += " AND name LIKE ?"
-            params.append(f"%{search_term}%")
-        
-        if filter_category != "全部":
-            query += " AND category = ?"
-            params.append(filter_category)
-        
-        if filter_status == "已启用":
-            query += " AND active = 1"
-        elif filter_status == "已禁用":
-            query += " AND active = 0"
-        
-        # 添加排序
-        if sort_by == "最新添加":
-            query += " ORDER BY created_at DESC"
-        elif sort_by == "名称A-Z":
-            query += " ORDER BY name ASC"
-        elif sort_by == "名称Z-A":
-            query += " ORDER BY name DESC"
-        elif sort_by == "价格从低到高":
-            query += " ORDER BY cost_level ASC"
-        elif sort_by == "价格从高到低":
-            query += " ORDER BY cost_level DESC"
-        
-        query += f" LIMIT {limit}"
-        
-        cursor.execute(query, params)
-        foods = cursor.fetchall()
-        
-        st.caption(f"🔎 共找到 **{len(foods)}** 个食物")
-        
-        # 食物列表
-        if foods:
-            for food in foods:
-                with st.container():
-                    col1, col2, col3, col4, col5, col6 = st.columns([3, 1, 1, 1, 1, 1])
-                    with col1:
-                        status_icon = "✅" if food['active'] else "❌"
-                        st.write(f"{status_icon} **{food['name']}**")
-                    with col2:
-                        st.caption(f"🏷️ {food['category']}")
-                    with col3:
-                        st.caption(f"💰 {food['cost_level']}")
-                    with col4:
-                        # 将 sqlite3.Row 转换为字典以支持 get 方法
-                        food_dict = dict(food)
-                        tag_emoji = {
-                            'Healthy': '🥗',
-                            'Spicy': '🌶️',
-                            'CheatMeal': '🍔',
-                            'Normal': '🍽️'
-                        }.get(food_dict.get('health_tag'), '🍽️')
-                        st.caption(f"{tag_emoji} {food_dict.get('health_tag', 'Normal')}")
-                    with col5:
-                        if st.button("✏️", key=f"edit_{food['id']}"):
-                            st.session_state[f"editing_{food['id']}"] = True
-                            st.rerun()
-                    with col6:
-                        toggle_text = "❌ 禁用" if food['active'] else "✅ 启用"
-                        if st.button(toggle_text, key=f"toggle_{food['id']}"):
-                            new_status = 0 if food['active'] else 1
-                            cursor.execute("UPDATE foods SET active = ? WHERE id = ?", (new_status, food['id']))
-                            conn.commit()
-                            st.rerun()
-                    
-                    # 编辑模式
-                    if st.session_state.get(f"editing_{food['id']}", False):
-                        with st.expander("📝 编辑食物信息", expanded=True):
-                            col_e1, col_e2, col_e3, col_e4 = st.columns(4)
-                            with col_e1:
-                                edit_name = st.text_input("名称", value=food['name'], key=f"edit_name_{food['id']}")
-                            with col_e2:
-                                categories = ["中餐", "西餐", "日料", "快餐", "家常菜", "甜品", "轻食", "烧烤", "零食饮料"]
-                                edit_cat = st.selectbox(
-                                    "分类", 
-                                    categories,
-                                    index=categories.index(food['category']) if food['category'] in categories else 0,
-                                    key=f"edit_cat_{food['id']}"
-                                )
-                            with col_e3:
-                                costs = ["$", "$$", "$$$"]
-                                edit_cost = st.selectbox(
-                                    "价格",
-                                    costs,
-                                    index=costs.index(food['cost_level']) if food['cost_level'] in costs else 0,
-                                    key=f"edit_cost_{food['id']}"
-                                )
-                            with col_e4:
-                                tags = ["Healthy", "Spicy", "CheatMeal", "Normal"]
-                                # 将 sqlite3.Row 转换为字典以支持 get 方法
-                                food_dict = dict(food)
-                                edit_tag = st.selectbox(
-                                    "标签",
-                                    tags,
-                                    index=tags.index(food_dict.get('health_tag', 'Normal')) if food_dict.get('health_tag') in tags else 3,
-                                    key=f"edit_tag_{food['id']}"
-                                )
-                            
-                            col_b1, col_b2, col_b3 = st.columns([1, 1, 2])
-                            with col_b1:
-                                if st.button("✅ 保存", key=f"save_{food['id']}", use_container_width=True):
-                                    cursor.execute("""
-                                        UPDATE foods 
-                                        SET name = ?, category = ?, cost_level = ?, health_tag = ?
-                                        WHERE id = ?
-                                    """, (edit_name, edit_cat, edit_cost, edit_tag, food['id']))
-                                    conn.commit()
-                                    st.session_state[f"editing_{food['id']}"] = False
-                                    st.success("✅ 修改成功！")
-                                    time.sleep(0.5)
-                                    st.rerun()
-                            with col_b2:
-                                if st.button("❌ 取消", key=f"cancel_{food['id']}", use_container_width=True):
-                                    st.session_state[f"editing_{food['id']}"] = False
-                                    st.rerun()
-                            with col_b3:
-                                if st.button("🗑️ 删除该食物", key=f"delete_{food['id']}", type="secondary", use_container_width=True):
-                                    cursor.execute("DELETE FROM foods WHERE id = ?", (food['id'],))
-                                    conn.commit()
-                                    st.session_state[f"editing_{food['id']}"] = False
-                                    st.warning("⚠️ 已删除")
-                                    time.sleep(0.5)
-                                    st.rerun()
-                    
-                    st.divider()
+        if user_id == GUEST_USER:
+            st.write("#### 🍽️ 食物管理")
+            st.info("游客模式下不能修改食物库，登录后再来管理吧～")
         else:
-            st.info("🔍 没有找到符合条件的食物")
-        
-        # 批量操作
-        st.write("")
-        st.write("#### 🛠️ 批量操作")
-        col_batch1, col_batch2, col_batch3 = st.columns(3)
-        with col_batch1:
-            if st.button("✅ 启用所有", key="enable_all", use_container_width=True):
-                cursor.execute("UPDATE foods SET active = 1")
-                conn.commit()
-                st.success("✅ 已启用所有食物")
-                time.sleep(0.5)
-                st.rerun()
-        with col_batch2:
-            if st.button("❌ 禁用所有", key="disable_all", use_container_width=True):
-                cursor.execute("UPDATE foods SET active = 0")
-                conn.commit()
-                st.warning("⚠️ 已禁用所有食物")
-                time.sleep(0.5)
-                st.rerun()
-        with col_batch3:
-            if st.button("🗑️ 删除已禁用", key="delete_disabled", type="secondary", use_container_width=True):
-                cursor.execute("DELETE FROM foods WHERE active = 0")
-                conn.commit()
-                st.warning("⚠️ 已删除所有禁用的食物")
-                time.sleep(0.5)
-                st.rerun()
-        
-        st.divider()
-        
-        # 添加新食物
-        st.write("#### ➕ 添加新食物")
-        col_a, col_b, col_c, col_d = st.columns(4)
-        with col_a:
-            new_food_name = st.text_input("🍴 食物名称", key="new_food_name")
-        with col_b:
-            new_food_cat = st.selectbox(
-                "🏷️ 分类", 
-                ["中餐", "西餐", "日料", "快餐", "家常菜", "甜品", "轻食", "烧烤", "零食饮料"],
-                key="new_food_cat"
-            )
-        with col_c:
-            new_food_cost = st.selectbox("💰 价格", ["$", "$$", "$$$"], key="new_food_cost")
-        with col_d:
-            new_food_tag = st.selectbox(
-                "🏷️ 标签", 
-                ["Normal", "Healthy", "Spicy", "CheatMeal"],
-                key="new_food_tag"
-            )
-        
-        if st.button("➕ 添加食物", key="add_new_food", use_container_width=True):
-            if new_food_name:
-                cursor.execute("""
-                    INSERT INTO foods (name, category, cost_level, health_tag, active)
-                    VALUES (?, ?, ?, ?, 1)
-                """, (new_food_name, new_food_cat, new_food_cost, new_food_tag))
-                conn.commit()
-                st.success(f"✅ 已添加 **{new_food_name}**")
-                time.sleep(0.5)
-                st.rerun()
-            else:
-                st.warning("⚠️ 请输入食物名称")
+            food_management_panel(conn)
         
     # ==== 黑名单 ====
     with tabs[3]:
         st.write("#### 我的黑名单")
         st.caption("添加到黑名单的食物将不会出现在推荐中")
         
-        blacklist = prefs.get('blacklist', [])
+        blacklist = get_blacklist(conn, user_id)
         
         if blacklist:
             for item in blacklist:
                 col1, col2 = st.columns([4, 1])
                 with col1:
-                    st.write(f"🚫 {item}")
+                    st.write(f"🚫 {item['name']}")
                 with col2:
-                    if st.button("移除", key=f"rm_black_{item}"):
-                        blacklist.remove(item)
-                        update_user_preferences(conn, user_id, {'blacklist': blacklist})
+                    if st.button("移除", key=f"rm_black_{item['food_id']}"):
+                        remove_from_blacklist(conn, user_id, item['food_id'])
                         st.rerun()
         else:
             st.info("黑名单为空")
         
         st.divider()
+        blacklisted_ids = {item['food_id'] for item in blacklist}
+        blacklist_query = st.text_input("🔍 找食物", key="blacklist_query", placeholder="名称、拼音或首字母，如 mlxg")
+        if blacklist_query:
+            matches = suggest_foods(conn, blacklist_query, exclude=blacklisted_ids)
+            options = {f['name']: f['id'] for f in matches}
+        else:
+            options = {f['name']: f['id'] for f in get_active_foods(conn) if f['id'] not in blacklisted_ids}
         col_x, col_y = st.columns([3, 1])
         with col_x:
-            new_blacklist_item = st.text_input("添加到黑名单")
+            new_blacklist_item = st.selectbox(
+                "添加到黑名单", list(options), index=0 if blacklist_query and options else None,
+                placeholder="输入或选择食物名称..."
+            )
         with col_y:
             if st.button("➕ 添加", key="add_blacklist"):
-                if new_blacklist_item and new_blacklist_item not in blacklist:
-                    blacklist.append(new_blacklist_item)
-                    update_user_preferences(conn, user_id, {'blacklist': blacklist})
+                if new_blacklist_item:
+                    add_to_blacklist(conn, user_id, options[new_blacklist_item])
                     st.success("✅ 已添加")
                     st.rerun()
     
@@ -1538,7 +1460,7 @@ def settings_page():
     with tabs[4]:
         st.write("#### 👤 账户信息")
 
-        if user_id == 'guest':
+        if user_id == GUEST_USER:
             st.warning("访客模式不支持上传头像。")
         else:
             # 显示当前头像
@@ -1597,9 +1519,439 @@ def settings_page():
             st.session_state.show_logout_confirmation = True
             st.rerun()
 
+    # ==== 运行指标 ====
+    if user_id == 'admin':
+        with tabs[5]:
+            metrics_admin_panel()
+
+# 添加食物表单和批量导入共用的取值范围
+FOOD_CATEGORIES = ["中餐", "西餐", "日料", "快餐", "家常菜", "甜品", "轻食", "烧烤", "零食饮料"]
+FOOD_COST_LEVELS = ["$", "$$", "$$$"]
+FOOD_HEALTH_TAGS = ["Normal", "Healthy", "Spicy", "CheatMeal"]
+
+def food_management_panel(conn):
+    """设置 -> 食物管理：食物库的增删改查与批量操作"""
+    from dedupe import duplicate_report, find_duplicates, find_duplicates_in_batch
+    from pinyin_index import food_ids_matching
+    
+    cursor = conn.cursor()
+    st.write("#### 🍽️ 食物管理")
+
+    # 顶部统计
+    cursor.execute("SELECT COUNT(*) as total FROM foods")
+    total_count = cursor.fetchone()['total']
+    cursor.execute("SELECT COUNT(*) as active FROM foods WHERE active = 1")
+    active_count = cursor.fetchone()['active']
+
+    col_stat1, col_stat2, col_stat3 = st.columns(3)
+    with col_stat1:
+        st.metric("🍴 总食物数", total_count)
+    with col_stat2:
+        st.metric("✅ 已启用", active_count)
+    with col_stat3:
+        st.metric("❌ 已禁用", total_count - active_count)
+
+    st.divider()
+
+    # 搜索和筛选区域
+    col_s1, col_s2, col_s3 = st.columns([2, 1, 1])
+    with col_s1:
+        search_term = st.text_input("🔍 搜索食物名称", key="search_food", placeholder="名称、拼音或首字母，如 mlxg")
+    with col_s2:
+        filter_category = st.selectbox(
+            "🏷️ 筛选分类", 
+            ["全部", "中餐", "西餐", "日料", "快餐", "家常菜", "甜品", "轻食", "烧烤", "零食饮料"]
+        )
+    with col_s3:
+        filter_status = st.selectbox("🛡️ 状态", ["全部", "已启用", "已禁用"])
+
+    # 排序选项
+    col_s4, col_s5 = st.columns([2, 1])
+    with col_s4:
+        sort_by = st.selectbox(
+            "🔄 排序方式",
+            ["最新添加", "名称A-Z", "名称Z-A", "价格从低到高", "价格从高到低"]
+        )
+    with col_s5:
+        limit = st.selectbox("📊 显示数量", [10, 20, 50, 100], index=1)
+
+    filter_attrs = st.multiselect("🧩 必须包含的属性", list(FOOD_ATTRIBUTES), key="filter_food_attrs")
+
+    # 构建查询
+    query = "SELECT * FROM foods WHERE 1=1"
+    params = []
+
+    if filter_attrs:
+        # 属性筛选：一次位运算判断是否包含全部所选属性
+        required_mask = attribute_mask(filter_attrs)
+        query += " AND (IFNULL(attr_mask, 0) & ?) = ?"
+        params.extend([required_mask, required_mask])
+
+    if search_term:
+        # 拼音或首字母由前缀索引给出匹配的 id，名称子串仍用 LIKE
+        pinyin_ids = food_ids_matching(conn, search_term)
+        if pinyin_ids:
+            query += " AND (name LIKE ? OR id IN (SELECT value FROM json_each(?)))"
+            params.extend([f"%{search_term}%", json.dumps(sorted(pinyin_ids))])
+        else:
+            query += " AND name LIKE ?"
+            params.append(f"%{search_term}%")
+
+    if filter_category != "全部":
+        query += " AND category = ?"
+        params.append(filter_category)
+
+    if filter_status == "已启用":
+        query += " AND active = 1"
+    elif filter_status == "已禁用":
+        query += " AND active = 0"
+
+    # 添加排序
+    if sort_by == "最新添加":
+        query += " ORDER BY created_at DESC"
+    elif sort_by == "名称A-Z":
+        query += " ORDER BY name ASC"
+    elif sort_by == "名称Z-A":
+        query += " ORDER BY name DESC"
+    elif sort_by == "价格从低到高":
+        query += " ORDER BY cost_level ASC"
+    elif sort_by == "价格从高到低":
+        query += " ORDER BY cost_level DESC"
+
+    query += f" LIMIT {limit}"
+
+    cursor.execute(query, params)
+    foods = cursor.fetchall()
+
+    st.caption(f"🔎 共找到 **{len(foods)}** 个食物")
+
+    # 食物列表
+    if foods:
+        for food in foods:
+            with st.container():
+                col1, col2, col3, col4, col5, col6 = st.columns([3, 1, 1, 1, 1, 1])
+                with col1:
+                    status_icon = "✅" if food['active'] else "❌"
+                    st.write(f"{status_icon} **{food['name']}**")
+                with col2:
+                    st.caption(f"🏷️ {food['category']}")
+                    attrs = attribute_names(food['attr_mask'])
+                    if attrs:
+                        st.caption(" · ".join(attrs))
+                with col3:
+                    st.caption(f"💰 {food['cost_level']}")
+                    if food['calories'] is not None:
+                        st.caption(f"🔥 {food['calories']} 千卡")
+                with col4:
+                    # 将 sqlite3.Row 转换为字典以支持 get 方法
+                    food_dict = dict(food)
+                    tag_emoji = {
+                        'Healthy': '🥗',
+                        'Spicy': '🌶️',
+                        'CheatMeal': '🍔',
+                        'Normal': '🍽️'
+                    }.get(food_dict.get('health_tag'), '🍽️')
+                    st.caption(f"{tag_emoji} {food_dict.get('health_tag', 'Normal')}")
+                with col5:
+                    if st.button("✏️", key=f"edit_{food['id']}"):
+                        st.session_state[f"editing_{food['id']}"] = True
+                        st.rerun()
+                with col6:
+                    toggle_text = "❌ 禁用" if food['active'] else "✅ 启用"
+                    if st.button(toggle_text, key=f"toggle_{food['id']}"):
+                        new_status = 0 if food['active'] else 1
+                        cursor.execute("UPDATE foods SET active = ? WHERE id = ?", (new_status, food['id']))
+                        conn.commit()
+                        st.rerun()
+
+                # 编辑模式
+                if st.session_state.get(f"editing_{food['id']}", False):
+                    with st.expander("📝 编辑食物信息", expanded=True):
+                        col_e1, col_e2, col_e3, col_e4 = st.columns(4)
+                        with col_e1:
+                            edit_name = st.text_input("名称", value=food['name'], key=f"edit_name_{food['id']}")
+                        with col_e2:
+                            categories = ["中餐", "西餐", "日料", "快餐", "家常菜", "甜品", "轻食", "烧烤", "零食饮料"]
+                            edit_cat = st.selectbox(
+                                "分类", 
+                                categories,
+                                index=categories.index(food['category']) if food['category'] in categories else 0,
+                                key=f"edit_cat_{food['id']}"
+                            )
+                        with col_e3:
+                            costs = ["$", "$$", "$$$"]
+                            edit_cost = st.selectbox(
+                                "价格",
+                                costs,
+                                index=costs.index(food['cost_level']) if food['cost_level'] in costs else 0,
+                                key=f"edit_cost_{food['id']}"
+                            )
+                        with col_e4:
+                            tags = ["Healthy", "Spicy", "CheatMeal", "Normal"]
+                            # 将 sqlite3.Row 转换为字典以支持 get 方法
+                            food_dict = dict(food)
+                            edit_tag = st.selectbox(
+                                "标签",
+                                tags,
+                                index=tags.index(food_dict.get('health_tag', 'Normal')) if food_dict.get('health_tag') in tags else 3,
+                                key=f"edit_tag_{food['id']}"
+                            )
+                        edit_attrs = st.multiselect(
+                            "属性",
+                            list(FOOD_ATTRIBUTES),
+                            default=attribute_names(food['attr_mask']),
+                            key=f"edit_attrs_{food['id']}"
+                        )
+                        col_n1, col_n2, col_n3, col_n4 = st.columns(4)
+                        with col_n1:
+                            edit_calories = st.number_input(
+                                "热量（千卡/份）", min_value=0, max_value=5000, step=10,
+                                value=int(food['calories'] or 0), key=f"edit_calories_{food['id']}"
+                            )
+                        with col_n2:
+                            edit_protein = st.number_input(
+                                "蛋白质（克）", min_value=0.0, value=float(food['protein'] or 0), key=f"edit_protein_{food['id']}"
+                            )
+                        with col_n3:
+                            edit_fat = st.number_input(
+                                "脂肪（克）", min_value=0.0, value=float(food['fat'] or 0), key=f"edit_fat_{food['id']}"
+                            )
+                        with col_n4:
+                            edit_carbs = st.number_input(
+                                "碳水（克）", min_value=0.0, value=float(food['carbs'] or 0), key=f"edit_carbs_{food['id']}"
+                            )
+
+                        col_b1, col_b2, col_b3 = st.columns([1, 1, 2])
+                        with col_b1:
+                            if st.button("✅ 保存", key=f"save_{food['id']}", use_container_width=True):
+                                cursor.execute("""
+                                    UPDATE foods 
+                                    SET name = ?, category = ?, cost_level = ?, health_tag = ?
+                                    WHERE id = ?
+                                """, (edit_name, edit_cat, edit_cost, edit_tag, food['id']))
+                                set_food_attributes(conn, food['id'], edit_attrs)
+                                set_food_nutrition(conn, food['id'], edit_calories, edit_protein, edit_fat, edit_carbs)
+                                st.session_state[f"editing_{food['id']}"] = False
+                                st.success("✅ 修改成功！")
+                                time.sleep(0.5)
+                                st.rerun()
+                        with col_b2:
+                            if st.button("❌ 取消", key=f"cancel_{food['id']}", use_container_width=True):
+                                st.session_state[f"editing_{food['id']}"] = False
+                                st.rerun()
+                        with col_b3:
+                            if st.button("🗑️ 删除该食物", key=f"delete_{food['id']}", type="secondary", use_container_width=True):
+                                cursor.execute("DELETE FROM foods WHERE id = ?", (food['id'],))
+                                conn.commit()
+                                st.session_state[f"editing_{food['id']}"] = False
+                                st.warning("⚠️ 已删除")
+                                time.sleep(0.5)
+                                st.rerun()
+
+                st.divider()
+    else:
+        st.info("🔍 没有找到符合条件的食物")
+
+    # 批量操作
+    st.write("")
+    st.write("#### 🛠️ 批量操作")
+    col_batch1, col_batch2, col_batch3 = st.columns(3)
+    with col_batch1:
+        if st.button("✅ 启用所有", key="enable_all", use_container_width=True):
+            cursor.execute("UPDATE foods SET active = 1")
+            conn.commit()
+            st.success("✅ 已启用所有食物")
+            time.sleep(0.5)
+            st.rerun()
+    with col_batch2:
+        if st.button("❌ 禁用所有", key="disable_all", use_container_width=True):
+            cursor.execute("UPDATE foods SET active = 0")
+            conn.commit()
+            st.warning("⚠️ 已禁用所有食物")
+            time.sleep(0.5)
+            st.rerun()
+    with col_batch3:
+        if st.button("🗑️ 删除已禁用", key="delete_disabled", type="secondary", use_container_width=True):
+            cursor.execute("DELETE FROM foods WHERE active = 0")
+            conn.commit()
+            st.warning("⚠️ 已删除所有禁用的食物")
+            time.sleep(0.5)
+            st.rerun()
+    
+    if st.button("🧹 查找名称相近的重复食物", key="duplicate_report", use_container_width=True):
+        groups = duplicate_report(conn)
+        if groups:
+            st.warning(f"⚠️ 发现 {len(groups)} 组名称相近的食物，可用上方的搜索找到后合并或删除")
+            st.dataframe(
+                [{"组": i + 1, "食物": "、".join(name for _, name in group)} for i, group in enumerate(groups)],
+                use_container_width=True, hide_index=True,
+            )
+        else:
+            st.success("✅ 没有发现名称相近的重复食物")
+
+    st.divider()
+
+    # 添加新食物
+    st.write("#### ➕ 添加新食物")
+    col_a, col_b, col_c, col_d = st.columns(4)
+    with col_a:
+        new_food_name = st.text_input("🍴 食物名称", key="new_food_name")
+    with col_b:
+        new_food_cat = st.selectbox(
+            "🏷️ 分类", 
+            FOOD_CATEGORIES,
+            key="new_food_cat"
+        )
+    with col_c:
+        new_food_cost = st.selectbox("💰 价格", FOOD_COST_LEVELS, key="new_food_cost")
+    with col_d:
+        new_food_tag = st.selectbox(
+            "🏷️ 标签", 
+            FOOD_HEALTH_TAGS,
+            key="new_food_tag"
+        )
+    new_food_attrs = st.multiselect(
+        "🧩 属性（留空则根据名称自动推断）", list(FOOD_ATTRIBUTES), key="new_food_attrs",
+        help="自动推断只在名称明确是素菜时才标素食，素食请手动勾选"
+    )
+
+    # 输入名称时就提示食物库里名称相近的食物
+    duplicates = find_duplicates(conn, new_food_name) if new_food_name else []
+    allow_duplicate = True
+    if duplicates:
+        st.warning("⚠️ 食物库里已有名称相近的：" + "，".join(
+            f"{food['name']}（{similarity:.0%}）" for food, similarity in duplicates[:5]
+        ))
+        allow_duplicate = st.checkbox("不是重复，仍然添加", key="allow_duplicate_food")
+
+    if st.button("➕ 添加食物", key="add_new_food", use_container_width=True):
+        if not new_food_name:
+            st.warning("⚠️ 请输入食物名称")
+        elif not allow_duplicate:
+            st.warning("⚠️ 请确认不是重复的食物")
+        # 营养先按分类和属性估算，可在编辑里修改
+        elif add_foods(conn, [(new_food_name, new_food_cat, new_food_cost, new_food_tag, new_food_attrs or None)]):
+            st.success(f"✅ 已添加 **{new_food_name}**")
+            time.sleep(0.5)
+            st.rerun()
+        else:
+            st.warning(f"⚠️ **{new_food_name}** 已经在食物库里了")
+
+    with st.expander("📥 批量导入"):
+        st.caption("每行一个食物：名称,分类,价格,标签（后三项可省略，默认 中餐,$$,Normal）")
+        import_text = st.text_area("食物列表", key="import_foods_text", label_visibility="collapsed",
+                                   placeholder="葱油拌面,家常菜,$,Normal\n牛肉拉面")
+        import_duplicates = st.checkbox("名称相近的也导入", key="import_duplicate_foods")
+        if st.button("📥 检查并导入", key="import_foods_btn", use_container_width=True) and import_text.strip():
+            rows, invalid = [], []
+            for n, line in enumerate(import_text.splitlines(), 1):
+                parts = [part.strip() for part in line.replace("，", ",").split(",")]
+                if not parts[0]:
+                    continue
+                if len(parts) > 4:
+                    invalid.append(f"第 {n} 行 {parts[0]}：多了 {len(parts) - 4} 项")
+                    continue
+                parts += ["中餐", "$$", "Normal"][len(parts) - 1:]
+                problems = [
+                    f"{label}“{value}”不在 {'/'.join(allowed)} 里"
+                    for label, value, allowed in (("分类", parts[1], FOOD_CATEGORIES),
+                                                  ("价格", parts[2], FOOD_COST_LEVELS),
+                                                  ("标签", parts[3], FOOD_HEALTH_TAGS))
+                    if value not in allowed
+                ]
+                if problems:
+                    invalid.append(f"第 {n} 行 {parts[0]}：" + "，".join(problems))
+                else:
+                    rows.append((parts[0], parts[1], parts[2], parts[3], None))
+            if invalid:
+                # 价格里的 $ 会被当成 LaTeX 公式，先转义
+                st.error("❌ 这些行没有导入：\n\n" + "\n\n".join(invalid).replace("$", "\\$"))
+            flagged = find_duplicates_in_batch(conn, [row[0] for row in rows])
+            if flagged:
+                st.warning("⚠️ 名称相近：" + "；".join(
+                    f"{name} ≈ {'、'.join(similar)}" for name, similar in flagged.items()
+                ))
+            to_import = rows if import_duplicates else [row for row in rows if row[0] not in flagged]
+            added = add_foods(conn, to_import)
+            skipped = len(rows) - len(added)
+            if rows:
+                st.success(f"✅ 导入 {len(added)} 个食物" + (f"，跳过 {skipped} 个" if skipped else ""))
+
+def metrics_admin_panel():
+    """管理员查看进程内运行指标"""
+    st.write("#### 📈 运行指标")
+    st.caption(f"每 {metrics.FLUSH_INTERVAL} 秒以 Prometheus 文本格式写入 `{metrics.METRICS_PATH}`")
+
+    counter_rows = []
+    histogram_rows = []
+    for metric in metrics.REGISTRY.metrics():
+        if isinstance(metric, metrics.Counter):
+            for key, value in metric.samples():
+                counter_rows.append({
+                    "指标": metric.name,
+                    "标签": ", ".join(f"{k}={v}" for k, v in zip(metric.labelnames, key)),
+                    "数值": value,
+                })
+        else:
+            for key, count, total, quantiles in metric.snapshot():
+                histogram_rows.append({
+                    "指标": metric.name,
+                    "标签": ", ".join(f"{k}={v}" for k, v in zip(metric.labelnames, key)),
+                    "次数": count,
+                    "p50 (ms)": round(quantiles[0.5] * 1000, 2),
+                    "p95 (ms)": round(quantiles[0.95] * 1000, 2),
+                    "p99 (ms)": round(quantiles[0.99] * 1000, 2),
+                })
+
+    st.write("##### 计数器")
+    if counter_rows:
+        st.dataframe(counter_rows, use_container_width=True, hide_index=True)
+    else:
+        st.info("暂无数据")
+
+    st.write("##### 延迟分布")
+    if histogram_rows:
+        st.dataframe(histogram_rows, use_container_width=True, hide_index=True)
+    else:
+        st.info("暂无数据")
+
+    st.write("##### 会话内存")
+    budget = get_session_budget()
+    guest_store = get_guest_store()
+    st.caption(
+        f"在线会话 {len(budget)} 个，session_state 合计 {budget.total() / 1024:.1f} KB"
+        f"（单会话上限 {budget.cap / 1024:.0f} KB）；"
+        f"游客内存库 {len(guest_store)} 个，合计 {guest_store.memory_usage() / 1024:.1f} KB"
+        f"（上限 {guest_store.memory_cap / 1024 / 1024:.0f} MB）"
+    )
+    session_rows = []
+    for session_id, user, size, largest, idle in budget.snapshot():
+        session_rows.append({
+            "会话": session_id[:8],
+            "用户": user or "-",
+            "session_state (KB)": round(size / 1024, 1),
+            "最大的键": ", ".join(largest),
+            "空闲 (秒)": int(idle),
+        })
+    if session_rows:
+        st.dataframe(session_rows, use_container_width=True, hide_index=True)
+    else:
+        st.info("暂无数据")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("💾 立即落盘", key="flush_metrics", use_container_width=True):
+            metrics.REGISTRY.flush()
+            st.success("✅ 已写入指标文件")
+    with col2:
+        show_raw = st.toggle("显示原始文本", key="show_raw_metrics")
+    if show_raw:
+        st.code(metrics.REGISTRY.render(), language="text")
+
 # ============ 结果展示 ============
 def show_food_result_v2(food, time_of_day):
     """展示选中的食物结果 - 智能推荐版本（不重复问哪一餐）"""
+    origin, food = jumped_food(food, "smart")
     st.markdown(f"""
     <div class="result-box">
         🍽️ 就吃这个！<br/>
@@ -1635,36 +1987,36 @@ def show_food_result_v2(food, time_of_day):
         st.write("")
         st.write("")
     
-    col_b1, col_b2 = st.columns(2)
+    col_b1, col_b2, col_b3 = st.columns(3)
     with col_b1:
         if st.button("✅ 确认吃这个", key="confirm_smart", use_container_width=True):
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO eat_history (date, meal_time, food_id, food_name, user_id, rating, mode)
-                VALUES (?, ?, ?, ?, ?, ?, 'smart')
-            """, (
-                datetime.now().date().isoformat(),
+            record_meal(
+                get_user_connection(), st.session_state.current_user['username'], food,
                 auto_meal_time,  # 使用自动推断的餐次
-                food['id'],
-                food['name'],
-                st.session_state.current_user['username'],
-                rating
-            ))
-            conn.commit()
+                rating=rating, mode='smart'
+            )
+            learn_from_meal_rating(food, rating)
             
             st.success(f"✅ 已记录到饮食日历！（{auto_meal_time}）")
             # 清空推荐结果
-            st.session_state.recommended_food = None
+            st.session_state.recommended_food_id = None
             time.sleep(1)
             st.rerun()
     
     with col_b2:
         if st.button("🔄 换一个", key="change_smart", use_container_width=True):
             # 清空推荐结果，返回选择界面
-            st.session_state.recommended_food = None
+            st.session_state.recommended_food_id = None
             st.rerun()
     
+    with col_b3:
+        if blacklist_button(food, key="blacklist_smart"):
+            st.session_state.recommended_food_id = None
+            time.sleep(0.5)
+            st.rerun()
+    
+    similar_foods_section(origin, food, "smart")
+    
     # 显示菜谱链接
     # 将 sqlite3.Row 转换为字典以支持 get 方法
     food_dict = dict(food)
@@ -1673,6 +2025,7 @@ def show_food_result_v2(food, time_of_day):
 
 def show_food_result(food, key_prefix="general"):
     """展示选中的食物结果 - 通用版本"""
+    origin, food = jumped_food(food, key_prefix)
     st.markdown(f"""
     <div class="result-box">
         🍽️ 就吃这个！<br/>
@@ -1694,30 +2047,94 @@ def show_food_result(food, key_prefix="general"):
     meal_time = st.selectbox("🍴 哪一餐？", ["早餐", "午餐", "晚餐", "夜宵"], key=f"{key_prefix}_meal_time_select")
     rating = st.slider("🌟 满意度", 1, 5, 5, key=f"{key_prefix}_rating")
     
-    if st.button("✅ 确认吃这个", key=f"{key_prefix}_confirm", use_container_width=True):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO eat_history (date, meal_time, food_id, food_name, user_id, rating, mode)
-            VALUES (?, ?, ?, ?, ?, ?, 'random')
-        """, (
-            datetime.now().date().isoformat(),
-            meal_time,
-            food['id'],
-            food['name'],
-            st.session_state.current_user['username'],
-            rating
-        ))
-        conn.commit()
+    col_b1, col_b2 = st.columns(2)
+    with col_b1:
+        confirmed = st.button("✅ 确认吃这个", key=f"{key_prefix}_confirm", use_container_width=True)
+    with col_b2:
+        blacklist_button(food, key=f"{key_prefix}_blacklist")
+    
+    if confirmed:
+        record_meal(
+            get_user_connection(), st.session_state.current_user['username'], food,
+            meal_time, rating=rating, mode='random'
+        )
+        learn_from_meal_rating(food, rating)
         
         st.success("✅ 已记录到饮食日历！")
     
+    similar_foods_section(origin, food, key_prefix)
+    
     # 显示菜谱链接
     if dict(food).get('recipe_link'):
         st.write(f"📖 [查看菜谱]({food['recipe_link']})")
 
+def _jump_to_similar(key_prefix, origin_id, food_id):
+    st.session_state[f"{key_prefix}_similar"] = (origin_id, food_id)
+
+def jumped_food(food, key_prefix):
+    """
+    结果卡片在“更多类似的”里点过别的菜时，改为展示那道菜：返回 (原来的食物, 要展示的食物)。
+    session 里只记 (原食物id, 跳转到的食物id)，原来的食物变了（如换一个）就不再生效
+    """
+    jump = st.session_state.get(f"{key_prefix}_similar")
+    if jump and jump[0] == food['id'] and jump[1] != food['id']:
+        foods = get_foods_by_ids(get_db_connection(), [jump[1]])
+        if foods:
+            return food, foods[0]
+    return food, food
+
+def similar_foods_section(origin, food, key_prefix):
+    """结果卡片下的“更多类似的”：按分类、标签、价位、名称和大家的饮食记录找相似的菜"""
+    from similar_foods import similar_foods
+    
+    user_id = st.session_state.current_user['username']
+    blacklisted = [item['food_id'] for item in get_blacklist(get_user_connection(), user_id)]
+    neighbours = similar_foods(get_db_connection(), food['id'], exclude=blacklisted)
+    if not neighbours:
+        return
+    with st.expander("🔍 更多类似的"):
+        cols = st.columns(len(neighbours))
+        for col, (other, similarity) in zip(cols, neighbours):
+            with col:
+                st.button(other['name'], key=f"{key_prefix}_similar_{other['id']}", use_container_width=True,
+                          help=f"相似度 {similarity:.0%}",
+                          on_click=_jump_to_similar, args=(key_prefix, origin['id'], other['id']))
+        if food['id'] != origin['id']:
+            st.button(f"↩️ 回到 {origin['name']}", key=f"{key_prefix}_similar_back",
+                      on_click=_jump_to_similar, args=(key_prefix, origin['id'], origin['id']))
+
+def learn_from_meal_rating(food, rating):
+    """用刚记录的评分增量更新个人口味权重"""
+    from personalization import learn_from_rating
+
+    learn_from_rating(get_user_connection(), st.session_state.current_user['username'], food, rating)
+
+def blacklist_button(food, key):
+    """结果卡片上的“不想再吃”按钮，点击后把食物加入当前用户的黑名单"""
+    if st.button("🚫 不想再吃", key=key, use_container_width=True):
+        add_to_blacklist(get_user_connection(), st.session_state.current_user['username'], food['id'])
+        st.toast(f"已把“{food['name']}”加入黑名单，以后不再推荐")
+        return True
+    return False
+
 # ============ 主入口 ============
 if not st.session_state.logged_in:
     login_page()
 else:
     main_app()
+
+# 会话内存记账：超出上限时丢弃可重新计算的结果
+_user = st.session_state.current_user or {}
+for _key in get_session_budget().record(
+    st.session_state.session_id, _user.get('username'), st.session_state.to_dict(), SESSION_DROPPABLE_KEYS
+):
+    del st.session_state[_key]
+
+# 首屏耗时：每个会话的第一次渲染；进程内的第一次渲染即冷启动
+if not st.session_state.get('first_paint_recorded'):
+    st.session_state.first_paint_recorded = True
+    elapsed = time.perf_counter() - _script_start
+    FIRST_PAINT_SECONDS.observe(elapsed)
+    if not _warm_state["cold_start_recorded"]:
+        _warm_state["cold_start_recorded"] = True
+        COLD_START_SECONDS.observe(time.perf_counter() - metrics.PROCESS_START)
@@ -1,25 +1,235 @@
 import sqlite3
 import json
-from datetime import datetime
+import time
+from datetime import date, datetime, timedelta
 import os
 
+import metrics
+
 DB_PATH = "honeyeat.db"
 
+# 游客账号：数据存放在每个会话独立的内存数据库中（见 guest_store.py）
+GUEST_USER = "guest"
+
+# 食物属性及其在 foods.attr_mask 中的位（新增属性只能追加，不能改动已有的位）
+FOOD_ATTRIBUTES = {
+    "素食": 0,
+    "海鲜": 1,
+    "火锅": 2,
+    "烧烤": 3,
+    "油炒": 4,
+    "生食": 5,
+    "油炸": 6,
+    "辣": 7,
+    "甜": 8,
+    "健康": 9,
+    "清淡": 10,
+    "肉类": 11,
+    "主食": 12,
+    "汤羹": 13,
+}
+
+# 默认属性推断规则：名称关键词 / 分类 / 健康标签
+# 规则收紧（会去掉旧数据里的属性）时加一，初始化时按新规则复核一次
+ATTRIBUTE_RULES_VERSION = 1
+_ATTRIBUTE_KEYWORDS = {
+    "海鲜": ["鱼", "虾", "蟹", "蚝", "鱿", "鳗", "章鱼", "海鲜", "刺身", "寿司", "蛤", "贝"],
+    "火锅": ["火锅", "寿喜烧", "串串", "涮"],
+    # 只认烧烤/烤串类的词：“烤”本身太宽（北京烤鸭、烤三文鱼并不是烧烤）
+    "烧烤": ["烧烤", "烤串", "肉串", "烤肉", "烤全羊"],
+    "油炒": ["炒", "葱爆", "宫保", "鱼香", "回锅", "香锅", "干煸", "地三鲜", "蚂蚁上树", "锅包肉", "咕咾"],
+    "生食": ["刺身", "寿司", "沙拉", "沙ラ", "生鱼", "生腌"],
+    "油炸": ["炸", "薯条", "天妇罗", "鸡米花", "洋葱圈", "薯片", "猪排", "春卷"],
+    "辣": ["辣", "麻婆", "花椒", "剁椒", "螺蛳"],
+    "肉类": ["肉", "鸡", "牛", "羊", "猪", "鸭", "鹅", "排骨", "火腿", "汉堡", "热狗", "丼", "五花", "佛跳墙", "鹅肝"],
+    "主食": ["饭", "面", "饺", "饼", "粥", "粉", "三明治", "汉堡", "披萨", "卷"],
+    "汤羹": ["汤", "羹", "粥", "关东煮"],
+}
+_ATTRIBUTE_CATEGORIES = {
+    "烧烤": ["烧烤"],
+    "甜": ["甜品"],
+}
+_ATTRIBUTE_HEALTH_TAGS = {
+    "辣": ["Spicy"],
+    "甜": ["Sweet"],
+    "健康": ["Healthy"],
+    "清淡": ["Light"],
+}
+# 只是口味名、并不代表含有该食材的词（如“鱼香”肉丝里没有鱼）
+_ATTRIBUTE_FALSE_FRIENDS = {
+    "海鲜": ["鱼香"],
+}
+# 素食只在有明确依据时推断（推断错了会直接推荐给素食用户，宁可漏标）：
+# 名称明确是素菜或素的饮品零食；或者是健康/清淡的菜，名称里有蔬菜豆类等主料
+_VEGETARIAN_KEYWORDS = [
+    "素", "斋", "罗汉", "时蔬", "酸奶", "咖啡", "奶茶", "果汁", "橙汁", "柠檬茶", "可乐", "坚果", "爆米花",
+]
+_VEGETABLE_KEYWORDS = [
+    "西兰花", "黄瓜", "茄子", "土豆", "韭菜", "玉米", "青菜", "菠菜", "白菜", "生菜", "番茄", "蘑菇", "菌",
+    "豆腐", "藜麦", "鹰嘴豆", "燕麦", "水果", "蔬",
+]
+# 名称里看不出荤腥、但通常不是素食的菜（有明确的“素”“斋”时除外）
+_NON_VEGETARIAN_HINTS = [
+    "火锅", "香锅", "寿喜烧", "天妇罗", "春卷", "拉面", "麦当劳", "肯德基", "自助餐", "早茶", "关东煮", "味噌", "麻婆",
+    "蚂蚁上树", "饺", "馄饨", "小笼", "包子", "手抓饼", "披萨", "螺蛳粉", "方便面", "海苔饭", "烤面筋", "凯撒",
+]
+_EXPLICIT_VEGETARIAN = ["素", "斋"]
+
+def _looks_vegetarian(name, attrs):
+    """有明确依据才算素食：含肉类/海鲜的不算；通常有荤的菜名要有“素”“斋”才算"""
+    if attrs & {"肉类", "海鲜"}:
+        return False
+    if any(k in name for k in _NON_VEGETARIAN_HINTS) and not any(k in name for k in _EXPLICIT_VEGETARIAN):
+        return False
+    if any(k in name for k in _VEGETARIAN_KEYWORDS):
+        return True
+    return bool(attrs & {"健康", "清淡"}) and any(k in name for k in _VEGETABLE_KEYWORDS)
+
+def derive_food_attributes(name, category, health_tag):
+    """根据名称、分类、健康标签推断食物属性（用于默认数据和未手动指定属性的新食物）"""
+    attrs = set()
+    for attr, keywords in _ATTRIBUTE_KEYWORDS.items():
+        text = name
+        for word in _ATTRIBUTE_FALSE_FRIENDS.get(attr, []):
+            text = text.replace(word, "")
+        if any(k in text for k in keywords):
+            attrs.add(attr)
+    for attr, categories in _ATTRIBUTE_CATEGORIES.items():
+        if category in categories:
+            attrs.add(attr)
+    for attr, tags in _ATTRIBUTE_HEALTH_TAGS.items():
+        if health_tag in tags:
+            attrs.add(attr)
+    if _looks_vegetarian(name, attrs):
+        attrs.add("素食")
+    return attrs
+
+def attribute_mask(names):
+    """把属性名集合编码成位掩码"""
+    mask = 0
+    for name in names:
+        mask |= 1 << FOOD_ATTRIBUTES[name]
+    return mask
+
+def attribute_names(mask):
+    """把位掩码解码成属性名列表"""
+    return [name for name, bit in FOOD_ATTRIBUTES.items() if mask and mask >> bit & 1]
+
+# 每份的默认营养估算：分类的基准三大营养素（克：蛋白质, 脂肪, 碳水），再按属性和健康标签调整
+_CATEGORY_MACROS = {
+    "中餐": (25, 30, 55),
+    "家常菜": (20, 22, 40),
+    "快餐": (25, 38, 75),
+    "速食": (14, 18, 70),
+    "大餐": (45, 55, 70),
+    "日料": (25, 15, 75),
+    "西餐": (30, 35, 60),
+    "早餐": (10, 8, 45),
+    "小吃": (10, 15, 40),
+    "烧烤": (22, 25, 15),
+    "甜品": (5, 16, 45),
+    "轻食": (20, 12, 35),
+    "零食饮料": (3, 8, 30),
+}
+_DEFAULT_MACROS = (20, 20, 55)
+# 属性 → (蛋白质, 脂肪, 碳水) 的倍数
+_ATTRIBUTE_MACRO_FACTORS = {
+    "肉类": (1.3, 1.1, 1.0),
+    "油炸": (1.0, 1.4, 1.1),
+    "油炒": (1.0, 1.2, 1.0),
+    "主食": (1.0, 1.0, 1.2),
+    "甜": (1.0, 1.0, 1.2),
+    "健康": (1.0, 0.7, 0.9),
+    "清淡": (1.0, 0.7, 0.9),
+}
+_HEALTH_TAG_FACTORS = {"CheatMeal": 1.2}
+
+def estimate_nutrition(name, category, health_tag, attrs=None):
+    """
+    估算一份食物的营养：返回 (热量千卡, 蛋白质克, 脂肪克, 碳水克)。
+    只是按分类和属性的粗略估计，用于默认数据和未手动填写营养的新食物。
+    """
+    if attrs is None:
+        attrs = derive_food_attributes(name, category, health_tag)
+    protein, fat, carbs = _CATEGORY_MACROS.get(category, _DEFAULT_MACROS)
+    for attr in attrs:
+        p, f, c = _ATTRIBUTE_MACRO_FACTORS.get(attr, (1.0, 1.0, 1.0))
+        protein, fat, carbs = protein * p, fat * f, carbs * c
+    factor = _HEALTH_TAG_FACTORS.get(health_tag, 1.0)
+    protein, fat, carbs = round(protein * factor, 1), round(fat * factor, 1), round(carbs * factor, 1)
+    calories = int(round((4 * protein + 9 * fat + 4 * carbs) / 10) * 10)
+    return calories, protein, fat, carbs
+
+DB_WRITE_SECONDS = metrics.histogram(
+    "honeyeat_db_write_seconds",
+    "写语句与提交的总耗时（执行时间加上可能的等锁时间，等锁上限为连接的 timeout=10 秒）",
+)
+DB_LOCK_ERRORS = metrics.counter(
+    "honeyeat_db_lock_errors_total", "等待写锁超时（database is locked）的次数"
+)
+DB_STATEMENTS = metrics.counter(
+    "honeyeat_db_statements_total", "执行的 SQL 语句数", ("kind",)
+)
+
+
+def _is_write(sql):
+    return not sql.lstrip().upper().startswith(("SELECT", "PRAGMA", "WITH"))
+
+
+def _timed(kind, func, *args):
+    """执行数据库调用并上报指标；写操作的耗时计入写耗时直方图"""
+    DB_STATEMENTS.inc(kind=kind)
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    except sqlite3.OperationalError as e:
+        if "locked" in str(e):
+            DB_LOCK_ERRORS.inc()
+        raise
+    finally:
+        if kind != "read":
+            DB_WRITE_SECONDS.observe(time.perf_counter() - start)
+
+
+class MeteredCursor(sqlite3.Cursor):
+    """会上报语句数、写操作耗时的游标"""
+
+    def execute(self, sql, parameters=()):
+        kind = "write" if _is_write(sql) else "read"
+        return _timed(kind, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return _timed("write", super().executemany, sql, seq_of_parameters)
+
+
+class MeteredConnection(sqlite3.Connection):
+    """默认使用 MeteredCursor，并统计提交耗时"""
+
+    def cursor(self, factory=MeteredCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        return _timed("commit", super().commit)
+
+
 def get_connection():
     """获取数据库连接"""
     # check_same_thread=False 对于 Streamlit 的多线程环境是必要的
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=10)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=10, factory=MeteredConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
-def initialize_and_seed_database(conn):
+def create_user_data_tables(cursor):
     """
-    统一的数据库初始化函数。
-    如果数据库文件不存在，则创建所有表并填充所有默认数据。
-    这个函数会处理所有初始化逻辑，确保操作的原子性。
+    创建用户表和按用户存放数据的各表（冰箱、饮食历史、打卡、待买清单、菜谱、黑名单）。
+    正式数据库和游客的内存数据库共用这份表结构。
     """
-    cursor = conn.cursor()
-    
     # 用户表
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -28,31 +238,8 @@ def initialize_and_seed_database(conn):
             password TEXT NOT NULL,
             preferences TEXT DEFAULT '{}',
             avatar BLOB,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    
-    # 检查并添加 avatar 列（用于兼容旧数据库）
-    cursor.execute("PRAGMA table_info(users)")
-    columns = [info[1] for info in cursor.fetchall()]
-    if 'avatar' not in columns:
-        cursor.execute("ALTER TABLE users ADD COLUMN avatar BLOB")
-    # 兼容性修改：如果旧的 password_hash 列存在，则重命名为 password
-    if 'password_hash' in columns and 'password' not in columns:
-        # 在重命名之前，需要禁用外键约束
-        cursor.execute("PRAGMA foreign_keys=off")
-        cursor.execute("ALTER TABLE users RENAME COLUMN password_hash TO password")
-    
-    # 食物全库
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS foods (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            category TEXT NOT NULL,
-            cost_level TEXT DEFAULT '$$',
-            health_tag TEXT,
-            recipe_link TEXT,
-            active INTEGER DEFAULT 1,
+            prefs_version INTEGER NOT NULL DEFAULT 0,
+            data_version INTEGER NOT NULL DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
@@ -65,10 +252,22 @@ def initialize_and_seed_database(conn):
             food_name TEXT NOT NULL,
             quantity INTEGER DEFAULT 0,
             status TEXT DEFAULT '充足',
+            purchased_on DATE,
+            expiry DATE,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (user_id) REFERENCES users(username)
         )
     """)
+    # 兼容旧数据库：先补上购买/过期日期列，再建按过期日期的索引
+    cursor.execute("PRAGMA table_info(pantry)")
+    pantry_columns = [info[1] for info in cursor.fetchall()]
+    for column in ("purchased_on", "expiry"):
+        if column not in pantry_columns:
+            cursor.execute(f"ALTER TABLE pantry ADD COLUMN {column} DATE")
+    # 按用户和过期日期做范围查询，找出快过期的食材（更早的旧库还没有 user_id 列，
+    # 由 initialize_and_seed_database 补上该列后再建）
+    if 'user_id' in pantry_columns:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_pantry_user_expiry ON pantry(user_id, expiry)")
     
     # 饮食历史
     cursor.execute("""
@@ -127,6 +326,273 @@ def initialize_and_seed_database(conn):
         )
     """)
 
+    # 用户黑名单（主键 (user_id, food_id) 即索引，推荐时用反连接排除）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_blacklist (
+            user_id TEXT NOT NULL,
+            food_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, food_id),
+            FOREIGN KEY (user_id) REFERENCES users(username),
+            FOREIGN KEY (food_id) REFERENCES foods(id)
+        )
+    """)
+
+    # 推荐时按用户和日期排除最近吃过的食物
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_eat_history_user_date ON eat_history(user_id, date)")
+
+    # 按时间指数衰减的饮食频次：kind 为 'food'（key 为食物 id）或 'category'（key 为分类名）。
+    # score 为截至 day（公历序数日）的衰减计数，读取时再按流逝的天数继续衰减
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS eat_frequency (
+            user_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            score REAL NOT NULL,
+            day INTEGER NOT NULL,
+            PRIMARY KEY (user_id, kind, key),
+            FOREIGN KEY (user_id) REFERENCES users(username)
+        )
+    """)
+
+    # 全站热门食物的 Space-Saving 计数器：每天一组，每组至多 TRENDING_CAPACITY 行。
+    # 真实次数在 [count - error, count] 之间；只保留最近 TRENDING_WINDOW_DAYS 天
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS trending_foods (
+            day DATE NOT NULL,
+            food_id INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            error INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, food_id)
+        )
+    """)
+
+    # 从打分中学到的个人口味权重（float32 向量的字节串），feature_version 对应特征布局
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_weights (
+            user_id TEXT PRIMARY KEY,
+            feature_version INTEGER NOT NULL,
+            weights BLOB NOT NULL,
+            n_ratings INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(username)
+        )
+    """)
+
+    # 预先算好的推荐：每个用户每个时间段一行，food_ids 为按分数排好序的 [[食物id, 分数], ...]；
+    # 记录计算时的各版本号，任一变化即视为过期
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS recommendation_cache (
+            user_id TEXT NOT NULL,
+            time_slot TEXT NOT NULL,
+            food_ids TEXT NOT NULL,
+            prefs_version INTEGER NOT NULL,
+            data_version INTEGER NOT NULL,
+            catalog_version INTEGER NOT NULL,
+            computed_on DATE NOT NULL,
+            PRIMARY KEY (user_id, time_slot),
+            FOREIGN KEY (user_id) REFERENCES users(username)
+        )
+    """)
+
+    # 一周菜单：每天每餐一行
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS meal_plan (
+            user_id TEXT NOT NULL,
+            date DATE NOT NULL,
+            meal_time TEXT NOT NULL,
+            food_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, date, meal_time),
+            FOREIGN KEY (user_id) REFERENCES users(username),
+            FOREIGN KEY (food_id) REFERENCES foods(id)
+        )
+    """)
+
+    # 冰箱食材的消耗记录：库存数量每减少一次记一行（由触发器写入，无论来自 ➖ 按钮还是做菜）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pantry_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            food_name TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            day DATE NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(username)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pantry_usage_user_day ON pantry_usage(user_id, day)")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_pantry_usage
+        AFTER UPDATE OF quantity ON pantry
+        WHEN NEW.quantity < OLD.quantity
+        BEGIN
+            INSERT INTO pantry_usage (user_id, food_name, amount, day)
+            VALUES (NEW.user_id, NEW.food_name, OLD.quantity - NEW.quantity, date('now', 'localtime'));
+        END
+    """)
+
+    # 夜间批处理算好的库存预测：每个用户每种食材一行，run_out_on 为预计用完的日期（没有消耗记录时为空）
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pantry_forecast (
+            user_id TEXT NOT NULL,
+            food_name TEXT NOT NULL,
+            stock INTEGER NOT NULL,
+            daily_rate REAL NOT NULL,
+            run_out_on DATE,
+            computed_on DATE NOT NULL,
+            PRIMARY KEY (user_id, food_name),
+            FOREIGN KEY (user_id) REFERENCES users(username)
+        )
+    """)
+
+    # 夜间批处理最近一次把某种食材加入待买清单的日期：清单条目被删掉或勾掉后，
+    # 在这之后没有新的消耗就不再加回去
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pantry_restock (
+            user_id TEXT NOT NULL,
+            food_name TEXT NOT NULL,
+            restocked_on DATE NOT NULL,
+            PRIMARY KEY (user_id, food_name),
+            FOREIGN KEY (user_id) REFERENCES users(username)
+        )
+    """)
+
+    # 饮食记录/黑名单变化时递增用户的 data_version，使预计算的推荐失效
+    for table, events in (("eat_history", ("INSERT", "UPDATE", "DELETE")), ("user_blacklist", ("INSERT", "DELETE"))):
+        for event in events:
+            row = "OLD" if event == "DELETE" else "NEW"
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_data_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE users SET data_version = data_version + 1 WHERE username = {row}.user_id;
+                END
+            """)
+
+def initialize_and_seed_database(conn):
+    """
+    统一的数据库初始化函数。
+    如果数据库文件不存在，则创建所有表并填充所有默认数据。
+    这个函数会处理所有初始化逻辑，确保操作的原子性。
+    """
+    cursor = conn.cursor()
+    
+    create_user_data_tables(cursor)
+    
+    # 检查并添加 avatar 列（用于兼容旧数据库）
+    cursor.execute("PRAGMA table_info(users)")
+    columns = [info[1] for info in cursor.fetchall()]
+    if 'avatar' not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN avatar BLOB")
+    # 偏好版本号：每次修改偏好加一，用于偏好缓存失效
+    if 'prefs_version' not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN prefs_version INTEGER NOT NULL DEFAULT 0")
+    # 饮食记录/黑名单版本号：由触发器维护，用于预计算推荐的失效判断
+    if 'data_version' not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0")
+    # 兼容性修改：如果旧的 password_hash 列存在，则重命名为 password
+    if 'password_hash' in columns and 'password' not in columns:
+        # 在重命名之前，需要禁用外键约束
+        cursor.execute("PRAGMA foreign_keys=off")
+        cursor.execute("ALTER TABLE users RENAME COLUMN password_hash TO password")
+    
+    # 食物全库
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS foods (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            category TEXT NOT NULL,
+            cost_level TEXT DEFAULT '$$',
+            health_tag TEXT,
+            recipe_link TEXT,
+            active INTEGER DEFAULT 1,
+            attr_mask INTEGER,
+            calories INTEGER,
+            protein REAL,
+            fat REAL,
+            carbs REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # 全局计数器（如食物库版本号），供缓存判断是否失效
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('catalog_version', 0)")
+
+    # 食物属性（多对多），编译为 foods.attr_mask 位掩码供筛选使用
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS food_attributes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            bit INTEGER NOT NULL UNIQUE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS food_attribute_links (
+            food_id INTEGER NOT NULL,
+            attribute_id INTEGER NOT NULL,
+            PRIMARY KEY (food_id, attribute_id),
+            FOREIGN KEY (food_id) REFERENCES foods(id),
+            FOREIGN KEY (attribute_id) REFERENCES food_attributes(id)
+        )
+    """)
+    cursor.executemany(
+        "INSERT OR IGNORE INTO food_attributes (name, bit) VALUES (?, ?)", FOOD_ATTRIBUTES.items()
+    )
+
+    cursor.execute("PRAGMA table_info(foods)")
+    food_columns = [info[1] for info in cursor.fetchall()]
+    if 'attr_mask' not in food_columns:
+        # NULL 表示尚未分配属性，初始化时会按规则推断
+        cursor.execute("ALTER TABLE foods ADD COLUMN attr_mask INTEGER")
+    for column, sql_type in (("calories", "INTEGER"), ("protein", "REAL"), ("fat", "REAL"), ("carbs", "REAL")):
+        if column not in food_columns:
+            # 每份的热量（千卡）与三大营养素（克），NULL 表示尚未填写，初始化时会按规则估算
+            cursor.execute(f"ALTER TABLE foods ADD COLUMN {column} {sql_type}")
+    # (active, attr_mask) 索引覆盖了候选查询（id 即 rowid），位运算筛选只需扫描这棵窄索引
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_foods_active_mask ON foods(active, attr_mask)")
+
+    # 属性关联变化时重新编译该食物的位掩码；删除食物时一并删除关联
+    mask_sql = """
+        UPDATE foods SET attr_mask = (
+            SELECT COALESCE(SUM(1 << a.bit), 0)
+            FROM food_attribute_links l JOIN food_attributes a ON a.id = l.attribute_id
+            WHERE l.food_id = {ref}.food_id
+        ) WHERE id = {ref}.food_id;
+    """
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS food_attribute_links_insert
+        AFTER INSERT ON food_attribute_links
+        BEGIN {mask_sql.format(ref="NEW")} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS food_attribute_links_delete
+        AFTER DELETE ON food_attribute_links
+        BEGIN {mask_sql.format(ref="OLD")} END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS foods_delete_attribute_links
+        AFTER DELETE ON foods
+        BEGIN
+            DELETE FROM food_attribute_links WHERE food_id = OLD.id;
+        END
+    """)
+
+    # 食物库任何改动都会让 catalog_version 加一（无论改动来自哪段代码）
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS foods_catalog_version_{event.lower()}
+            AFTER {event} ON foods
+            BEGIN
+                UPDATE app_meta SET value = value + 1 WHERE key = 'catalog_version';
+            END
+        """)
+
     # --- 数据库迁移脚本 (用于兼容旧数据库) ---
     # 检查并为 shopping_list 表添加 user_id 列
     cursor.execute("PRAGMA table_info(shopping_list)")
@@ -141,6 +607,7 @@ def initialize_and_seed_database(conn):
     if 'user_id' not in pantry_columns and pantry_columns: # 增加 pantry_columns 是否为空的判断
         # 添加列，并为现有数据设置一个默认值
         cursor.execute("ALTER TABLE pantry ADD COLUMN user_id TEXT NOT NULL DEFAULT 'admin'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pantry_user_expiry ON pantry(user_id, expiry)")
 
     # --- 步骤 2: 填充默认数据 (在同一个连接下) ---
     
@@ -299,9 +766,652 @@ def initialize_and_seed_database(conn):
     except Exception as e:
         print(f"插入默认食物数据出错: {e}")
 
+    # 为尚未分配属性的食物（默认数据和旧数据库中的食物）按规则推断属性
+    cursor.execute("SELECT id, name, category, health_tag FROM foods WHERE attr_mask IS NULL")
+    for food in cursor.fetchall():
+        _replace_food_attributes(
+            cursor, food['id'], derive_food_attributes(food['name'], food['category'], food['health_tag'])
+        )
+
+    # 迁移：旧版规则把名称里看不出荤腥的食物都标成素食、带“烤”字的都标成烧烤，
+    # 按当前规则复核这两个属性（只去掉、不新增；确实是素食的可以在编辑里手动勾选）
+    cursor.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('attribute_rules', 0)")
+    cursor.execute("SELECT value FROM app_meta WHERE key = 'attribute_rules'")
+    if cursor.fetchone()['value'] < ATTRIBUTE_RULES_VERSION:
+        cursor.execute("SELECT id, name, category, health_tag, attr_mask FROM foods")
+        for food in cursor.fetchall():
+            attrs = set(attribute_names(food['attr_mask']))
+            derived = derive_food_attributes(food['name'], food['category'], food['health_tag'])
+            stale = {attr for attr in ("素食", "烧烤") if attr in attrs and attr not in derived}
+            if stale:
+                _replace_food_attributes(cursor, food['id'], attrs - stale)
+        cursor.execute(
+            "UPDATE app_meta SET value = ? WHERE key = 'attribute_rules'", (ATTRIBUTE_RULES_VERSION,)
+        )
+
+    # 为尚未填写营养的食物按分类和属性估算
+    cursor.execute("SELECT id, name, category, health_tag, attr_mask FROM foods WHERE calories IS NULL")
+    cursor.executemany(
+        "UPDATE foods SET calories = ?, protein = ?, fat = ?, carbs = ? WHERE id = ?",
+        [
+            (*estimate_nutrition(food['name'], food['category'], food['health_tag'], attribute_names(food['attr_mask'])),
+             food['id'])
+            for food in cursor.fetchall()
+        ],
+    )
+
+    # 迁移：把旧版存在 preferences.blacklist 里的食物名搬到 user_blacklist 表
+    # （只有与食物库名称完全一致的条目才会生效，这与旧逻辑一致）
+    cursor.execute("""
+        INSERT OR IGNORE INTO user_blacklist (user_id, food_id)
+        SELECT u.username, f.id
+        FROM users u,
+             json_each(CASE WHEN json_valid(u.preferences) THEN u.preferences ELSE '{}' END, '$.blacklist') b
+        JOIN foods f ON f.name = b.value
+    """)
+    cursor.execute("""
+        UPDATE users
+        SET preferences = json_remove(preferences, '$.blacklist'), prefs_version = prefs_version + 1
+        WHERE json_valid(preferences) AND json_type(preferences, '$.blacklist') IS NOT NULL
+    """)
+
+    # 迁移：根据已有的饮食记录一次性生成衰减频次（之后随每次记录增量更新）
+    if cursor.execute("SELECT 1 FROM eat_frequency LIMIT 1").fetchone() is None:
+        _rebuild_eat_frequency(cursor)
+    # 迁移：全站热门计数器同理，用窗口内的饮食记录生成一次
+    if cursor.execute("SELECT 1 FROM trending_foods LIMIT 1").fetchone() is None:
+        _rebuild_trending_foods(cursor)
+
     # --- 步骤 3: 提交并关闭 ---
     conn.commit()
 
+# ============ 食物库缓存 ============
+_catalog_cache = {"version": None, "foods": [], "by_id": {}}
+
+def get_catalog_version(conn):
+    """获取食物库版本号（由触发器维护）"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM app_meta WHERE key = 'catalog_version'")
+    row = cursor.fetchone()
+    return row['value'] if row else 0
+
+def _load_catalog(conn):
+    """按需（重新）加载食物库缓存"""
+    version = get_catalog_version(conn)
+    if _catalog_cache["version"] != version:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM foods")
+        by_id = {row['id']: dict(row) for row in cursor.fetchall()}
+        _catalog_cache["by_id"] = by_id
+        _catalog_cache["foods"] = [food for food in by_id.values() if food['active']]
+        _catalog_cache["version"] = version
+    return _catalog_cache
+
+def get_catalog(conn):
+    """获取 (食物库版本号, {id: 食物})，包含已停用的食物；返回的字典共享，不要修改"""
+    catalog = _load_catalog(conn)
+    return catalog["version"], catalog["by_id"]
+
+def get_active_foods(conn):
+    """
+    获取所有已启用的食物（进程内缓存，食物库版本变化时自动重新加载）。
+    返回的列表在多个会话间共享，调用方不要修改其中的元素。
+    """
+    return _load_catalog(conn)["foods"]
+
+def get_foods_by_ids(conn, food_ids):
+    """按 id 从食物库缓存取食物（保持传入顺序，已删除的 id 会被跳过）"""
+    by_id = _load_catalog(conn)["by_id"]
+    return [by_id[food_id] for food_id in food_ids if food_id in by_id]
+
+def get_recommendation_candidates(conn, user_id, require_mask=0, avoid_mask=0):
+    """
+    获取推荐候选：已启用、不在用户黑名单中的食物。
+    require_mask / avoid_mask 为属性位掩码：候选必须具备前者的全部属性、不能具备后者的任何属性。
+    排除条件都在 SQL 中完成（位运算 + NOT EXISTS 反连接），
+    只取回 id，食物详情从缓存中补齐。
+    """
+    query = """
+        SELECT f.id FROM foods f
+        WHERE f.active = 1
+          AND (IFNULL(f.attr_mask, 0) & ?) = ? AND (IFNULL(f.attr_mask, 0) & ?) = 0
+          AND NOT EXISTS (SELECT 1 FROM user_blacklist b WHERE b.user_id = ? AND b.food_id = f.id)
+    """
+    params = [require_mask, require_mask, avoid_mask, user_id]
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    return get_foods_by_ids(conn, [row['id'] for row in cursor.fetchall()])
+
+# ============ 食物属性 ============
+def _replace_food_attributes(cursor, food_id, names):
+    """替换食物的属性关联（不提交），触发器会重新编译 attr_mask"""
+    cursor.execute("DELETE FROM food_attribute_links WHERE food_id = ?", (food_id,))
+    cursor.executemany("""
+        INSERT INTO food_attribute_links (food_id, attribute_id)
+        SELECT ?, id FROM food_attributes WHERE name = ?
+    """, [(food_id, name) for name in names])
+    # 没有任何属性时触发器不会执行，显式写 0 表示“已分配”
+    cursor.execute("UPDATE foods SET attr_mask = COALESCE(attr_mask, 0) WHERE id = ?", (food_id,))
+
+def set_food_attributes(conn, food_id, names):
+    """设置食物的属性"""
+    _replace_food_attributes(conn.cursor(), food_id, names)
+    conn.commit()
+
+def add_foods(conn, foods):
+    """
+    在同一个事务里添加食物（提交）：foods 为 [(名称, 分类, 价位, 健康标签, 属性列表或 None)]。
+    属性为 None 时按名称推断，营养按分类和属性估算；名称已存在的跳过。返回实际添加的名称列表
+    """
+    cursor = conn.cursor()
+    added = []
+    try:
+        for name, category, cost_level, health_tag, attrs in foods:
+            cursor.execute("""
+                INSERT OR IGNORE INTO foods (name, category, cost_level, health_tag, active)
+                VALUES (?, ?, ?, ?, 1)
+            """, (name, category, cost_level, health_tag))
+            if cursor.rowcount == 0:
+                continue
+            food_id = cursor.lastrowid
+            attrs = attrs or derive_food_attributes(name, category, health_tag)
+            _replace_food_attributes(cursor, food_id, attrs)
+            cursor.execute(
+                "UPDATE foods SET calories = ?, protein = ?, fat = ?, carbs = ? WHERE id = ?",
+                (*estimate_nutrition(name, category, health_tag, attrs), food_id),
+            )
+            added.append(name)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return added
+
+# ============ 营养 ============
+def set_food_nutrition(conn, food_id, calories, protein=None, fat=None, carbs=None):
+    """设置食物每份的热量（千卡）和三大营养素（克）"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE foods SET calories = ?, protein = ?, fat = ?, carbs = ? WHERE id = ?",
+        (calories, protein, fat, carbs, food_id),
+    )
+    conn.commit()
+
+def get_calories_eaten(conn, user_id, day=None):
+    """某天（默认今天）已记录的饮食合计热量（千卡），没填营养的食物不计"""
+    day = day or date.today()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT COALESCE(SUM(f.calories), 0) AS total
+        FROM eat_history e JOIN foods f ON f.id = e.food_id
+        WHERE e.user_id = ? AND e.date = ?
+    """, (user_id, day.isoformat()))
+    return cursor.fetchone()['total']
+
+# ============ 黑名单 ============
+def get_blacklist(conn, user_id):
+    """获取用户黑名单（按加入时间倒序）"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT b.food_id, f.name
+        FROM user_blacklist b JOIN foods f ON f.id = b.food_id
+        WHERE b.user_id = ?
+        ORDER BY b.created_at DESC
+    """, (user_id,))
+    return [dict(row) for row in cursor.fetchall()]
+
+def add_to_blacklist(conn, user_id, food_id):
+    """把食物加入黑名单，已存在时忽略"""
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR IGNORE INTO user_blacklist (user_id, food_id) VALUES (?, ?)", (user_id, food_id))
+    conn.commit()
+
+def remove_from_blacklist(conn, user_id, food_id):
+    """把食物移出黑名单"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM user_blacklist WHERE user_id = ? AND food_id = ?", (user_id, food_id))
+    conn.commit()
+
+# ============ 饮食记录与衰减频次 ============
+FREQUENCY_HALF_LIFE_DAYS = 3  # 频次的半衰期：3 天前吃的一顿只算半顿
+
+def _decay(score, days):
+    return score * 0.5 ** (max(days, 0) / FREQUENCY_HALF_LIFE_DAYS)
+
+def _bump_frequency(cursor, user_id, kind, key, day):
+    """把一次用餐计入衰减频次：旧值衰减到 day 后加一，只读写一行"""
+    cursor.execute(
+        "SELECT score, day FROM eat_frequency WHERE user_id = ? AND kind = ? AND key = ?",
+        (user_id, kind, str(key)),
+    )
+    row = cursor.fetchone()
+    if row is None:
+        score = 1.0
+    elif day >= row['day']:
+        score = _decay(row['score'], day - row['day']) + 1
+    else:
+        # 补记更早的一餐：折算到已有记录的日期上
+        score, day = row['score'] + _decay(1.0, row['day'] - day), row['day']
+    cursor.execute(
+        "INSERT OR REPLACE INTO eat_frequency (user_id, kind, key, score, day) VALUES (?, ?, ?, ?, ?)",
+        (user_id, kind, str(key), score, day),
+    )
+
+def _rebuild_eat_frequency(cursor, user_id=None):
+    """根据 eat_history 全量重建衰减频次（仅迁移/导入数据后使用，不提交）"""
+    params = () if user_id is None else (user_id,)
+    where = "" if user_id is None else "WHERE e.user_id = ?"
+    cursor.execute(f"DELETE FROM eat_frequency {'' if user_id is None else 'WHERE user_id = ?'}", params)
+    cursor.execute(f"""
+        SELECT e.user_id, e.food_id, f.category, e.date
+        FROM eat_history e LEFT JOIN foods f ON f.id = e.food_id
+        {where}
+    """, params)
+    today = date.today().toordinal()
+    totals = {}
+    for row in cursor.fetchall():
+        try:
+            weight = _decay(1.0, today - date.fromisoformat(str(row['date'])[:10]).toordinal())
+        except ValueError:
+            continue
+        for kind, key in (("food", row['food_id']), ("category", row['category'])):
+            if key is not None:
+                k = (row['user_id'], kind, str(key))
+                totals[k] = totals.get(k, 0.0) + weight
+    cursor.executemany(
+        "INSERT INTO eat_frequency (user_id, kind, key, score, day) VALUES (?, ?, ?, ?, ?)",
+        [(*k, score, today) for k, score in totals.items()],
+    )
+
+def rebuild_eat_frequency(conn, user_id=None):
+    """根据 eat_history 全量重建衰减频次（批量导入饮食记录后调用）"""
+    _rebuild_eat_frequency(conn.cursor(), user_id)
+    conn.commit()
+
+def _insert_meal(cursor, user_id, food, meal_time, rating=None, mode=None, day=None):
+    """写入一条 eat_history 并更新衰减频次和全站热门计数（不提交）；food 没有 id 时只记菜名"""
+    day = day or date.today()
+    cursor.execute("""
+        INSERT INTO eat_history (date, meal_time, food_id, food_name, user_id, rating, mode)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (day.isoformat(), meal_time, food.get('id'), food['name'], user_id, rating, mode))
+    if food.get('id') is not None:
+        _bump_frequency(cursor, user_id, "food", food['id'], day.toordinal())
+        _count_trending(cursor, food['id'], day)
+    if food.get('category'):
+        _bump_frequency(cursor, user_id, "category", food['category'], day.toordinal())
+
+def record_meal(conn, user_id, food, meal_time, rating=None, mode=None, day=None):
+    """
+    记录一餐：写入 eat_history，并以 O(1) 更新该食物和所属分类的衰减频次（提交）
+    """
+    _insert_meal(conn.cursor(), user_id, dict(food), meal_time, rating, mode, day)
+    conn.commit()
+
+def get_eat_frequency(conn, user_id):
+    """
+    获取用户当前的衰减频次：{'food': {食物id: 分数}, 'category': {分类: 分数}}。
+    只读该用户的频次表（每个吃过的食物/分类一行），不扫描饮食历史。
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT kind, key, score, day FROM eat_frequency WHERE user_id = ?", (user_id,))
+    today = date.today().toordinal()
+    frequency = {"food": {}, "category": {}}
+    for row in cursor.fetchall():
+        key = int(row['key']) if row['kind'] == "food" else row['key']
+        frequency[row['kind']][key] = _decay(row['score'], today - row['day'])
+    return frequency
+
+def get_meals_after(conn, after_id=0):
+    """id 大于 after_id 的用餐记录 [(id, user_id, food_id)]（按主键范围读取，只取有食物 id 的）"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, user_id, food_id FROM eat_history WHERE id > ? AND food_id IS NOT NULL ORDER BY id",
+        (after_id,),
+    )
+    return [(row['id'], row['user_id'], row['food_id']) for row in cursor.fetchall()]
+
+# ============ 全站热门 ============
+TRENDING_WINDOW_DAYS = 7  # “大家最近都在吃”统计最近这么多天
+TRENDING_CAPACITY = 50    # 每天至多为这么多个食物计数
+
+def _count_trending(cursor, food_id, day):
+    """
+    把一餐计入当天的 Space-Saving 计数器（不提交）：已有计数器的食物加一；当天没满时新开一个；
+    满了就把计数最小的那个让给它，计数为最小值加一、误差记为原来的最小值。
+    每次只读写当天那一组（至多 TRENDING_CAPACITY 行），顺便删掉滑出窗口的日子
+    """
+    window_start = (date.today() - timedelta(days=TRENDING_WINDOW_DAYS - 1)).isoformat()
+    cursor.execute("DELETE FROM trending_foods WHERE day < ?", (window_start,))
+    day = day.isoformat()
+    if day < window_start:
+        return
+    cursor.execute("UPDATE trending_foods SET count = count + 1 WHERE day = ? AND food_id = ?", (day, food_id))
+    if cursor.rowcount:
+        return
+    cursor.execute("SELECT COUNT(*) FROM trending_foods WHERE day = ?", (day,))
+    if cursor.fetchone()[0] < TRENDING_CAPACITY:
+        cursor.execute("INSERT INTO trending_foods (day, food_id, count, error) VALUES (?, ?, 1, 0)", (day, food_id))
+        return
+    # SET 右边都取更新前的值：error = 原最小值，count = 原最小值 + 1
+    cursor.execute("""
+        UPDATE trending_foods SET food_id = ?, error = count, count = count + 1
+        WHERE day = ? AND food_id = (
+            SELECT food_id FROM trending_foods WHERE day = ? ORDER BY count, food_id LIMIT 1
+        )
+    """, (food_id, day, day))
+
+def _rebuild_trending_foods(cursor):
+    """用窗口内的饮食记录重建热门计数器（精确计数，每天保留前 TRENDING_CAPACITY 个；仅迁移/导入数据后使用，不提交）"""
+    window_start = (date.today() - timedelta(days=TRENDING_WINDOW_DAYS - 1)).isoformat()
+    cursor.execute("DELETE FROM trending_foods")
+    cursor.execute("""
+        INSERT INTO trending_foods (day, food_id, count, error)
+        SELECT day, food_id, n, 0 FROM (
+            SELECT date AS day, food_id, COUNT(*) AS n,
+                   ROW_NUMBER() OVER (PARTITION BY date ORDER BY COUNT(*) DESC, food_id) AS rank
+            FROM eat_history
+            WHERE date >= ? AND food_id IS NOT NULL
+            GROUP BY date, food_id
+        )
+        WHERE rank <= ?
+    """, (window_start, TRENDING_CAPACITY))
+
+def rebuild_trending_foods(conn):
+    """用窗口内的饮食记录重建热门计数器（批量导入饮食记录后调用）"""
+    _rebuild_trending_foods(conn.cursor())
+    conn.commit()
+
+def get_trending_foods(conn, limit=10):
+    """
+    最近 TRENDING_WINDOW_DAYS 天全站吃得最多的食物 [(食物id, 次数)]，次数为计数器的估计值（可能略偏高）。
+    只汇总计数器表（至多 窗口天数 × TRENDING_CAPACITY 行），不扫描饮食历史
+    """
+    window_start = (date.today() - timedelta(days=TRENDING_WINDOW_DAYS - 1)).isoformat()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT food_id, SUM(count) AS total FROM trending_foods
+        WHERE day >= ?
+        GROUP BY food_id
+        ORDER BY total DESC, food_id
+        LIMIT ?
+    """, (window_start, limit))
+    return [(row['food_id'], row['total']) for row in cursor.fetchall()]
+
+# ============ 个人口味权重 ============
+def get_rated_meals(conn, user_id=None):
+    """获取带评分的用餐记录 [(user_id, food_id, rating)]，按记录顺序"""
+    query = "SELECT user_id, food_id, rating FROM eat_history WHERE rating IS NOT NULL AND food_id IS NOT NULL"
+    params = ()
+    if user_id is not None:
+        query += " AND user_id = ?"
+        params = (user_id,)
+    cursor = conn.cursor()
+    cursor.execute(query + " ORDER BY id", params)
+    return [(row['user_id'], row['food_id'], row['rating']) for row in cursor.fetchall()]
+
+def get_user_weights(conn, user_id):
+    """读取用户的口味权重：(feature_version, 权重字节串, 评分条数) 或 None"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT feature_version, weights, n_ratings FROM user_weights WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    return (row['feature_version'], row['weights'], row['n_ratings']) if row else None
+
+def save_user_weights(conn, user_id, feature_version, weights, n_ratings):
+    """写入（覆盖）用户的口味权重（不提交）"""
+    conn.execute("""
+        INSERT OR REPLACE INTO user_weights (user_id, feature_version, weights, n_ratings, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    """, (user_id, feature_version, weights, n_ratings))
+
+# ============ 冰箱、菜谱与一周菜单 ============
+# 冷藏保存的大致天数：按名称关键词匹配（先匹配先用），都不匹配时用默认值
+_SHELF_LIFE_RULES = (
+    (("鸡蛋", "皮蛋", "火腿", "胡萝卜", "洋葱", "土豆", "姜", "蒜"), 21),
+    (("木耳", "紫菜", "花生", "雪菜", "可乐"), 90),
+    (("豆腐", "牛奶", "酸奶", "面条"), 5),
+    (("生菜", "菠菜", "韭菜", "豆芽", "香菜", "葱"), 3),
+    (("鱼", "虾", "蟹", "贝"), 2),
+    (("肉", "排骨", "鸡", "牛", "羊", "鸭", "腩"), 3),
+    (("番茄", "黄瓜", "青椒", "茄子", "西兰花", "秋葵", "包菜", "冬瓜", "玉米", "四季豆"), 7),
+)
+_DEFAULT_SHELF_LIFE = 7
+EXPIRY_WARNING_DAYS = 3  # 这么多天内过期的食材算“快过期”
+
+def estimate_expiry(name, purchased_on=None):
+    """按食材名称估算过期日期（购买日期 + 大致保存天数）"""
+    purchased_on = purchased_on or date.today()
+    days = next((days for keywords, days in _SHELF_LIFE_RULES if any(k in name for k in keywords)),
+                _DEFAULT_SHELF_LIFE)
+    return date.fromordinal(purchased_on.toordinal() + days)
+
+def add_pantry_item(conn, user_id, name, quantity=1, expiry=None, purchased_on=None):
+    """往冰箱里添加食材（提交）；不指定过期日期时按名称估算"""
+    purchased_on = purchased_on or date.today()
+    expiry = expiry or estimate_expiry(name, purchased_on)
+    conn.execute("""
+        INSERT INTO pantry (food_name, quantity, status, user_id, purchased_on, expiry)
+        VALUES (?, ?, '充足', ?, ?, ?)
+    """, (name, quantity, user_id, purchased_on.isoformat(), expiry.isoformat()))
+    conn.commit()
+
+def get_pantry_ingredients(conn, user_id):
+    """冰箱里现有（数量大于 0）的食材名称集合"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT food_name FROM pantry WHERE quantity > 0 AND user_id = ?", (user_id,))
+    return {row['food_name'] for row in cursor.fetchall()}
+
+def cook_recipe(conn, user_id, dish, ingredients, meal_time, food=None, day=None):
+    """
+    做了一道菜：在同一个事务里把每样食材扣掉一份（同名多批时先扣最早过期的），
+    删除扣到 0 的行，并把这道菜记入 eat_history（提交；出错时整体回滚）。
+    food 为食物库里的同名食物（没有时为 None，只记菜名、不更新衰减频次）。
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.executemany("""
+            UPDATE pantry SET quantity = quantity - 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM pantry WHERE user_id = ? AND food_name = ? AND quantity > 0
+                ORDER BY expiry IS NULL, expiry LIMIT 1
+            )
+        """, [(user_id, item) for item in set(ingredients)])
+        cursor.execute("DELETE FROM pantry WHERE user_id = ? AND quantity <= 0", (user_id,))
+        _insert_meal(cursor, user_id, dict(food) if food else {'name': dish}, meal_time, mode='pantry', day=day)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+def get_expiring_items(conn, user_id, within_days=EXPIRY_WARNING_DAYS, today=None):
+    """
+    within_days 天内（含已经过期）会过期的食材，按过期日期从早到晚：
+    [{'id', 'name', 'quantity', 'expiry', 'days_left'}]。
+    走 (user_id, expiry) 索引做范围查询，结果已按过期日期排好序，不扫描整个冰箱。
+    """
+    today = today or date.today()
+    horizon = date.fromordinal(today.toordinal() + within_days)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, food_name, quantity, expiry FROM pantry
+        WHERE user_id = ? AND expiry IS NOT NULL AND expiry <= ? AND quantity > 0
+        ORDER BY expiry
+    """, (user_id, horizon.isoformat()))
+    items = []
+    for row in cursor.fetchall():
+        try:
+            expiry = date.fromisoformat(str(row['expiry'])[:10])
+        except ValueError:
+            continue
+        items.append({
+            'id': row['id'], 'name': row['food_name'], 'quantity': row['quantity'],
+            'expiry': expiry, 'days_left': expiry.toordinal() - today.toordinal(),
+        })
+    return items
+
+def get_user_recipes(conn, user_id):
+    """用户自定义菜谱 {菜名: [食材]}（食材 JSON 格式错误的跳过）"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT recipe_name, ingredients FROM user_recipes WHERE user_id = ?", (user_id,))
+    recipes = {}
+    for row in cursor.fetchall():
+        try:
+            recipes[row['recipe_name']] = json.loads(row['ingredients'])
+        except json.JSONDecodeError:
+            continue
+    return recipes
+
+def get_meal_plan(conn, user_id, start, days=7):
+    """读取从 start 起 days 天的菜单：{(日期字符串, 餐次): 食物id}"""
+    end = date.fromordinal(start.toordinal() + days - 1)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT date, meal_time, food_id FROM meal_plan WHERE user_id = ? AND date BETWEEN ? AND ?",
+        (user_id, start.isoformat(), end.isoformat()),
+    )
+    return {(row['date'], row['meal_time']): row['food_id'] for row in cursor.fetchall()}
+
+def save_meal_plan(conn, user_id, entries, shopping):
+    """
+    在同一个事务里保存菜单并把缺少的食材加入待买清单（提交；出错时整体回滚）。
+    entries 为 [(日期, 餐次, 食物id)]，覆盖这些日期原有的菜单；
+    shopping 为 {食材: 份数}，清单里已有未买的同名条目时累加数量。
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            "DELETE FROM meal_plan WHERE user_id = ? AND date = ?",
+            [(user_id, day) for day in sorted({day.isoformat() for day, _, _ in entries})],
+        )
+        cursor.executemany(
+            "INSERT INTO meal_plan (user_id, date, meal_time, food_id) VALUES (?, ?, ?, ?)",
+            [(user_id, day.isoformat(), meal_time, food_id) for day, meal_time, food_id in entries],
+        )
+        for item, quantity in shopping.items():
+            cursor.execute(
+                """
+                UPDATE shopping_list SET quantity = quantity + ?
+                WHERE id = (SELECT id FROM shopping_list WHERE user_id = ? AND item_name = ? AND is_bought = 0 LIMIT 1)
+                """,
+                (quantity, user_id, item),
+            )
+            if cursor.rowcount == 0:
+                cursor.execute(
+                    "INSERT INTO shopping_list (item_name, user_id, quantity) VALUES (?, ?, ?)",
+                    (item, user_id, quantity),
+                )
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+# ============ 库存消耗预测 ============
+def get_pantry_usage(conn, since, user_id=None):
+    """since 以来的消耗记录 [(user_id, 食材, 数量, 日期字符串)]（不含游客）"""
+    where, params = ("user_id = ?", (user_id,)) if user_id is not None else ("user_id != ?", (GUEST_USER,))
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT user_id, food_name, amount, day FROM pantry_usage WHERE {where} AND day >= ?",
+        (*params, since.isoformat()),
+    )
+    return [(row['user_id'], row['food_name'], row['amount'], row['day']) for row in cursor.fetchall()]
+
+def get_pantry_stock(conn, user_id=None):
+    """现有库存 [(user_id, 食材, 总数量, 最早购买日期字符串或 None)]，同名多批合并（不含游客）"""
+    where, params = ("user_id = ?", (user_id,)) if user_id is not None else ("user_id != ?", (GUEST_USER,))
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT user_id, food_name, SUM(quantity) AS stock, MIN(purchased_on) AS purchased_on
+        FROM pantry WHERE {where} AND quantity > 0
+        GROUP BY user_id, food_name
+    """, params)
+    return [(row['user_id'], row['food_name'], row['stock'], row['purchased_on']) for row in cursor.fetchall()]
+
+def save_pantry_forecast(conn, rows, computed_on, user_id=None):
+    """
+    用新算出的预测覆盖旧结果（不提交）：rows 为 [(user_id, 食材, 库存, 每天用量, 用完日期或 None)]。
+    user_id 为 None 时覆盖全部用户
+    """
+    if user_id is None:
+        conn.execute("DELETE FROM pantry_forecast")
+    else:
+        conn.execute("DELETE FROM pantry_forecast WHERE user_id = ?", (user_id,))
+    conn.executemany("""
+        INSERT INTO pantry_forecast (user_id, food_name, stock, daily_rate, run_out_on, computed_on)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(*row[:4], row[4].isoformat() if row[4] else None, computed_on.isoformat()) for row in rows])
+
+def get_pantry_forecast(conn, user_id):
+    """读取用户的库存预测 {食材: {'daily_rate', 'run_out_on'}}，run_out_on 为 date 或 None"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT food_name, daily_rate, run_out_on FROM pantry_forecast WHERE user_id = ?", (user_id,))
+    return {
+        row['food_name']: {
+            'daily_rate': row['daily_rate'],
+            'run_out_on': date.fromisoformat(row['run_out_on']) if row['run_out_on'] else None,
+        }
+        for row in cursor.fetchall()
+    }
+
+def add_restock_items(conn, items, today):
+    """
+    把预计快用完的食材加入待买清单（不提交）：items 为 [(user_id, 食材, 数量, 最后一次消耗的日期)]。
+    跳过清单里已有未买同名条目的；也跳过上次补货之后没有新消耗的
+    （用户删掉或勾掉了自动加的条目，批处理每天重跑也不会再加回去）。返回新加的条数
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, item_name FROM shopping_list WHERE is_bought = 0")
+    pending = {(row['user_id'], row['item_name']) for row in cursor.fetchall()}
+    cursor.execute("SELECT user_id, food_name, restocked_on FROM pantry_restock")
+    restocked = {(row['user_id'], row['food_name']): row['restocked_on'] for row in cursor.fetchall()}
+    new_items = [
+        (item, user_id, quantity) for user_id, item, quantity, last_used in items
+        if (user_id, item) not in pending and restocked.get((user_id, item), "") < last_used.isoformat()
+    ]
+    cursor.executemany(
+        "INSERT INTO shopping_list (item_name, user_id, quantity, category) VALUES (?, ?, ?, '预计用完')", new_items
+    )
+    cursor.executemany(
+        "INSERT OR REPLACE INTO pantry_restock (user_id, food_name, restocked_on) VALUES (?, ?, ?)",
+        [(user_id, item, today.isoformat()) for item, user_id, _ in new_items],
+    )
+    return len(new_items)
+
+# ============ 预计算推荐 ============
+def get_recommendation_versions(conn, user_id):
+    """获取判断预计算推荐是否过期所需的版本号：(偏好, 饮食记录/黑名单, 食物库)"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT prefs_version, data_version,
+               (SELECT value FROM app_meta WHERE key = 'catalog_version') AS catalog_version
+        FROM users WHERE username = ?
+    """, (user_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return (row['prefs_version'], row['data_version'], row['catalog_version'] or 0)
+
+def get_recommendation_cache(conn, user_id, time_slot):
+    """读取预计算的推荐；返回 (版本号, 计算日期, [(食物id, 分数)]) 或 None"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT food_ids, prefs_version, data_version, catalog_version, computed_on
+        FROM recommendation_cache WHERE user_id = ? AND time_slot = ?
+    """, (user_id, time_slot))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    versions = (row['prefs_version'], row['data_version'], row['catalog_version'])
+    return versions, row['computed_on'], [tuple(entry) for entry in json.loads(row['food_ids'])]
+
+def save_recommendation_cache(conn, user_id, time_slot, entries, versions, computed_on):
+    """写入（覆盖）预计算的推荐（不提交）"""
+    conn.execute("""
+        INSERT OR REPLACE INTO recommendation_cache
+            (user_id, time_slot, food_ids, prefs_version, data_version, catalog_version, computed_on)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, time_slot, json.dumps(entries), *versions, computed_on))
+
 def create_user(conn, username, name, password, preferences=None):
     """创建用户"""
     cursor = conn.cursor()
@@ -335,26 +1445,74 @@ def verify_user(conn, username, password):
         else:
             return {"success": False, "message": "用户名不存在"}
 
+# 已解析的用户偏好缓存：username -> (prefs_version, preferences)
+_prefs_cache = {}
+
 def get_user_preferences(conn, username):
-    """获取用户偏好"""
+    """
+    获取用户偏好。
+    解析结果按用户缓存，只有 prefs_version 变化时才重新读取并解析 JSON。
+    返回的字典是共享缓存，调用方不要原地修改。
+    游客的偏好在各自会话的内存库里，版本号互不相干，因此不走缓存。
+    """
     cursor = conn.cursor()
     
-    cursor.execute("SELECT preferences FROM users WHERE username = ?", (username,))
+    if username == GUEST_USER:
+        cursor.execute("SELECT preferences FROM users WHERE username = ?", (username,))
+        result = cursor.fetchone()
+        return json.loads(result['preferences'] or '{}') if result else {}
+    
+    cached = _prefs_cache.get(username)
+    cached_version = cached[0] if cached else -1
+    # 版本未变时不取回 JSON 文本
+    cursor.execute("""
+        SELECT prefs_version,
+               CASE WHEN prefs_version = ? THEN NULL ELSE preferences END AS preferences
+        FROM users WHERE username = ?
+    """, (cached_version, username))
     result = cursor.fetchone()
     
-    if result:
-        return json.loads(result['preferences'])
-    return {}
+    if not result:
+        return {}
+    if result['prefs_version'] == cached_version:
+        return cached[1]
+    try:
+        prefs = json.loads(result['preferences'] or '{}')
+    except json.JSONDecodeError:
+        prefs = {}
+    _prefs_cache[username] = (result['prefs_version'], prefs)
+    return prefs
  
-def update_user_preferences(conn, username, preferences):
-    """更新用户偏好"""
+def update_user_preferences(conn, username, preferences, remove=()):
+    """
+    局部更新用户偏好：只写入 preferences 中给出的键，并删除 remove 中的键，
+    其余键保持不变。用 json_set/json_remove 在一条 UPDATE 里完成，无需先读后写。
+    """
+    if not preferences and not remove:
+        return
     cursor = conn.cursor()
     
-    prefs_json = json.dumps(preferences)
-    cursor.execute("""
-        UPDATE users SET preferences = ? WHERE username = ?
-    """, (prefs_json, username))
+    # 旧数据可能是 NULL 或非法 JSON，按空对象处理
+    expr = "CASE WHEN json_valid(preferences) THEN preferences ELSE '{}' END"
+    params = []
+    if remove:
+        expr = f"json_remove({expr}, {', '.join('?' for _ in remove)})"
+        params.extend(_json_path(key) for key in remove)
+    if preferences:
+        expr = f"json_set({expr}, {', '.join('?, json(?)' for _ in preferences)})"
+        for key, value in preferences.items():
+            params.extend([_json_path(key), json.dumps(value, ensure_ascii=False)])
+    
+    cursor.execute(f"""
+        UPDATE users SET preferences = {expr}, prefs_version = prefs_version + 1
+        WHERE username = ?
+    """, (*params, username))
     conn.commit() # Add commit here
+
+def _json_path(key):
+    """顶层键对应的 JSON 路径（加引号以兼容中文和特殊字符）"""
+    return '$."' + key + '"'
+
 def update_user_avatar(conn, username, avatar_data):
     """更新用户头像"""
     cursor = conn.cursor()
@@ -0,0 +1,205 @@
+"""
+食物库的近似重复检测：名称的字 n-gram + MinHash/LSH 索引。
+
+名称先做 NFKC 规范化（全角/半角、大小写）并去掉空白和标点，首尾加上边界符后取相邻两字作为集合；
+每个名称算 NUM_PERM 个 MinHash，分成 BANDS 段，每段落进一个桶。
+两个名称只要有一段完全相同就成为候选，再用精确的 Jaccard 相似度确认。
+添加一个食物时只需算一次签名、查 BANDS 个桶，与食物库大小无关。
+
+索引在进程内缓存，食物库版本变化时只增删改动过的食物。
+"""
+import re
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+from database import get_catalog
+
+NUM_PERM = 40
+BANDS = 20                 # 每段 2 个哈希：Jaccard 0.4 的两个名称有 97% 的概率成为候选
+DUPLICATE_THRESHOLD = 0.4  # 精确 Jaccard 不低于此值才算近似重复
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)  # 固定种子：签名在进程之间保持一致
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.int64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.int64)
+_ROWS = NUM_PERM // BANDS
+_PUNCTUATION = re.compile(r"[\s\W_]+")
+
+
+def normalize_name(name):
+    """比较用的名称：NFKC 规范化、转小写、去掉空白和标点"""
+    return _PUNCTUATION.sub("", unicodedata.normalize("NFKC", name).lower())
+
+
+def shingles(name):
+    """规范化后名称的相邻两字集合，首尾加边界符（短名称和只差开头/结尾一个字的名称也能比较）"""
+    text = normalize_name(name)
+    if not text:
+        return set()
+    text = f"^{text}$"
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def _signatures(shingle_sets, chunk=4096):
+    """批量计算 MinHash 签名：返回 (名称数 × NUM_PERM) 的矩阵，空集合的行全为 _PRIME"""
+    if len(shingle_sets) > chunk:
+        return np.vstack([_signatures(shingle_sets[i:i + chunk]) for i in range(0, len(shingle_sets), chunk)])
+    lengths = np.array([len(s) for s in shingle_sets])
+    hashes = np.array(
+        [zlib.crc32(g.encode("utf-8")) % _PRIME for s in shingle_sets for g in s], dtype=np.int64
+    )
+    signatures = np.full((len(shingle_sets), NUM_PERM), _PRIME, dtype=np.int64)
+    if len(hashes):
+        permuted = (_A[None, :] * hashes[:, None] + _B[None, :]) % _PRIME
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        nonempty = lengths > 0
+        signatures[nonempty] = np.minimum.reduceat(permuted, starts[nonempty], axis=0)
+    return signatures
+
+
+def _band_keys(signatures):
+    """每个签名的 BANDS 个桶号：段号和该段的几个哈希合成一个整数"""
+    combined = np.broadcast_to(np.arange(BANDS, dtype=np.uint64), (len(signatures), BANDS))
+    for row in range(_ROWS):
+        combined = combined * np.uint64(1_000_003) + signatures[:, row::_ROWS][:, :BANDS].astype(np.uint64)
+    return combined.tolist()
+
+
+class DuplicateIndex:
+    """食物名称的 LSH 索引：桶号 → 食物 id 集合"""
+
+    def __init__(self):
+        self.version = None
+        self.names = {}      # 食物id → 名称
+        self.shingles = {}   # 食物id → n-gram 集合
+        self.keys = {}       # 食物id → 所在的桶
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def _add(self, food_id, name, shingle_set, keys):
+        self.names[food_id] = name
+        self.shingles[food_id] = shingle_set
+        self.keys[food_id] = keys
+        buckets = self.buckets
+        for key in keys:
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {food_id}
+            else:
+                bucket.add(food_id)
+
+    def _remove(self, food_id):
+        for key in self.keys.pop(food_id, ()):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(food_id)
+                if not bucket:
+                    del self.buckets[key]
+        self.names.pop(food_id, None)
+        self.shingles.pop(food_id, None)
+
+    def refresh(self, conn):
+        """食物库版本变化时增量同步：删掉已删除或改了名的食物，加入新的"""
+        version, by_id = get_catalog(conn)
+        with self._lock:
+            if self.version == version:
+                return
+            for food_id in [f for f in self.names if f not in by_id or by_id[f]['name'] != self.names[f]]:
+                self._remove(food_id)
+            added = [(food_id, food['name']) for food_id, food in by_id.items() if food_id not in self.names]
+            if added:
+                shingle_sets = [shingles(name) for _, name in added]
+                keys = _band_keys(_signatures(shingle_sets))
+                for (food_id, name), shingle_set, food_keys in zip(added, shingle_sets, keys):
+                    self._add(food_id, name, shingle_set, food_keys)
+            self.version = version
+
+    def query(self, name, exclude_id=None, threshold=DUPLICATE_THRESHOLD):
+        """与 name 近似重复的食物 [(食物id, Jaccard)]，相似度从高到低"""
+        target = shingles(name)
+        if not target:
+            return []
+        keys = _band_keys(_signatures([target]))[0]
+        with self._lock:
+            candidates = set()
+            for key in keys:
+                candidates |= self.buckets.get(key, set())
+            candidates.discard(exclude_id)
+            matches = [(food_id, jaccard(target, self.shingles[food_id])) for food_id in candidates]
+        return sorted([m for m in matches if m[1] >= threshold], key=lambda m: m[1], reverse=True)
+
+    def groups(self, threshold=DUPLICATE_THRESHOLD):
+        """全库的近似重复分组 [[(食物id, 名称)]]：每个食物与同桶的候选逐一精确确认，并查集合并"""
+        with self._lock:
+            parent = {}
+
+            def find(x):
+                while parent.get(x, x) != x:
+                    parent[x] = parent.get(parent[x], parent[x])
+                    x = parent[x]
+                return x
+
+            for a, keys in self.keys.items():
+                candidates = set()
+                for key in keys:
+                    bucket = self.buckets[key]
+                    if len(bucket) > 1:
+                        candidates.update(bucket)
+                shingle_set = self.shingles[a]
+                for b in candidates:
+                    # 每对只比较一次
+                    if b > a and jaccard(shingle_set, self.shingles[b]) >= threshold:
+                        parent[find(a)] = find(b)
+            clusters = {}
+            for food_id in parent:
+                clusters.setdefault(find(food_id), []).append(food_id)
+            return sorted(
+                ([(food_id, self.names[food_id]) for food_id in sorted(members)] for members in clusters.values()),
+                key=len, reverse=True,
+            )
+
+
+_index = DuplicateIndex()
+
+
+def find_duplicates(conn, name, exclude_id=None):
+    """
+    新名称在食物库里可能的重复 [(食物, 相似度)]（不含名称完全相同的同一个食物 exclude_id）。
+    conn 为正式数据库的连接
+    """
+    _index.refresh(conn)
+    _, by_id = get_catalog(conn)
+    return [(by_id[food_id], similarity) for food_id, similarity in _index.query(name, exclude_id)
+            if food_id in by_id]
+
+
+def find_duplicates_in_batch(conn, names):
+    """
+    批量导入前检查：每个名称与食物库以及同一批里排在它前面的名称比较，
+    返回 {名称: [相似的已有名称或同批名称]}，只列出有疑似重复的
+    """
+    _index.refresh(conn)
+    _, by_id = get_catalog(conn)
+    batch = DuplicateIndex()
+    shingle_sets = [shingles(name) for name in names]
+    keys = _band_keys(_signatures(shingle_sets))
+    flagged = {}
+    for i, name in enumerate(names):
+        similar = [by_id[food_id]['name'] for food_id, _ in _index.query(name) if food_id in by_id]
+        similar += [batch.names[j] for j, _ in batch.query(name)]
+        if similar:
+            flagged[name] = similar
+        batch._add(i, name, shingle_sets[i], keys[i])
+    return flagged
+
+
+def duplicate_report(conn):
+    """全库近似重复报告：[[(食物id, 名称)]]，每组至少两个食物，大组在前"""
+    _index.refresh(conn)
+    return _index.groups()
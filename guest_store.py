@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from database import GUEST_USER, MeteredConnection, create_user_data_tables
+
+GUEST_TTL = 30 * 60  # 秒，游客会话空闲超过该时长即被回收
+# 秒，超出内存上限时只淘汰空闲超过该时长的会话：最近还在访问的会话可能正在执行页面，
+# 手里拿着连接，这时关掉会让它报 “Cannot operate on a closed database”
+GUEST_EVICT_GRACE = 60
+GUEST_MEMORY_CAP = int(os.environ.get("HONEYEAT_GUEST_MEMORY_CAP_MB", "64")) * 1024 * 1024
+
+GUEST_SESSIONS_EVICTED = metrics.counter(
+    "honeyeat_guest_sessions_evicted_total", "被回收的游客内存库数量", ("reason",)
+)
+
+
+class _GuestSession:
+    def __init__(self, conn):
+        self.conn = conn
+        self.last_access = time.monotonic()
+        self.size = 0
+
+
+class GuestStore:
+    """
+    游客数据存储：每个游客会话一份独立的内存 SQLite 数据库。
+
+    内存库里建有与正式库相同的用户数据表（冰箱、饮食历史、打卡、待买清单等），
+    正式库以只读方式 ATTACH 进来。SQLite 解析不带库名的表名时先找内存库再找附加库，
+    所以 foods 等共享表读的是正式库，用户数据读写的都是内存库——
+    页面代码照常执行原来的 SQL，游客不会产生任何磁盘写入或写锁。
+
+    空闲超过 GUEST_TTL 的会话会被回收；所有内存库合计超过 GUEST_MEMORY_CAP 时，
+    按最近最少使用的顺序淘汰空闲超过 GUEST_EVICT_GRACE 的会话（都还在活跃时暂时允许超出）。
+    """
+
+    def __init__(self, db_path, ttl=GUEST_TTL, memory_cap=GUEST_MEMORY_CAP, evict_grace=GUEST_EVICT_GRACE):
+        self.db_path = os.path.abspath(db_path)
+        self.ttl = ttl
+        self.memory_cap = memory_cap
+        self.evict_grace = evict_grace
+        self._sessions = OrderedDict()
+        self._total_size = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            "file::memory:", uri=True, check_same_thread=False, factory=MeteredConnection
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("ATTACH DATABASE ? AS shared", (f"file:{self.db_path}?mode=ro",))
+        cursor = conn.cursor()
+        create_user_data_tables(cursor)
+        cursor.execute(
+            "INSERT INTO users (username, name, password) VALUES (?, '游客', '')", (GUEST_USER,)
+        )
+        conn.commit()
+        return conn
+
+    @staticmethod
+    def _measure(conn):
+        page_count = conn.execute("PRAGMA main.page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA main.page_size").fetchone()[0]
+        return page_count * page_size
+
+    def _evict(self, session_id, reason):
+        session = self._sessions.pop(session_id)
+        self._total_size -= session.size
+        session.conn.close()
+        GUEST_SESSIONS_EVICTED.inc(reason=reason)
+
+    def connection(self, session_id):
+        """获取游客会话的内存库连接（不存在或已被回收时新建一份空库）"""
+        now = time.monotonic()
+        with self._lock:
+            # 回收过期会话（OrderedDict 按最近访问排序，遇到未过期的即可停止）
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if now - oldest.last_access <= self.ttl:
+                    break
+                self._evict(oldest_id, "ttl")
+
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _GuestSession(self._open())
+            session.last_access = now
+            self._sessions.move_to_end(session_id)
+            # 上次访问后的写入在这里计入占用
+            size = self._measure(session.conn)
+            self._total_size += size - session.size
+            session.size = size
+
+            while self._total_size > self.memory_cap:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if now - oldest.last_access <= self.evict_grace:
+                    break
+                self._evict(oldest_id, "memory")
+            return session.conn
+
+    def discard(self, session_id):
+        """游客退出时立即释放其内存库"""
+        with self._lock:
+            if session_id in self._sessions:
+                self._evict(session_id, "logout")
+
+    def session_size(self, session_id):
+        """某个游客内存库最近一次测得的占用（字节），不存在时为 0"""
+        session = self._sessions.get(session_id)
+        return session.size if session else 0
+
+    def memory_usage(self):
+        """所有游客内存库的合计占用（字节）"""
+        return self._total_size
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,227 @@
+"""
+压力测试脚本：用 Streamlit 的 AppTest 并发模拟 N 个会话，
+估算一台服务器能同时撑住多少对情侣。
+
+每个会话依次：登录 → 点“帮我推荐” → 打完一轮美食 PK → 往冰箱加食材并增减数量 → 切到日历统计视图，
+按步骤统计每次 rerun 的耗时（p50/p95/p99）、整体吞吐量，以及 SQLite 写锁错误。
+脚本在临时目录里生成一份合成数据库，不会碰到正式的 honeyeat.db。
+
+AppTest 每次运行都会替换全局的 Runtime 单例，同一进程里无法并行，
+所以每个会话跑在独立的子进程里，所有会话共用同一个数据库文件——
+写锁竞争与多进程部署时一致，但进程内的缓存不共享，结果偏保守。
+
+用法：
+    python loadtest.py --sessions 16 --rounds 3
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+STEPS = ("login", "recommend", "pk", "pantry", "calendar")
+PANTRY_ITEMS = ("鸡蛋", "番茄", "土豆", "青椒", "猪肉", "豆腐", "面条", "洋葱")
+MEAL_TIMES = ("早餐", "午餐", "晚餐", "夜宵")
+
+
+def build_synthetic_database(users, foods, history_days):
+    """生成合成数据：users 个用户，额外 foods 个食物，每人 history_days 天的饮食记录和一些库存"""
+    from database import (
+        create_user, get_connection, initialize_and_seed_database, rebuild_eat_frequency, rebuild_trending_foods
+    )
+
+    conn = get_connection()
+    initialize_and_seed_database(conn)
+    cursor = conn.cursor()
+    categories = ("中餐", "快餐", "速食", "大餐", "小吃", "甜品")
+    cursor.executemany(
+        "INSERT INTO foods (name, category, cost_level, health_tag) VALUES (?, ?, ?, ?)",
+        [
+            (f"合成菜{i}", random.choice(categories), random.choice(("$", "$$", "$$$")), None)
+            for i in range(foods)
+        ],
+    )
+    conn.commit()
+    food_rows = cursor.execute("SELECT id, name FROM foods WHERE active = 1").fetchall()
+
+    today = date.today()
+    for u in range(users):
+        username = f"lt{u}"
+        create_user(conn, username, f"压测用户{u}", "pw")
+        cursor.executemany(
+            """
+            INSERT INTO eat_history (date, meal_time, food_id, food_name, user_id, rating, mode)
+            VALUES (?, ?, ?, ?, ?, ?, 'smart')
+            """,
+            [
+                ((today - timedelta(days=d)).isoformat(), meal, food["id"], food["name"], username, random.randint(1, 5))
+                for d in range(history_days)
+                for meal, food in zip(MEAL_TIMES[:3], random.sample(food_rows, 3))
+            ],
+        )
+        cursor.executemany(
+            "INSERT INTO pantry (food_name, quantity, status, user_id) VALUES (?, ?, '充足', ?)",
+            [(item, random.randint(1, 5), username) for item in random.sample(PANTRY_ITEMS, 4)],
+        )
+    conn.commit()
+    rebuild_eat_frequency(conn)
+    rebuild_trending_foods(conn)
+    conn.close()
+
+
+def _button(at, label=None, key=None, prefix=None):
+    for b in at.button:
+        if (label and b.label == label) or (key and b.key == key) or (prefix and b.key and b.key.startswith(prefix)):
+            return b
+    raise LookupError(label or key or prefix)
+
+
+class SessionRunner:
+    """一个模拟会话：按固定剧本操作，记录每次 rerun 的耗时"""
+
+    def __init__(self, username, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.username = username
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.samples = []  # [(步骤, 秒)]
+        self.errors = []   # [(步骤, 错误信息)]
+
+    def _run(self, step, action):
+        start = time.perf_counter()
+        action()
+        self.samples.append((step, time.perf_counter() - start))
+        for exc in self.at.exception:
+            self.errors.append((step, exc.message))
+
+    def open(self):
+        """首次打开登录页（脚本在这里编译，不计入压测）"""
+        self.at.run()
+
+    def login(self):
+        at = self.at
+        at.text_input(key="login_username").input(self.username)
+        at.text_input(key="login_password").input("pw")
+        self._run("login", _button(at, key="login_btn").click().run)
+
+    def recommend(self):
+        self._run("recommend", _button(self.at, key="smart_rec").click().run)
+
+    def pk(self):
+        at = self.at
+        self._run("pk", _button(at, label="🎮 开始PK").click().run)
+        while len(at.session_state["pk_round"]) > 1:
+            self._run("pk", _button(at, key="pk1").click().run)
+        self._run("pk", _button(at, label="再来一轮").click().run)
+
+    def pantry(self):
+        at = self.at
+        next(t for t in at.text_input if t.label == "食材名称").input(random.choice(PANTRY_ITEMS))
+        self._run("pantry", _button(at, key="add_pantry_item").click().run)
+        self._run("pantry", _button(at, prefix="incr_pantry_").click().run)
+        self._run("pantry", _button(at, prefix="decr_pantry_").click().run)
+
+    def calendar(self):
+        at = self.at
+        for view in ("📊 统计图表", "🗓️ 日历视图"):
+            self._run("calendar", at.radio(key="cal_view").set_value(view).run)
+
+    def play(self, rounds):
+        self.login()
+        for _ in range(rounds):
+            for step in STEPS[1:]:
+                try:
+                    getattr(self, step)()
+                except Exception as e:  # 页面结构异常（如按钮没渲染出来）也记为错误，继续下一步
+                    self.errors.append((step, f"{type(e).__name__}: {e}"))
+
+
+def _session_worker(username, rounds, timeout, barrier, results):
+    """子进程：打开登录页后等所有会话就绪，再同时开始跑剧本"""
+    import database
+
+    runner = SessionRunner(username, timeout)
+    runner.open()
+    barrier.wait()
+    runner.play(rounds)
+    write_seconds = [(count, quantiles[0.99]) for _, count, _, quantiles in database.DB_WRITE_SECONDS.snapshot()]
+    results.put((runner.samples, runner.errors, database.DB_LOCK_ERRORS.value(), write_seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HoneyEat 并发压测")
+    parser.add_argument("--sessions", type=int, default=8, help="并发会话数")
+    parser.add_argument("--rounds", type=int, default=3, help="每个会话重复剧本的轮数")
+    parser.add_argument("--users", type=int, default=None, help="合成用户数（默认与会话数相同）")
+    parser.add_argument("--foods", type=int, default=500, help="额外生成的食物数")
+    parser.add_argument("--history-days", type=int, default=90, help="每个用户的饮食记录天数")
+    parser.add_argument("--timeout", type=float, default=60, help="单次 rerun 的超时时间（秒）")
+    parser.add_argument("--workdir", default=None, help="合成数据库所在目录（默认临时目录）")
+    args = parser.parse_args()
+    users = args.users or args.sessions
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="honeyeat-loadtest-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    os.environ.setdefault("HONEYEAT_METRICS_PATH", os.path.join(workdir, "honeyeat_metrics.prom"))
+    sys.path.insert(0, os.path.dirname(APP_PATH))
+
+    import database
+    import metrics
+
+    start = time.perf_counter()
+    build_synthetic_database(users, args.foods, args.history_days)
+    print(f"合成数据库：{os.path.join(workdir, database.DB_PATH)}（{users} 个用户，"
+          f"额外 {args.foods} 个食物，每人 {args.history_days} 天记录），耗时 {time.perf_counter() - start:.1f} s")
+
+    # 子进程继承已经切换好的工作目录，共用同一个合成数据库
+    ctx = multiprocessing.get_context("fork")
+    barrier = ctx.Barrier(args.sessions + 1)
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=_session_worker, args=(f"lt{i % users}", args.rounds, args.timeout, barrier, results))
+        for i in range(args.sessions)
+    ]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    outcomes = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - start
+    for worker in workers:
+        worker.join()
+
+    latency = metrics.Histogram("loadtest_rerun_seconds", "", ("step",))
+    errors = {}
+    lock_errors = 0
+    writes, write_p99 = 0, 0.0
+    for samples, session_errors, session_lock_errors, write_seconds in outcomes:
+        for step, seconds in samples:
+            latency.observe(seconds, step=step)
+        for step, message in session_errors:
+            errors.setdefault(step, []).append(message)
+        # 写锁错误只认数据库层的计数；同一个错误也会出现在页面异常里，不再重复计入
+        lock_errors += session_lock_errors
+        for count, p99 in write_seconds:
+            writes += count
+            write_p99 = max(write_p99, p99)
+    reruns = sum(len(samples) for samples, _, _, _ in outcomes)
+
+    print(f"\n{args.sessions} 个并发会话 × {args.rounds} 轮，共 {reruns} 次 rerun，用时 {elapsed:.1f} s，"
+          f"吞吐量 {reruns / elapsed:.1f} rerun/s")
+    print(f"{'步骤':<10}{'次数':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for (step,), count, _, quantiles in latency.snapshot():
+        print(f"{step:<10}{count:>6}" + "".join(f"{quantiles[q] * 1000:>10.1f}" for q in (0.5, 0.95, 0.99)))
+
+    print(f"\n写语句与提交 {writes} 次，各会话中写耗时最差的 p99 {write_p99 * 1000:.1f} ms")
+    print(f"SQLite 写锁错误：{lock_errors}")
+    for step, messages in errors.items():
+        print(f"  {step} 出错 {len(messages)} 次，例如：{messages[0][:120]}")
+
+
+if __name__ == "__main__":
+    main()
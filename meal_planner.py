@@ -0,0 +1,183 @@
+"""
+一周菜单：为 7 天 × 早/午/晚 三餐排菜，并汇总需要采购的食材。
+
+约束：
+- 黑名单、不想吃的类型、素食：候选阶段在 SQL 中排除（同智能推荐）；
+- 同一道菜 repeat_window 天内不重复，同一天内分类不重复，每个分类一周最多 CATEGORY_WEEK_CAP 次；
+- 每餐热量不超过目标的一定比例，每天合计落在目标的 70%–100% 之间，一周价位合计（$ 的个数）不超过预算；
+- 冰箱里食材齐全的菜加分，只差一部分的按齐全程度少量加分。
+
+求解：先按时间段给全部候选打一次分（规则 + 频次 + 个人口味 + 冰箱加分），每餐只保留分数最高的一批；
+然后逐天求解——当天三餐用分支定界求精确最优，
+选定后把去重窗口、重复次数和分类计数增量更新，再解下一天。一周的价位预算按剩余天数均摊到每天，
+避免前几天把预算花光。
+"""
+import heapq
+import math
+import random
+from collections import Counter
+from datetime import date, timedelta
+
+from database import get_eat_frequency, get_pantry_ingredients, get_user_preferences
+from recipes import get_recipe_book
+from recommender import COST_UNITS, candidate_foods, score_food
+
+PLAN_MEALS = (("早餐", "早餐时间"), ("午餐", "午餐时间"), ("晚餐", "晚餐时间"))
+# 每餐热量占每日目标的上限
+MEAL_CALORIE_SHARE = {"早餐": 0.35, "午餐": 0.45, "晚餐": 0.45}
+CALORIE_FLOOR = 0.7      # 每天三餐合计热量不低于目标的这个比例
+PLAN_DAYS = 7
+REPEAT_WINDOW = 3        # 同一道菜至少间隔的天数
+CATEGORY_WEEK_CAP = 6    # 每个分类一周最多出现的次数
+PANTRY_BONUS = 20        # 冰箱食材齐全的菜加的分
+PLAN_POOL = 200          # 每餐参与搜索的候选数
+PLAN_CATEGORY_POOL = 10  # 另外为每个分类保留的候选数
+WEEK_REPEAT_PENALTY = 15  # 本周每重复一次扣的分
+JITTER = 8               # 重新生成时给分数加的随机扰动幅度
+
+
+def _pantry_bonus(missing, required):
+    if required is None:
+        return 0
+    if not missing:
+        return PANTRY_BONUS
+    return PANTRY_BONUS / 2 * (1 - len(missing) / len(required))
+
+
+def _candidate_pool(scored):
+    """
+    一餐的搜索候选：总分最高的 PLAN_POOL 个，再补上每个分类最高的 PLAN_CATEGORY_POOL 个
+    （热门分类一周用满次数后还有别的分类可选），按分数降序
+    """
+    by_category = {}
+    for item in scored:
+        by_category.setdefault(item[3]['category'], []).append(item)
+    pool = {item[3]['id']: item for item in heapq.nlargest(PLAN_POOL, scored, key=lambda item: item[0])}
+    for items in by_category.values():
+        for item in heapq.nlargest(PLAN_CATEGORY_POOL, items, key=lambda item: item[0]):
+            pool[item[3]['id']] = item
+    return sorted(pool.values(), key=lambda item: item[0], reverse=True)
+
+
+def _solve_day(pools, calorie_goal, cost_cap, blocked, category_left, used):
+    """
+    解一天：每餐从 pools[m] 里选一个，不在 blocked 里、当天分类不重复，
+    当天热量落在 [CALORIE_FLOOR × 目标, 目标] 之间、价位合计不超过 cost_cap，使分数之和最大。
+    pools[m] 为按分数降序的 [(分数, 热量, 价位, 食物)]；本周已排过的菜按次数扣 WEEK_REPEAT_PENALTY 分。
+
+    分支定界：上界为当前分数 + 后面各餐的最高分；按分数降序遍历，上界不够时直接结束该层循环。
+    另外用“后面各餐最多还能吃多少热量 / 最少要花多少”剪掉注定达不到热量下限或超预算的分支。
+    """
+    caps = [calorie_goal * MEAL_CALORIE_SHARE[meal] for meal, _ in PLAN_MEALS]
+    meals = [
+        sorted(
+            (
+                (score - WEEK_REPEAT_PENALTY * used[food['id']], calories, cost, food)
+                for score, calories, cost, food in pool
+                if calories <= caps[m] and cost <= cost_cap
+                and food['id'] not in blocked and category_left[food['category']] > 0
+            ),
+            key=lambda item: item[0], reverse=True,
+        )
+        for m, pool in enumerate(pools)
+    ]
+    if not all(meals):
+        return None
+    # 第 m 餐及以后各餐的最高分之和 / 最大热量之和 / 最低价位之和（忽略约束的乐观估计）
+    score_suffix = [0.0] * (len(meals) + 1)
+    calorie_suffix = [0] * (len(meals) + 1)
+    cost_suffix = [0] * (len(meals) + 1)
+    for m in range(len(meals) - 1, -1, -1):
+        score_suffix[m] = score_suffix[m + 1] + meals[m][0][0]
+        calorie_suffix[m] = calorie_suffix[m + 1] + max(item[1] for item in meals[m])
+        cost_suffix[m] = cost_suffix[m + 1] + min(item[2] for item in meals[m])
+    if cost_suffix[0] > cost_cap:
+        return None
+    floor = calorie_goal * CALORIE_FLOOR
+
+    best = {'value': float('-inf'), 'items': None}
+    chosen = []
+
+    def search(m, calories, cost_left, value, categories):
+        if m == len(meals):
+            best['value'], best['items'] = value, list(chosen)
+            return
+        for score, item_calories, cost, food in meals[m]:
+            if value + score + score_suffix[m + 1] <= best['value']:
+                break
+            total = calories + item_calories
+            if (total <= calorie_goal and total + calorie_suffix[m + 1] >= floor
+                    and cost + cost_suffix[m + 1] <= cost_left and food['category'] not in categories):
+                chosen.append(food)
+                categories.add(food['category'])
+                search(m + 1, total, cost_left - cost, value + score, categories)
+                categories.discard(food['category'])
+                chosen.pop()
+
+    search(0, 0, cost_cap, 0.0, set())
+    return best['items']
+
+
+def plan_week(conn, user_id, start=None, days=PLAN_DAYS, repeat_window=REPEAT_WINDOW, weekly_budget=None,
+              prefer_pantry=True, seed=None):
+    """
+    生成菜单，返回 {'days': [(日期, [早餐, 午餐, 晚餐])], 'shopping': {食材: 份数}, 'cost': 价位合计}；
+    某天在约束下排不出时该天为 None。weekly_budget 为一周价位合计上限（None 不限）；
+    seed 不为 None 时给分数加随机扰动，每次“重新生成”得到不同的菜单。
+    """
+    start = start or date.today()
+    rng = random.Random(seed)
+    user_prefs = get_user_preferences(conn, user_id)
+    calorie_goal = user_prefs.get('daily_calorie_goal', 2000)
+    foods = [food for food in candidate_foods(conn, user_id, user_prefs) if food.get('calories')]
+    frequency = get_eat_frequency(conn, user_id)
+    # 按需导入：NumPy 较重，不拖慢页面冷启动
+    from personalization import personal_bonus
+    personal = personal_bonus(conn, user_id, foods)
+
+    recipe_book = get_recipe_book(conn, user_id)
+    available = get_pantry_ingredients(conn, user_id)
+    missing = {}
+    bonus = {}
+    for food in foods:
+        required = recipe_book.get(food['name'])
+        if required:
+            missing[food['id']] = [item for item in required if item not in available]
+        bonus[food['id']] = _pantry_bonus(missing.get(food['id']), required) if prefer_pantry else 0
+
+    # 增量打分：每个时间段只打一次分，逐天求解时不再重新计算
+    jitter = JITTER if seed is not None else 0
+    pools = []
+    for _, time_slot in PLAN_MEALS:
+        scored = [
+            (score_food(food, user_prefs, time_slot, frequency=frequency, personal=personal)[0]
+             + bonus[food['id']] + rng.uniform(-jitter, jitter),
+             food['calories'], COST_UNITS.get(food.get('cost_level'), 2), food)
+            for food in foods
+        ]
+        pools.append(_candidate_pool(scored))
+
+    budget_left = weekly_budget if weekly_budget is not None else math.inf
+    last_used = {}
+    used = Counter()
+    category_left = Counter({food['category']: CATEGORY_WEEK_CAP for food in foods})
+    plan = []
+    shopping = Counter()
+    total_cost = 0
+    for d in range(days):
+        day = start + timedelta(days=d)
+        blocked = {food_id for food_id, day_index in last_used.items() if d - day_index < repeat_window}
+        cost_cap = math.ceil(budget_left / (days - d)) if budget_left != math.inf else math.inf
+        items = _solve_day(pools, calorie_goal, cost_cap, blocked, category_left, used)
+        plan.append((day, items))
+        if items is None:
+            continue
+        for food in items:
+            last_used[food['id']] = d
+            used[food['id']] += 1
+            category_left[food['category']] -= 1
+            cost = COST_UNITS.get(food.get('cost_level'), 2)
+            budget_left -= cost
+            total_cost += cost
+            shopping.update(missing.get(food['id'], ()))
+    return {'days': plan, 'shopping': dict(shopping), 'cost': total_cost}
@@ -0,0 +1,266 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+METRICS_PATH = os.environ.get("HONEYEAT_METRICS_PATH", "honeyeat_metrics.prom")
+FLUSH_INTERVAL = 60  # 秒
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+# 本模块在进程内第一次执行脚本时导入，用作冷启动计时的起点
+PROCESS_START = time.perf_counter()
+
+
+def _escape(value):
+    """按 Prometheus 文本格式转义标签值"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """单调递增计数器，支持标签"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class _HdrBuckets:
+    """
+    HDR 风格的桶计数：数值按 2 的幂分段，每段再线性细分为 2^bits 份，
+    因此任意量级下的相对误差都不超过 2^-(bits-1)，内存占用与样本数无关。
+    """
+
+    def __init__(self, bits):
+        self.bits = bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0
+
+    def record(self, units, raw):
+        shift = max(units.bit_length() - self.bits, 0)
+        lower = (units >> shift) << shift
+        self.counts[lower] = self.counts.get(lower, 0) + 1
+        self.count += 1
+        self.total += raw
+        self.max = max(self.max, units)
+
+    def percentile(self, q):
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for lower in sorted(self.counts):
+            seen += self.counts[lower]
+            if seen >= rank:
+                width = 1 << max(lower.bit_length() - self.bits, 0)
+                return min(lower + width // 2, self.max)
+        return self.max
+
+
+class Histogram:
+    """
+    延迟直方图（HDR 风格）。
+    以微秒为单位记录秒级数值，导出时以 summary 形式给出分位数。
+    """
+
+    def __init__(self, name, help_text, labelnames=(), scale=1_000_000, bits=6):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.scale = scale
+        self.bits = bits
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        units = max(int(value * self.scale), 0)
+        with self._lock:
+            buckets = self._buckets.get(key)
+            if buckets is None:
+                buckets = self._buckets[key] = _HdrBuckets(self.bits)
+            buckets.record(units, value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """返回 [(标签值, 计数, 总和, {分位数: 数值})]"""
+        rows = []
+        with self._lock:
+            for key, buckets in sorted(self._buckets.items()):
+                quantiles = {q: buckets.percentile(q) / self.scale for q in QUANTILES}
+                rows.append((key, buckets.count, buckets.total, quantiles))
+        return rows
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} summary"]
+        for key, count, total, quantiles in self.snapshot():
+            for q, value in quantiles.items():
+                labels = _format_labels(self.labelnames, key, [("quantile", q)])
+                lines.append(f"{self.name}{labels} {value:.6f}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total:.6f}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内指标注册表，同名指标只注册一次（Streamlit 每次 rerun 都会重新执行脚本）"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def _register(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif not metric.help:
+                # 从文件恢复的计数器没有说明文字，正式注册时补上
+                metric.help = help_text
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=()):
+        return self._register(Histogram, name, help_text, labelnames)
+
+    def metrics(self):
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def render(self):
+        """导出 Prometheus 文本格式"""
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def flush(self, path=METRICS_PATH):
+        """原子写入指标文件（先写临时文件再替换）"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def restore_counters(self, path=METRICS_PATH):
+        """从上次落盘的文件恢复计数器，使计数跨进程重启累积"""
+        if not os.path.exists(path):
+            return
+        counter_names = set()
+        sample_re = re.compile(r'^(\w+)(?:\{(.*)\})?\s+(\S+)$')
+        label_re = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("# TYPE "):
+                    _, _, name, kind = line.split(" ", 3)
+                    if kind == "counter":
+                        counter_names.add(name)
+                    continue
+                match = sample_re.match(line)
+                if not match or match.group(1) not in counter_names:
+                    continue
+                name, raw_labels, value = match.groups()
+                labels = {
+                    k: v.replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\")
+                    for k, v in label_re.findall(raw_labels or "")
+                }
+                # 恢复时指标可能尚未注册，先按文件中的标签名注册
+                counter = self.counter(name, "", tuple(labels))
+                try:
+                    amount = float(value)
+                except ValueError:
+                    continue
+                counter.inc(int(amount) if amount.is_integer() else amount, **labels)
+
+    def start_flusher(self, path=METRICS_PATH, interval=FLUSH_INTERVAL):
+        """启动后台落盘线程（幂等）"""
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._flush_loop, args=(path, interval), name="metrics-flusher", daemon=True
+            )
+        try:
+            self.restore_counters(path)
+        except OSError as e:
+            print(f"Error restoring metrics: {e}")
+        self._flusher.start()
+
+    def _flush_loop(self, path, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush(path)
+            except OSError as e:
+                print(f"Error flushing metrics: {e}")
+
+
+REGISTRY = MetricsRegistry()
+
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+
+PAGE_RENDERS = counter(
+    "honeyeat_page_renders_total", "页面函数执行次数（每次 rerun 计一次）", ("page",)
+)
+PAGE_RENDER_SECONDS = histogram(
+    "honeyeat_page_render_seconds", "页面函数单次执行耗时", ("page",)
+)
+
+
+def track_page(page):
+    """页面函数装饰器：统计 rerun 次数与渲染耗时"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            PAGE_RENDERS.inc(page=page)
+            with PAGE_RENDER_SECONDS.time(page=page):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,36 @@
+"""
+夜间批处理：先用全部评分重训每个用户的口味权重，
+再为每个用户的每个时间段（早餐/午餐/下午茶/晚餐/夜宵）预先计算 top-N 推荐，
+写入 recommendation_cache 表。页面上“⚡ 直接来一个”直接读取结果；
+白天偏好、饮食记录或黑名单有变化时，页面会只为该用户重算。
+最后根据冰箱的消耗记录预测每种食材哪天用完，快用完的提前加入待买清单。
+
+用法（例如 crontab 每天凌晨 4 点）：
+    0 4 * * * cd /path/to/app && python nightly_recommendations.py
+"""
+import time
+
+from database import GUEST_USER, get_connection, initialize_and_seed_database
+from pantry_forecast import forecast_pantry
+from personalization import train_weights
+from recommender import TIME_SLOTS, refresh_recommendations
+
+
+def main():
+    start = time.perf_counter()
+    conn = get_connection()
+    initialize_and_seed_database(conn)
+    trained = train_weights(conn)
+    users = [row['username'] for row in conn.execute("SELECT username FROM users WHERE username != ?", (GUEST_USER,))]
+    for user_id in users:
+        refresh_recommendations(conn, user_id)
+    forecasted, restocked = forecast_pantry(conn)
+    conn.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"🥗 已预测 {forecasted} 种冰箱食材的用完日期，{restocked} 种快用完的已加入待买清单")
+    print(f"✅ 已为 {trained} 个用户重训口味权重，为 {len(users)} 个用户预计算 {len(TIME_SLOTS)} 个时间段的推荐，耗时 {elapsed * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
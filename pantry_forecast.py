@@ -0,0 +1,97 @@
+"""
+冰箱库存消耗预测：根据最近的消耗记录（➖ 按钮和“我做了这道菜”都会记入 pantry_usage）
+估计每种食材每天用掉多少，推算现有库存哪天用完，并把快用完的食材提前加入待买清单。
+
+所有 (用户, 食材) 一起算：消耗记录按天累加成一个 (食材数 × 天数) 的矩阵，
+用指数衰减加权平均一次算出全部日均用量。结果存入 pantry_forecast 表，
+由夜间批处理（nightly_recommendations.py）计算，冰箱页面只读取结果。
+"""
+import math
+from datetime import date, timedelta
+
+import numpy as np
+
+from database import add_restock_items, get_pantry_stock, get_pantry_usage, save_pantry_forecast
+
+FORECAST_WINDOW_DAYS = 28  # 只看最近这么多天的消耗
+RATE_HALF_LIFE_DAYS = 7    # 日均用量的半衰期：一周前的消耗只算一半权重
+MIN_OBSERVED_DAYS = 3      # 刚买回来的食材至少按这么多天摊开算，避免一天的用量被当成日均
+RESTOCK_DAYS = 3           # 预计这么多天内用完的食材加入待买清单
+RESTOCK_COVER_DAYS = 7     # 补货数量按够用这么多天估算
+
+
+def estimate_daily_rates(usage, first_seen, window):
+    """
+    批量估计日均用量。usage 为 (行号, 天下标, 数量) 三个数组，天下标 0 为窗口第一天、window - 1 为今天；
+    first_seen 为每行开始观察的天下标（在此之前还没买或没记录，不算作“没用”）。
+    返回每行的日均用量：观察期内每天用量的指数衰减加权平均
+    """
+    rows, days, amounts = usage
+    matrix = np.zeros((len(first_seen), window))
+    np.add.at(matrix, (rows, days), amounts)
+    weights = 0.5 ** ((window - 1 - np.arange(window)) / RATE_HALF_LIFE_DAYS)
+    start = np.minimum(first_seen, window - MIN_OBSERVED_DAYS)
+    observed = np.where(np.arange(window)[None, :] >= start[:, None], weights[None, :], 0.0)
+    return (matrix * observed).sum(axis=1) / observed.sum(axis=1)
+
+
+def forecast_pantry(conn, user_id=None, today=None, restock_days=RESTOCK_DAYS):
+    """
+    重算库存预测并存表，预计 restock_days 天内用完（或刚用完）的食材加入待买清单（提交）。
+    user_id 为 None 时计算所有用户。返回 (预测的食材数, 新加入待买清单的条数)
+    """
+    today = today or date.today()
+    window_start = today.toordinal() - FORECAST_WINDOW_DAYS + 1
+    usage = get_pantry_usage(conn, date.fromordinal(window_start), user_id)
+    stock = get_pantry_stock(conn, user_id)
+
+    # 日期字符串 → 窗口内的天下标（窗口外、格式不对的日期查不到）
+    day_index = {date.fromordinal(window_start + d).isoformat(): d for d in range(FORECAST_WINDOW_DAYS)}
+
+    # 现有库存的食材，加上窗口内用过、现在已经用光的食材
+    index = {}
+    stocks, first_seen, last_seen = [], [], []
+    for owner, name, quantity, purchased_on in stock:
+        index[(owner, name)] = len(stocks)
+        stocks.append(quantity)
+        # 窗口开始前买的、或没有购买日期的旧数据，从窗口第一天开始观察
+        first_seen.append(day_index.get(str(purchased_on)[:10], 0))
+        last_seen.append(None)
+    usage_rows = []
+    for owner, name, amount, day in usage:
+        d = day_index.get(str(day)[:10])
+        if d is None:
+            continue
+        r = index.setdefault((owner, name), len(stocks))
+        if r == len(stocks):
+            stocks.append(0)
+            first_seen.append(d)
+            last_seen.append(None)
+        first_seen[r] = min(first_seen[r], d)
+        last_seen[r] = d if last_seen[r] is None else max(last_seen[r], d)
+        usage_rows.append((r, d, amount))
+    if not index:
+        save_pantry_forecast(conn, [], today, user_id)
+        conn.commit()
+        return 0, 0
+
+    usage_array = np.array(usage_rows, dtype=np.int64).reshape(-1, 3)
+    rates = estimate_daily_rates(tuple(usage_array.T), np.array(first_seen), FORECAST_WINDOW_DAYS)
+    stocks = np.array(stocks, dtype=np.float64)
+    # 用完前还能吃几天（没有消耗的为无穷大）
+    days_left = np.divide(stocks, rates, out=np.full(len(stocks), np.inf), where=rates > 0)
+
+    forecast, restock = [], []
+    for (owner, name), r in index.items():
+        rate = float(rates[r])
+        run_out_on = today + timedelta(days=int(days_left[r])) if math.isfinite(days_left[r]) else None
+        if stocks[r] > 0:
+            forecast.append((owner, name, int(stocks[r]), round(rate, 3), run_out_on))
+        if run_out_on is not None and days_left[r] <= restock_days:
+            # 有用量就一定有窗口内的消耗记录，last_seen 不为空
+            last_used = date.fromordinal(window_start + last_seen[r])
+            restock.append((owner, name, max(1, math.ceil(rate * RESTOCK_COVER_DAYS - stocks[r])), last_used))
+    save_pantry_forecast(conn, forecast, today, user_id)
+    added = add_restock_items(conn, restock, today)
+    conn.commit()
+    return len(forecast), added
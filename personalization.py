@@ -0,0 +1,142 @@
+"""
+个人口味权重：从用餐评分（1–5 星）中学习每个用户对食物特征的偏好。
+
+特征是食物本身的属性（属性位、健康标签、价位、分类），模型是带 L2 正则的线性回归，
+目标为 (评分 - 3) / 2。夜间批处理用 NumPy 闭式解整体重训，
+白天每记录一条评分做一步 SGD 增量更新。权重以 float32 字节串存在 user_weights 表，
+推荐打分时换算成加减分叠加在规则分数上。
+"""
+import threading
+
+import numpy as np
+
+from database import (
+    FOOD_ATTRIBUTES, get_catalog, get_rated_meals, get_user_weights, save_user_weights
+)
+
+HEALTH_TAGS = ("Healthy", "Light", "Normal", "Spicy", "Sweet", "CheatMeal")
+COST_LEVELS = ("$", "$$", "$$$")
+CATEGORIES = (
+    "中餐", "家常菜", "快餐", "速食", "大餐", "日料", "西餐", "早餐",
+    "小吃", "烧烤", "甜品", "轻食", "零食饮料",
+)
+FEATURE_NAMES = (
+    ("bias",)
+    + tuple(f"attr:{name}" for name in FOOD_ATTRIBUTES)
+    + tuple(f"tag:{tag}" for tag in HEALTH_TAGS)
+    + tuple(f"cost:{cost}" for cost in COST_LEVELS)
+    + tuple(f"cat:{cat}" for cat in CATEGORIES)
+)
+FEATURE_VERSION = 1  # 特征布局变化时加一，旧权重作废
+
+MIN_RATINGS = 3      # 评分少于这个数时不做个性化
+RIDGE = 1.0          # 批量训练的 L2 正则系数
+LEARNING_RATE = 0.01
+SGD_DECAY = 0.001    # 增量更新时的权重衰减
+BONUS_SCALE = 25     # 预测值（约 -1..1）换算成分数的倍数
+BONUS_CAP = 30
+
+_FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+_feature_cache = {"version": None, "rows": {}, "matrix": np.zeros((0, len(FEATURE_NAMES)), np.float32)}
+_feature_lock = threading.Lock()
+
+
+def food_features(food):
+    """单个食物的特征向量（float32）"""
+    x = np.zeros(len(FEATURE_NAMES), np.float32)
+    x[0] = 1.0
+    mask = food.get('attr_mask') or 0
+    for name, bit in FOOD_ATTRIBUTES.items():
+        if mask >> bit & 1:
+            x[_FEATURE_INDEX[f"attr:{name}"]] = 1.0
+    for key in (f"tag:{food.get('health_tag')}", f"cost:{food.get('cost_level')}", f"cat:{food.get('category')}"):
+        if key in _FEATURE_INDEX:
+            x[_FEATURE_INDEX[key]] = 1.0
+    return x
+
+
+def _feature_table(conn):
+    """全部食物的特征矩阵，随食物库版本缓存：返回 ({食物id: 行号}, 矩阵)"""
+    version, by_id = get_catalog(conn)
+    with _feature_lock:
+        if _feature_cache["version"] != version:
+            ids = list(by_id)
+            _feature_cache["rows"] = {food_id: i for i, food_id in enumerate(ids)}
+            _feature_cache["matrix"] = (
+                np.stack([food_features(by_id[food_id]) for food_id in ids])
+                if ids else np.zeros((0, len(FEATURE_NAMES)), np.float32)
+            )
+            _feature_cache["version"] = version
+        return _feature_cache["rows"], _feature_cache["matrix"]
+
+
+def _target(rating):
+    return (rating - 3) / 2
+
+
+def load_weights(conn, user_id):
+    """读取用户权重；没有、特征布局已变化或评分太少时返回 None"""
+    stored = get_user_weights(conn, user_id)
+    if stored is None:
+        return None
+    feature_version, blob, n_ratings = stored
+    if feature_version != FEATURE_VERSION or n_ratings < MIN_RATINGS:
+        return None
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def personal_bonus(conn, user_id, foods):
+    """
+    按用户权重给候选食物加减分：{食物id: 分数}。
+    一次矩阵乘法完成，用户没有可用权重时返回空字典。
+    """
+    w = load_weights(conn, user_id)
+    if w is None or not foods:
+        return {}
+    rows, matrix = _feature_table(conn)
+    ids = [food['id'] for food in foods if food['id'] in rows]
+    if not ids:
+        return {}
+    predictions = (matrix[[rows[food_id] for food_id in ids]] @ w).astype(np.float64)
+    bonus = np.clip(np.round(predictions * BONUS_SCALE, 1), -BONUS_CAP, BONUS_CAP)
+    return dict(zip(ids, bonus.tolist()))
+
+
+def train_weights(conn, user_id=None):
+    """
+    批量重训（提交）：对每个用户用全部评分求岭回归闭式解
+    w = (XᵀX + λI)⁻¹ Xᵀy。返回训练的用户数。
+    """
+    rows, matrix = _feature_table(conn)
+    by_user = {}
+    for meal_user, food_id, rating in get_rated_meals(conn, user_id):
+        if food_id in rows:
+            by_user.setdefault(meal_user, ([], []))
+            by_user[meal_user][0].append(rows[food_id])
+            by_user[meal_user][1].append(_target(rating))
+
+    identity = RIDGE * np.eye(len(FEATURE_NAMES), dtype=np.float64)
+    for meal_user, (row_ids, targets) in by_user.items():
+        x = matrix[row_ids].astype(np.float64)
+        y = np.asarray(targets, dtype=np.float64)
+        w = np.linalg.solve(x.T @ x + identity, x.T @ y).astype(np.float32)
+        save_user_weights(conn, meal_user, FEATURE_VERSION, w.tobytes(), len(targets))
+    conn.commit()
+    return len(by_user)
+
+
+def learn_from_rating(conn, user_id, food, rating):
+    """记录一条新评分后做一步 SGD 增量更新（提交）"""
+    if rating is None:
+        return
+    stored = get_user_weights(conn, user_id)
+    if stored is None or stored[0] != FEATURE_VERSION:
+        w, n_ratings = np.zeros(len(FEATURE_NAMES), np.float32), 0
+    else:
+        w, n_ratings = np.frombuffer(stored[1], dtype=np.float32).copy(), stored[2]
+    rows, matrix = _feature_table(conn)
+    x = matrix[rows[food['id']]] if food['id'] in rows else food_features(food)
+    error = _target(rating) - float(x @ w)
+    w += LEARNING_RATE * (error * x - SGD_DECAY * w)
+    save_user_weights(conn, user_id, FEATURE_VERSION, w.astype(np.float32).tobytes(), n_ratings + 1)
+    conn.commit()
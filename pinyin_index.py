@@ -0,0 +1,287 @@
+"""
+拼音搜索：按全拼或首字母前缀找食物、食材和菜谱（如 “mlxg”、“malaxiang” → 麻辣香锅）。
+
+每个名称用 pypinyin 转成音节，从每个音节开始的全拼和首字母各作为一个键
+（所以 “xiangguo”、“xg” 也能找到麻辣香锅）。全部键排好序存放，是摊平的前缀树：
+一个前缀对应连续的一段，查询是两次二分，每次输入不用重新扫描词表。
+
+三份索引在进程内缓存：
+- 食物：食物库版本变化时只增删改动过的食物；
+- 食材：内置菜谱用到的食材，加上各用户冰箱里出现过的和自己菜谱里的食材；
+- 菜谱：内置菜谱，加上各用户的私房菜谱。
+用户自己的词第一次查询时从数据库读一次，之后由页面在添加/删除时调用 remember_*/forget_recipe 增量更新。
+游客的数据在各自的内存库里，不进共享的索引，游客只用内置词表和食物库。
+"""
+import re
+from bisect import bisect_left, bisect_right
+import threading
+import unicodedata
+
+from pypinyin import lazy_pinyin
+
+from database import GUEST_USER, get_catalog, get_user_recipes
+from recipes import RECIPE_BOOK
+
+SUGGEST_LIMIT = 8
+_HANZI = re.compile(r"[\u3400-\u9fff]")
+_RUNS = re.compile(r"[\u3400-\u9fff]+|[^\u3400-\u9fff]+")
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+_SPACES = re.compile(r"[\s'’]+")
+
+
+def pinyin_keys(name):
+    """
+    名称的全部索引键 [(全拼, 首字母)]，第一项从第一个音节开始。
+    非汉字的部分（如 “KFC”）每个单词当作一个音节，全拼和首字母都是它本身
+    """
+    syllables, initials = [], []
+    for run in _RUNS.findall(unicodedata.normalize("NFKC", name).lower()):
+        if _HANZI.match(run):
+            # 整段一起转换，多音字按词组读音（“香锅” 而不是逐字）
+            pinyins = lazy_pinyin(run)
+            syllables += pinyins
+            initials += [p[0] for p in pinyins]
+        else:
+            words = _NON_ALNUM.sub(" ", run).split()
+            syllables += words
+            initials += words
+    return [("".join(syllables[i:]), "".join(initials[i:])) for i in range(len(syllables))]
+
+
+def normalize_query(query):
+    """输入框内容 → 查询串：NFKC、小写、去掉空白和隔音符"""
+    return _SPACES.sub("", unicodedata.normalize("NFKC", query).lower())
+
+
+class PrefixIndex:
+    """
+    条目 → 若干个键的前缀索引。全部 (键, 条目) 按键排序存放（相当于把前缀树按字典序摊平），
+    以某个前缀开头的键正好是其中连续的一段，两次二分就能找到；增删时只插入/删除该条目的几个键
+    """
+
+    def __init__(self):
+        self.sorted_keys = []
+        self.entries = []   # 与 sorted_keys 一一对应
+        self.keys = {}      # 条目 → 它的键（去重后）
+        self.heads = {}     # 条目 → 从名称开头算起的键（排序用）
+
+    def _index_keys(self, entry, name):
+        pairs = pinyin_keys(name)
+        keys = sorted({key for pair in pairs for key in pair if key})
+        self.keys[entry] = keys
+        self.heads[entry] = pairs[0] if pairs else ()
+        return keys
+
+    def add(self, entry, name):
+        if entry in self.keys:
+            return
+        for key in self._index_keys(entry, name):
+            i = bisect_right(self.sorted_keys, key)
+            self.sorted_keys.insert(i, key)
+            self.entries.insert(i, entry)
+
+    def add_many(self, items):
+        """批量加入 [(条目, 名称)]：合并后整体排序一次（首次构建时用）"""
+        items = [(entry, name) for entry, name in items if entry not in self.keys]
+        if len(items) < 64:
+            for entry, name in items:
+                self.add(entry, name)
+            return
+        pairs = list(zip(self.sorted_keys, self.entries))
+        for entry, name in items:
+            pairs += [(key, entry) for key in self._index_keys(entry, name)]
+        pairs.sort(key=lambda pair: pair[0])
+        self.sorted_keys = [key for key, _ in pairs]
+        self.entries = [entry for _, entry in pairs]
+
+    def remove(self, entry):
+        self.heads.pop(entry, None)
+        for key in self.keys.pop(entry, ()):
+            i = bisect_left(self.sorted_keys, key)
+            while i < len(self.sorted_keys) and self.sorted_keys[i] == key:
+                if self.entries[i] == entry:
+                    del self.sorted_keys[i]
+                    del self.entries[i]
+                    break
+                i += 1
+
+    def search(self, prefix):
+        """键以 prefix 开头的全部条目"""
+        lo = bisect_left(self.sorted_keys, prefix)
+        hi = bisect_left(self.sorted_keys, prefix + "\uffff", lo)
+        return set(self.entries[lo:hi])
+
+    def starts_with(self, entry, prefix):
+        """条目从名称开头就能匹配（排序时排在前面）"""
+        return any(key.startswith(prefix) for key in self.heads.get(entry, ()))
+
+
+class PinyinIndex:
+    """食物、食材、菜谱三份前缀索引，以及增量维护它们所需的状态"""
+
+    def __init__(self):
+        self.foods = PrefixIndex()
+        self.food_names = {}       # 食物id → 名称
+        self.version = None
+        self.ingredients = PrefixIndex()
+        self.recipes = PrefixIndex()
+        self.owners = {"ingredients": {}, "recipes": {}}  # 名称 → 拥有者集合（None 为内置）
+        self.loaded_users = set()
+        self._lock = threading.Lock()
+        for dish, ingredients in RECIPE_BOOK.items():
+            self._own("recipes", dish, None)
+            for ingredient in ingredients:
+                self._own("ingredients", ingredient, None)
+
+    def _own(self, kind, name, owner):
+        name = name.strip()
+        if not name:
+            return
+        self.owners[kind].setdefault(name, set()).add(owner)
+        getattr(self, kind).add(name, name)
+
+    def _disown(self, kind, name, owner):
+        owners = self.owners[kind].get(name)
+        if owners is None:
+            return
+        owners.discard(owner)
+        if not owners:
+            del self.owners[kind][name]
+            getattr(self, kind).remove(name)
+
+    def refresh_foods(self, conn):
+        """食物库版本变化时增量同步：删掉已删除或改了名的食物，加入新的"""
+        version, by_id = get_catalog(conn)
+        with self._lock:
+            if self.version == version:
+                return
+            for food_id in [f for f in self.food_names if f not in by_id or by_id[f]['name'] != self.food_names[f]]:
+                self.foods.remove(food_id)
+                del self.food_names[food_id]
+            added = [(food_id, food['name']) for food_id, food in by_id.items() if food_id not in self.food_names]
+            self.food_names.update(added)
+            self.foods.add_many(added)
+            self.version = version
+
+    def load_user(self, conn, user_id):
+        """第一次查询某个用户时读入他冰箱里出现过的食材和私房菜谱"""
+        if user_id == GUEST_USER or user_id in self.loaded_users:
+            return
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT food_name FROM pantry WHERE user_id = ?", (user_id,))
+        pantry_names = [row['food_name'] for row in cursor.fetchall()]
+        user_recipes = get_user_recipes(conn, user_id)
+        with self._lock:
+            if user_id in self.loaded_users:
+                return
+            for name in pantry_names:
+                self._own("ingredients", name, user_id)
+            for dish, ingredients in user_recipes.items():
+                self._own("recipes", dish, user_id)
+                for ingredient in ingredients:
+                    self._own("ingredients", ingredient, user_id)
+            self.loaded_users.add(user_id)
+
+    def remember(self, user_id, kind, names):
+        if user_id == GUEST_USER:
+            return
+        with self._lock:
+            for name in names:
+                self._own(kind, name, user_id)
+
+    def forget(self, user_id, kind, name):
+        with self._lock:
+            self._disown(kind, name, user_id)
+
+    def suggest(self, kind, query, user_id=None, limit=SUGGEST_LIMIT):
+        """食材或菜谱名称的候选：内置的和该用户自己的，从名称开头匹配的在前，短的在前"""
+        trie, owners = getattr(self, kind), self.owners[kind]
+        q = normalize_query(query)
+        if not q:
+            return []
+        with self._lock:
+            if q.isascii():
+                matches = [name for name in trie.search(q) if owners[name] & {None, user_id}]
+                head = {name for name in matches if trie.starts_with(name, q)}
+            else:
+                # 输入了汉字：直接按子串匹配（词表不大）
+                matches = [name for name, who in owners.items() if q in name.lower() and who & {None, user_id}]
+                head = {name for name in matches if name.lower().startswith(q)}
+        return sorted(matches, key=lambda name: (name not in head, len(name), name))[:limit]
+
+    def food_ids(self, query):
+        """全拼或首字母前缀能匹配上的食物 id 集合（含已停用的）；query 不是拼音时返回 None"""
+        q = normalize_query(query)
+        if not q or not q.isascii():
+            return None
+        with self._lock:
+            return set(self.foods.search(q))
+
+    def rank_foods(self, query, foods):
+        """把食物按拼音匹配程度排序：从名称开头匹配的在前，短的在前"""
+        q = normalize_query(query)
+        with self._lock:
+            head = {food['id'] for food in foods if self.foods.starts_with(food['id'], q)}
+        return sorted(foods, key=lambda food: (food['id'] not in head, len(food['name']), food['name']))
+
+
+_index = PinyinIndex()
+
+
+def refresh_index(conn):
+    """按需（增量）同步食物的拼音索引；进程启动时预热调用一次即完成全量构建"""
+    _index.refresh_foods(conn)
+
+
+def food_ids_matching(conn, query):
+    """
+    食物管理的搜索：拼音或首字母前缀能匹配上的食物 id 集合（含已停用的）。
+    输入里有汉字时返回 None，由调用方按名称子串搜索
+    """
+    refresh_index(conn)
+    return _index.food_ids(query)
+
+
+def suggest_foods(conn, query, exclude=(), limit=SUGGEST_LIMIT):
+    """
+    已启用食物的候选（按拼音、首字母或名称子串），exclude 为要排除的食物 id（如已在黑名单里的）。
+    conn 为能读到食物库的连接
+    """
+    refresh_index(conn)
+    _, by_id = get_catalog(conn)
+    ids = _index.food_ids(query)
+    if ids is None:
+        q = normalize_query(query)
+        foods = [food for food in by_id.values() if q and q in food['name'].lower()]
+    else:
+        foods = [by_id[food_id] for food_id in ids if food_id in by_id]
+    foods = [food for food in foods if food['active'] and food['id'] not in exclude]
+    return _index.rank_foods(query, foods)[:limit]
+
+
+def suggest_ingredients(conn, user_id, query, limit=SUGGEST_LIMIT):
+    """冰箱添加框的食材候选：内置菜谱的食材，加上该用户冰箱里出现过的、自己菜谱里的"""
+    _index.load_user(conn, user_id)
+    return _index.suggest("ingredients", query, user_id, limit)
+
+
+def suggest_recipes(conn, user_id, query, limit=SUGGEST_LIMIT):
+    """菜谱名称的候选：内置菜谱和该用户的私房菜谱"""
+    _index.load_user(conn, user_id)
+    return _index.suggest("recipes", query, user_id, limit)
+
+
+def remember_ingredients(user_id, names):
+    """新加入冰箱的食材名称并入索引"""
+    _index.remember(user_id, "ingredients", names)
+
+
+def remember_recipe(user_id, dish, ingredients):
+    """新保存的私房菜谱（菜名和食材）并入索引"""
+    _index.remember(user_id, "recipes", [dish])
+    _index.remember(user_id, "ingredients", ingredients)
+
+
+def forget_recipe(user_id, dish):
+    """删除私房菜谱后从索引里去掉（内置菜谱或别人的同名菜谱不受影响）"""
+    _index.forget(user_id, "recipes", dish)
@@ -0,0 +1,210 @@
+"""
+菜谱库：内置菜谱（菜名 → 所需食材）与用户自定义菜谱合并，并与冰箱里的食材做匹配。
+冰箱智能配餐和一周菜单共用这份数据。
+"""
+import heapq
+from collections import Counter
+
+from database import get_user_recipes
+
+# v2.1: 大幅扩充菜谱库
+RECIPE_BOOK = {
+    # --- 经典家常 ---
+    "番茄炒蛋": ["番茄", "鸡蛋"],
+    "青椒肉丝": ["青椒", "猪肉"],
+    "鱼香肉丝": ["猪肉", "木耳", "胡萝卜"],
+    "红烧肉": ["五花肉", "姜", "葱"],
+    "糖醋排骨": ["排骨"],
+    "回锅肉": ["五花肉", "青椒"],
+    "麻婆豆腐": ["豆腐", "牛肉"],
+    "宫保鸡丁": ["鸡丁", "花生", "黄瓜"],
+    "可乐鸡翅": ["鸡翅", "可乐"],
+    "大盘鸡": ["鸡肉", "土豆", "青椒"],
+    "水煮牛肉": ["牛肉", "豆芽"],
+    "西红柿牛腩": ["牛腩", "番茄", "洋葱"],
+    "清蒸鱼": ["鱼", "葱", "姜"],
+    "红烧茄子": ["茄子", "猪肉"],
+    "地三鲜": ["土豆", "茄子", "青椒"],
+    "干煸豆角": ["四季豆", "猪肉"],
+    "手撕包菜": ["包菜", "蒜"],
+    "酸辣土豆丝": ["土豆"],
+    # --- 健康&素菜&蛋类 ---
+    "清炒西兰花": ["西兰花"],
+    "蒜蓉西兰花": ["西兰花", "蒜"],
+    "蚝油生菜": ["生菜", "蒜"],
+    "凉拌黄瓜": ["黄瓜", "蒜"],
+    "凉拌木耳": ["木耳", "蒜"],
+    "黄瓜炒鸡蛋": ["黄瓜", "鸡蛋"],
+    "洋葱炒蛋": ["洋葱", "鸡蛋"],
+    "韭菜炒蛋": ["韭菜", "鸡蛋"],
+    "秋葵炒蛋": ["秋葵", "鸡蛋"],
+    "蒸鸡蛋羹": ["鸡蛋"],
+    "皮蛋豆腐": ["皮蛋", "豆腐"],
+    # --- 快手主食 (面食) ---
+    "葱油拌面": ["面条", "葱"],
+    "西红柿鸡蛋面": ["面条", "番茄", "鸡蛋"],
+    "炸酱面": ["面条", "猪肉", "黄瓜"],
+    "阳春面": ["面条", "葱"],
+    "雪菜肉丝面": ["面条", "猪肉", "雪菜"],
+    # --- 汤羹 ---
+    "排骨汤": ["排骨", "玉米", "胡萝卜"],
+    "冬瓜排骨汤": ["冬瓜", "排骨"],
+    "紫菜蛋花汤": ["紫菜", "鸡蛋"],
+    # --- 方便速成 ---
+    "香煎鸡胸肉": ["鸡胸肉"],
+    "白灼虾": ["虾"],
+    "火腿炒蛋": ["火腿", "鸡蛋"],
+    "咖喱鸡肉": ["鸡肉", "土豆", "胡萝卜", "洋葱"],
+}
+
+USE_FIRST_WEIGHT = 0.5  # 用到一样今天就过期的食材，相当于匹配度多 0.5
+
+
+def get_recipe_book(conn, user_id):
+    """内置菜谱与用户菜谱合并后的 {菜名: [食材]}，同名时用户菜谱优先"""
+    recipe_book = dict(RECIPE_BOOK)
+    recipe_book.update(get_user_recipes(conn, user_id))
+    return recipe_book
+
+
+def use_first_urgency(expiring):
+    """
+    快过期食材的紧迫度 {食材: 权重}：今天过期（或已过期）为 1，明天 1/2，后天 1/3……
+    expiring 为 get_expiring_items 的结果，同名食材取最紧迫的一批
+    """
+    urgency = {}
+    for item in expiring:
+        weight = 1 / (1 + max(item['days_left'], 0))
+        urgency[item['name']] = max(urgency.get(item['name'], 0), weight)
+    return urgency
+
+
+def match_recipes(recipe_book, available, urgency=None):
+    """
+    按冰箱食材给菜谱打匹配度，返回 [{'name', 'score', 'have', 'missing', 'use_first', 'priority'}]。
+    只要拥有至少一个食材就列入结果。urgency 为快过期食材的紧迫度（见 use_first_urgency），
+    排序时按 匹配度 + USE_FIRST_WEIGHT × 用到的快过期食材紧迫度之和，从高到低，优先用掉快过期的食材。
+    """
+    urgency = urgency or {}
+    scored_dishes = []
+    for dish, required in recipe_book.items():
+        required_set = set(required)
+        if not required_set:
+            continue
+        have_set = available.intersection(required_set)
+        if have_set:
+            use_first = sorted((item for item in have_set if item in urgency), key=urgency.get, reverse=True)
+            scored_dishes.append({
+                'name': dish,
+                'score': len(have_set) / len(required_set),
+                'have': list(have_set),
+                'missing': list(required_set - have_set),
+                'use_first': use_first,
+                'priority': len(have_set) / len(required_set) + USE_FIRST_WEIGHT * sum(map(urgency.get, use_first)),
+            })
+    scored_dishes.sort(key=lambda x: x['priority'], reverse=True)
+    return scored_dishes
+
+
+def _encode(recipe_book, available):
+    """
+    把菜谱编码成位集：每种食材一位，每道菜是它缺少的食材的位掩码（冰箱里已有的不计）；
+    另建倒排索引 食材位 → 用到它的菜的下标
+    """
+    bits = {}
+    names, masks = [], []
+    for dish, required in recipe_book.items():
+        mask = 0
+        for item in set(required) - available:
+            mask |= 1 << bits.setdefault(item, len(bits))
+        names.append(dish)
+        masks.append(mask)
+    users = [[] for _ in bits]
+    for r, mask in enumerate(masks):
+        for i in _iter_bits(mask):
+            users[i].append(r)
+    ingredients = sorted(bits, key=bits.get)
+    return names, masks, ingredients, users
+
+
+def _iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def what_to_buy(recipe_book, available, k=3):
+    """
+    在冰箱现有食材的基础上再买 k 种食材，使能完整做出来的菜最多。
+    返回 {'buy': [食材], 'unlocks': [菜名]}（按购买顺序）。
+
+    “整道菜都凑齐才算”不是子模函数，单个食材的边际收益会随已买的东西变大，
+    所以每一步的候选是“某道菜还缺的全部食材”这一捆：收益为买下后新凑齐的菜数，代价为捆里的食材数，
+    按收益/代价贪心。
+
+    菜用缺少食材的位掩码表示，并按“还缺的食材”掩码计数：一捆食材 R 的收益
+    就是 R 的各个非空子掩码上的菜数之和（缺的不超过 k 种，子掩码最多 2^k 个），不必扫描菜谱。
+
+    惰性求值：堆里存的是上次算出的比值，取出时若已过期就重算后放回，否则说明它仍是最优，直接选中。
+    收益只会因为“已被别的捆凑齐”而变小，这由取出时重算处理；会变大的只有两种：
+    捆里有刚买的食材（代价变小），或者某道受影响的菜剩下缺的食材恰好是这一捆的子集——
+    每步通过倒排索引把这些菜找出来立即重算。
+    """
+    names, masks, ingredients, users = _encode(recipe_book, available)
+    # 缺的比预算还多的菜不可能凑齐
+    uncovered = {r for r, mask in enumerate(masks) if mask and bin(mask).count("1") <= k}
+    residual_count = Counter(masks[r] for r in uncovered)
+    bought = 0
+
+    def evaluate(r):
+        residual = masks[r] & ~bought
+        gain, sub = 0, residual
+        while sub:
+            gain += residual_count.get(sub, 0)
+            sub = (sub - 1) & residual
+        return gain, bin(residual).count("1")
+
+    step = 0
+    version = {}
+    heap = []
+
+    def push(r):
+        gain, cost = evaluate(r)
+        version[r] = step
+        heapq.heappush(heap, (-gain / cost, step, r))
+
+    for r in uncovered:
+        push(r)
+
+    buy, unlocks = [], []
+    while heap and len(buy) < k:
+        _, computed_at, r = heapq.heappop(heap)
+        if r not in uncovered or version[r] != computed_at:
+            continue  # 已凑齐，或有更新的条目
+        residual = masks[r] & ~bought
+        if bin(residual).count("1") > k - len(buy):
+            continue  # 剩下的预算买不齐（之后捆变小时会作为受影响的菜重新放回）
+        if computed_at != step:
+            push(r)
+            continue
+        # 选中：买下这一捆，更新受影响的菜的剩余掩码
+        step += 1
+        bought |= residual
+        buy.extend(ingredients[i] for i in _iter_bits(residual))
+        touched = {x for i in _iter_bits(residual) for x in users[i] if x in uncovered}
+        dirty = set(touched)
+        for x in touched:
+            residual_count[masks[x] & ~(bought & ~residual)] -= 1
+            remaining = masks[x] & ~bought
+            if remaining:
+                residual_count[remaining] += 1
+                # 缺的食材包含这道菜剩余缺口的菜，收益可能变大
+                anchor = next(_iter_bits(remaining))
+                dirty.update(y for y in users[anchor] if masks[y] & ~bought & remaining == remaining)
+            else:
+                uncovered.discard(x)
+                unlocks.append(names[x])
+        for x in dirty & uncovered:
+            push(x)
+    return {'buy': buy, 'unlocks': unlocks}
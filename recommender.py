@@ -0,0 +1,444 @@
+import heapq
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+import metrics
+from database import (
+    GUEST_USER, FOOD_ATTRIBUTES, attribute_mask, get_eat_frequency, get_foods_by_ids, get_recommendation_cache,
+    get_recommendation_candidates, get_recommendation_versions, get_user_preferences, save_recommendation_cache
+)
+
+TIME_SLOTS = ("早餐时间", "午餐时间", "下午茶", "晚餐时间", "夜宵时间")
+# 最近吃过的食物/分类按衰减频次扣分（频次 1 ≈ 今天刚吃过一顿，半衰期见 FREQUENCY_HALF_LIFE_DAYS）
+FOOD_REPEAT_PENALTY = 15     # 每单位食物频次扣的分
+RECENT_REPEAT_PENALTY = 60   # 勾选“排除最近吃过的”时每单位食物频次扣的分
+CATEGORY_REPEAT_PENALTY = 8  # 每单位分类频次扣的分
+CATEGORY_PENALTY_CAP = 30
+TOP_N = 20       # 每个时间段预先保存的候选数
+SHORTLIST = 5    # 最终参与加权随机的候选数
+DIVERSITY = 0.5  # 重排时多样性所占的权重（0 为只看分数）
+
+RANKED_CACHE_TTL = 10 * 60   # 秒
+RANKED_CACHE_SIZE = 512      # 最多缓存的候选列表数
+
+RECOMMENDATION_CACHE = metrics.counter(
+    "honeyeat_recommendation_cache_total", "读取预计算推荐的次数（hit 为直接命中，refresh 为过期后重算）", ("result",)
+)
+RANKED_CACHE = metrics.counter(
+    "honeyeat_ranked_cache_total", "打好分的候选列表缓存命中情况", ("result",)
+)
+
+
+def candidate_foods(conn, user_id, user_prefs, must_have=()):
+    """
+    取推荐候选：黑名单、饮食限制（素食/不想吃的类型/必须满足的属性）都在 SQL 中排除；
+    最近吃过的不在这里排除，而是打分时按衰减频次扣分
+    """
+    required = set(must_have)
+    if user_prefs.get('vegetarian'):
+        required.add("素食")
+    avoided = [c for c in user_prefs.get('avoid_category', []) if c in FOOD_ATTRIBUTES]
+    return get_recommendation_candidates(
+        conn, user_id,
+        require_mask=attribute_mask(required), avoid_mask=attribute_mask(avoided)
+    )
+
+
+def score_food(food, user_prefs, time_of_day, mood=None, appetite=None, flavor_prefer=None, time_constraint=None,
+               frequency=None, avoid_recent=False, personal=None):
+    """
+    按问答结果和用户偏好给单个食物打分，返回 (分数, 理由列表)。
+    没有回答的维度（None）不参与打分，预计算时只按时间段和个人偏好打分。
+    frequency 为 get_eat_frequency 的结果；avoid_recent 时最近吃过的扣分更重。
+    personal 为从评分中学到的加减分 {食物id: 分数}（见 personalization.personal_bonus）。
+    """
+    score = 50  # 基础分
+    reasons = []
+    food_name = food['name']
+    food_cat = food['category']
+    food_tag = food.get('health_tag', '')
+    favorite_categories = user_prefs.get('favorite_category', [])
+    health_mode = user_prefs.get('health_mode', '普通模式')
+
+    # --- 组合规则 (高优先级) ---
+    if time_of_day == "早餐时间" and time_constraint == "很赶时间":
+        if food_cat in ['早餐', '速食', '轻食'] or any(k in food_name for k in ['包子', '面包', '三明治', '手抓饼']):
+            score += 50
+            reasons.append("为你找到了方便快捷的早餐")
+    
+    # --- 维度1: 时间段 (time_of_day) ---
+    if time_of_day == "早餐时间":
+        if food_cat in ['早餐', '速食'] or any(k in food_name for k in ['粥', '蛋', '包子', '面包']):
+            score += 35
+            reasons.append("这个当早餐很不错")
+        elif food_cat in ['大餐', '火锅', '烧烤', '中餐']:
+            score -= 50 # 大幅降低不合适早餐的权重
+    elif time_of_day == "午餐时间":
+        if food_cat in ['中餐', '家常菜', '快餐'] or any(k in food_name for k in ['饭', '面']):
+            score += 25
+            reasons.append("午餐吃这个能补充能量")
+    elif time_of_day == "下午茶":
+        if food_cat in ['甜品', '零食饮料', '轻食', '小吃']:
+            score += 40
+            reasons.append("下午茶时间，享受片刻悠闲")
+        elif food_cat in ['大餐', '家常菜']:
+            score -= 20
+    elif time_of_day == "晚餐时间":
+        if food_cat in ['中餐', '西餐', '日料', '大餐', '家常菜', '烧烤']:
+            score += 25
+            reasons.append("晚餐值得吃顿好的")
+    elif time_of_day == "夜宵时间":
+        if food_cat in ['烧烤', '速食', '小吃', '零食饮料'] or '面' in food_name:
+            score += 40
+            reasons.append("深夜的美味最治愈")
+        elif food_cat in ['大餐', '西餐']:
+            score -= 20
+
+    # --- 维度2: 心情 (mood) ---
+    if mood == "开心愉悦":
+        if food_cat in ['甜品', '大餐', '零食饮料']:
+            score += 20
+            reasons.append("开心就该吃点好的")
+    elif mood == "有点累":
+        if food_tag == 'Healthy' or '粥' in food_name or '汤' in food_name:
+            score += 25
+            reasons.append("有点累了，吃点健康的恢复一下")
+    elif mood == "压力山大":
+        if food_tag == 'CheatMeal' or food_cat in ['大餐', '快餐', '烧烤', '甜品']:
+            score += 30
+            reasons.append("用美食来释放所有压力吧")
+    elif mood == "平静放松":
+        if food_cat in ['家常菜', '轻食', '日料'] or food_tag == 'Light':
+            score += 20
+            reasons.append("平静的心情适合品尝细腻的味道")
+
+    # --- 维度3: 食欲 (appetite) ---
+    if appetite == "特别饿":
+        if food_tag == 'CheatMeal' or food_cat in ['快餐', '大餐', '烧烤'] or any(k in food_name for k in ['饭', '面', '汉堡']):
+            score += 30
+            reasons.append("饿的时候，就该吃点管饱的")
+    elif appetite == "不太饿":
+        if food_cat in ['轻食', '甜品', '零食饮料', '小吃'] or food_tag == 'Light':
+            score += 25
+            reasons.append("不太饿？来点小吃或轻食刚刚好")
+    elif appetite == "想吃点特别的":
+        if food_cat in ['日料', '西餐', '大餐'] or food.get('cost_level') == '$$$':
+            score += 30
+            reasons.append("满足你对特别美食的渴望")
+
+    # --- 维度4: 口味 (flavor_prefer) ---
+    if flavor_prefer == "清淡健康":
+        if food_tag in ['Healthy', 'Light']:
+            score += 30
+        elif food_tag in ['Spicy', 'CheatMeal'] or food_cat == '烧烤':
+            score -= 25
+    elif flavor_prefer == "重口味" or flavor_prefer == "香辣刺激":
+        if food_tag == 'Spicy' or any(k in food_name for k in ['辣', '麻', '香锅', '火锅']):
+            score += 40
+            reasons.append("够味才过瘾")
+    elif flavor_prefer == "酸甜口":
+        if food_tag == 'Sweet' or any(k in food_name for k in ['糖醋', '咕咾', '番茄']):
+            score += 25
+            reasons.append("酸酸甜甜就是我")
+
+    # --- 维度5: 时间约束 (time_constraint) ---
+    if time_constraint == "很赶时间":
+        if food_cat in ['快餐', '速食', '小吃', '轻食', '零食饮料']:
+            score += 35
+            reasons.append("时间紧，吃这个最快")
+    elif time_constraint == "时间充裕":
+        if food_cat in ['家常菜', '大餐', '西餐', '日料']:
+            score += 15
+            reasons.append("时间充裕，值得慢慢享受")
+
+    # --- 维度6: 用户个人偏好 (user_prefs) ---
+    if not user_prefs.get('spicy') and food_tag == 'Spicy':
+        score -= 20
+    if user_prefs.get('sweet') and food_tag == 'Sweet':
+        score += 15
+    if food_cat in favorite_categories:
+        score += 20
+        reasons.append(f"还是你最爱的{food_cat}")
+    
+    # --- 维度7: 健康模式 (health_mode) ---
+    if health_mode == "健康模式":
+        if food_tag == 'Healthy':
+            score += 25
+        elif food_tag == 'CheatMeal':
+            score -= 20
+    elif health_mode == "放纵模式":
+        if food_tag == 'CheatMeal':
+            score += 20
+            reasons.append("今天就要放纵一下")
+
+    # --- 维度8: 最近吃过的 (衰减频次) ---
+    if frequency:
+        food_weight = RECENT_REPEAT_PENALTY if avoid_recent else FOOD_REPEAT_PENALTY
+        score -= food_weight * frequency['food'].get(food['id'], 0)
+        score -= min(CATEGORY_REPEAT_PENALTY * frequency['category'].get(food_cat, 0), CATEGORY_PENALTY_CAP)
+        score = round(score, 1)
+
+    # --- 维度9: 从评分中学到的个人口味 (personal) ---
+    if personal:
+        bonus = personal.get(food['id'], 0)
+        score = round(score + bonus, 1)
+        if bonus >= 10:
+            reasons.append("根据你以往的打分，这个你应该会喜欢")
+
+    return score, list(set(reasons))
+
+
+def rank_foods(foods, user_prefs, time_of_day, k=TOP_N, **answers):
+    """
+    给候选打分并取分数最高的 k 个（从高到低），返回 [{'food', 'score', 'reasons'}]。
+    边打分边用大小为 k 的堆筛选，O(n log k)，不必为整个列表排序。
+    """
+    scored = (
+        {'food': food, 'score': score, 'reasons': reasons}
+        for food in foods
+        for score, reasons in [score_food(food, user_prefs, time_of_day, **answers)]
+    )
+    return heapq.nlargest(k, scored, key=lambda x: x['score'])
+
+
+def _similarity(a, b):
+    """两个食物的相似度：同分类、同健康标签各占一半"""
+    same_category = a['category'] == b['category']
+    same_tag = bool(a.get('health_tag')) and a.get('health_tag') == b.get('health_tag')
+    return 0.5 * same_category + 0.5 * same_tag
+
+
+def diversify(ranked, k=SHORTLIST, diversity=DIVERSITY):
+    """
+    MMR 重排：从按分数排好序的候选里挑 k 个，每一步选
+    (1 - diversity) × 归一化分数 - diversity × 与已选者的最大相似度 最高的一个，
+    避免候选名单全是同一个分类。
+    """
+    if len(ranked) <= k:
+        return list(ranked)
+    high = ranked[0]['score']
+    low = min(c['score'] for c in ranked)
+    span = (high - low) or 1
+    remaining = list(ranked)
+    selected = [remaining.pop(0)]
+    while remaining and len(selected) < k:
+        best = max(
+            range(len(remaining)),
+            key=lambda i: (1 - diversity) * (remaining[i]['score'] - low) / span
+            - diversity * max(_similarity(remaining[i]['food'], s['food']) for s in selected),
+        )
+        selected.append(remaining.pop(best))
+    return selected
+
+
+def refresh_recommendations(conn, user_id, time_slots=TIME_SLOTS, versions=None):
+    """
+    重新计算用户各时间段的 top-N 推荐并写入 recommendation_cache（提交）。
+    与页面默认一致：最近吃过的按 avoid_recent 的权重扣分。
+    """
+    if versions is None:
+        versions = get_recommendation_versions(conn, user_id)
+        if versions is None:
+            return {}
+    user_prefs = get_user_preferences(conn, user_id)
+    # 按需导入：NumPy 较重，不拖慢页面冷启动
+    from personalization import personal_bonus
+
+    foods = candidate_foods(conn, user_id, user_prefs)
+    frequency = get_eat_frequency(conn, user_id)
+    personal = personal_bonus(conn, user_id, foods)
+    today = date.today().isoformat()
+    results = {}
+    for time_slot in time_slots:
+        ranked = rank_foods(
+            foods, user_prefs, time_slot, k=TOP_N, frequency=frequency, avoid_recent=True, personal=personal
+        )
+        entries = [(r['food']['id'], r['score']) for r in ranked]
+        save_recommendation_cache(conn, user_id, time_slot, entries, versions, today)
+        results[time_slot] = entries
+    conn.commit()
+    return results
+
+
+def get_slot_recommendations(conn, user_id, time_slot):
+    """
+    读取某时间段预先算好的推荐，返回 [(食物, 分数)]。
+    偏好、饮食记录、黑名单或食物库有变化，或者不是今天算的，先重算该用户的所有时间段。
+    """
+    versions = get_recommendation_versions(conn, user_id)
+    if versions is None:
+        return []
+    cached = get_recommendation_cache(conn, user_id, time_slot)
+    if cached and cached[0] == versions and cached[1] == date.today().isoformat():
+        RECOMMENDATION_CACHE.inc(result="hit")
+        entries = cached[2]
+    else:
+        RECOMMENDATION_CACHE.inc(result="refresh")
+        entries = refresh_recommendations(conn, user_id, versions=versions).get(time_slot, [])
+    scores = dict(entries)
+    foods = get_foods_by_ids(conn, [food_id for food_id, _ in entries])
+    return [(food, scores[food['id']]) for food in foods]
+
+
+class RankedEntry:
+    """一份打好分的候选列表，附带“上一次选中的是谁”的游标"""
+
+    def __init__(self, candidates, ttl=RANKED_CACHE_TTL):
+        self.candidates = candidates
+        self.expires = time.monotonic() + ttl
+        self.last_id = None
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """按分数加权随机选一个候选，不会连续两次选中同一个食物"""
+        with self._lock:
+            pool = [c for c in self.candidates if c['food']['id'] != self.last_id] or self.candidates
+            if not pool:
+                return None
+            # 简单处理，避免分数为0或负数
+            weights = [max(c['score'], 1) for c in pool]
+            selected = random.choices(pool, weights=weights, k=1)[0]
+            self.last_id = selected['food']['id']
+            return selected
+
+
+class RankedCache:
+    """候选列表缓存：过期时间 + 最近最少使用淘汰"""
+
+    def __init__(self, ttl=RANKED_CACHE_TTL, max_entries=RANKED_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, candidates):
+        entry = RankedEntry(candidates, self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_ranked_cache = RankedCache()
+
+
+def get_ranked_entry(conn, user_id, inputs, compute):
+    """
+    取打好分的候选列表：按 (用户, 输入, 数据版本, 日期) 缓存，
+    同样的回答重复点击时不再查询和打分，只从缓存的列表里重新抽一个。
+    inputs 为描述本次请求的可哈希元组，compute() 在未命中时计算候选列表。
+    游客各自的内存库版本号互不相干，不走缓存。
+    """
+    if user_id == GUEST_USER:
+        return RankedEntry(compute())
+    versions = get_recommendation_versions(conn, user_id)
+    key = (user_id, inputs, versions, date.today().isoformat())
+    entry = _ranked_cache.get(key)
+    if entry is not None:
+        RANKED_CACHE.inc(result="hit")
+        return entry
+    RANKED_CACHE.inc(result="miss")
+    return _ranked_cache.put(key, compute())
+
+
+# ============ 按剩余热量配一餐 ============
+SIDE_CATEGORIES = ("小吃", "甜品", "轻食", "零食饮料")
+COST_UNITS = {"$": 1, "$$": 2, "$$$": 3}
+MAX_SIDES = 2     # 一餐最多搭配的小食/饮品数
+FILL_BONUS = 30   # 正好吃满剩余热量时额外加的分（按占比线性折算）
+
+
+_SOUP_MASK = attribute_mask(["汤羹"])
+_STAPLE_MASK = attribute_mask(["主食"])
+
+
+def is_side_dish(food):
+    """小食、甜品、饮品和（不是主食的）汤羹算配菜，其余算主菜"""
+    mask = food.get('attr_mask') or 0
+    return food['category'] in SIDE_CATEGORIES or bool(mask & _SOUP_MASK and not mask & _STAPLE_MASK)
+
+
+def fill_calorie_budget(ranked, budget, max_cost, max_sides=MAX_SIDES):
+    """
+    在剩余热量 budget（千卡）和价位合计 max_cost（$ 的个数）内，挑一个主菜加至多 max_sides 个配菜，
+    使 Σ(分数 + FILL_BONUS × 热量 / budget) 最大——每个食物最多选一次的有界背包。
+
+    用分支定界求精确解：主菜和配菜都按分数从高到低排序，上界取
+    当前价值 + 剩下几个位置上最高的几个分数 + 剩余热量全部吃满的 FILL_BONUS 折算，
+    不超过已知最优解时整枝剪掉；上界随位置单调不增，一旦不够，后面的位置也不够，直接结束循环。
+    ranked 为 [{'food', 'score', ...}]，返回 {'items', 'calories', 'cost', 'value'}，没有可行组合时返回 None。
+    """
+    mains, sides = [], []
+    for c in ranked:
+        calories = c['food'].get('calories') or 0
+        cost = COST_UNITS.get(c['food'].get('cost_level'), 2)
+        if calories <= 0 or calories > budget or cost > max_cost:
+            continue
+        item = (c['score'], calories, cost, c)
+        if not is_side_dish(c['food']):
+            mains.append(item)
+        elif c['score'] + FILL_BONUS * calories / budget > 0:  # 价值不为正的配菜不如不点
+            sides.append(item)
+    if not mains:
+        return None
+    mains.sort(key=lambda item: item[0], reverse=True)
+    sides.sort(key=lambda item: item[0], reverse=True)
+    prefix = [0.0]
+    for score, _, _, _ in sides:
+        prefix.append(prefix[-1] + max(score, 0))
+
+    def top_scores(start, slots):
+        return prefix[min(start + slots, len(sides))] - prefix[start]
+
+    best = {'value': float('-inf'), 'items': None}
+    chosen = []
+
+    def search(start, slots, calories_left, cost_left, value):
+        if value > best['value']:
+            best['value'], best['items'] = value, list(chosen)
+        if slots == 0:
+            return
+        fill_bound = FILL_BONUS * calories_left / budget
+        for i in range(start, len(sides)):
+            if value + top_scores(i, slots) + fill_bound <= best['value']:
+                break
+            score, calories, cost, c = sides[i]
+            if calories <= calories_left and cost <= cost_left:
+                chosen.append(c)
+                search(i + 1, slots - 1, calories_left - calories, cost_left - cost,
+                       value + score + FILL_BONUS * calories / budget)
+                chosen.pop()
+
+    for score, calories, cost, c in mains:
+        if score + top_scores(0, max_sides) + FILL_BONUS <= best['value']:
+            break
+        chosen.append(c)
+        search(0, max_sides, budget - calories, max_cost - cost, score + FILL_BONUS * calories / budget)
+        chosen.pop()
+
+    items = best['items']
+    return {
+        'items': items,
+        'calories': sum(c['food']['calories'] for c in items),
+        'cost': sum(COST_UNITS.get(c['food'].get('cost_level'), 2) for c in items),
+        'value': round(best['value'], 1),
+    }
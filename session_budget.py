@@ -0,0 +1,88 @@
+import os
+import sys
+import threading
+import time
+
+import metrics
+
+SESSION_STATE_CAP = int(os.environ.get("HONEYEAT_SESSION_STATE_CAP_KB", "256")) * 1024
+SESSION_IDLE = 30 * 60  # 秒，超过该时长没有 rerun 的会话不再计入
+
+SESSION_STATE_TRIMMED = metrics.counter(
+    "honeyeat_session_state_trimmed_total", "因超出会话内存上限而被丢弃的 session_state 键", ("key",)
+)
+
+
+def deep_size(obj, _seen=None):
+    """估算对象及其引用的容器内容占用的字节数（同一对象只计一次）"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, _seen) + deep_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, _seen) for item in obj)
+    return size
+
+
+class _SessionEntry:
+    def __init__(self, user, size, largest):
+        self.user = user
+        self.size = size
+        self.largest = largest
+        self.last_seen = time.monotonic()
+
+
+class SessionBudget:
+    """
+    会话内存记账：每次 rerun 结束时估算该会话 session_state 的大小并登记。
+
+    单个会话超过 cap 时，按从大到小的顺序丢弃调用方声明为可丢弃的键
+    （都是可以重新计算的推荐结果之类），使服务端内存随在线人数线性、可预期地增长。
+    """
+
+    def __init__(self, cap=SESSION_STATE_CAP, idle=SESSION_IDLE):
+        self.cap = cap
+        self.idle = idle
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def record(self, session_id, user, state, droppable=()):
+        """登记会话大小，返回需要从 session_state 中删除的键"""
+        sizes = {key: deep_size(value) for key, value in state.items()}
+        total = sum(sizes.values())
+        dropped = []
+        for key in sorted((k for k in droppable if k in sizes), key=sizes.get, reverse=True):
+            if total <= self.cap:
+                break
+            total -= sizes.pop(key)
+            dropped.append(key)
+            SESSION_STATE_TRIMMED.inc(key=key)
+        largest = sorted(sizes, key=sizes.get, reverse=True)[:3]
+
+        now = time.monotonic()
+        with self._lock:
+            for stale_id in [s for s, e in self._sessions.items() if now - e.last_seen > self.idle]:
+                del self._sessions[stale_id]
+            self._sessions[session_id] = _SessionEntry(user, total, largest)
+        return dropped
+
+    def snapshot(self):
+        """返回 [(会话 id, 用户, 字节数, 最大的几个键, 空闲秒数)]，按大小降序"""
+        now = time.monotonic()
+        with self._lock:
+            rows = [
+                (session_id, e.user, e.size, e.largest, now - e.last_seen)
+                for session_id, e in self._sessions.items()
+            ]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def total(self):
+        with self._lock:
+            return sum(e.size for e in self._sessions.values())
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,216 @@
+"""
+“更多类似的”：食物之间的相似度索引。
+
+每个食物一个 float32 特征向量，由几块拼成（每块先单位化再乘权重）：
+分类、健康标签、价位的 one-hot，名称的单字和相邻两字（哈希到固定维数），
+以及“被哪些人吃过”——每个用户对应一个固定的随机向量，食物的这一块是吃过它的用户向量
+按 log(1 + 次数) 加权求和（随机投影：被同一批人常吃的食物方向相近）。
+整行单位化后，余弦相似度就是一次矩阵-向量乘法。
+
+索引在进程内缓存：食物库版本变化时只重算改动过的食物，新的用餐记录按主键增量并入。
+"""
+import threading
+import zlib
+
+import numpy as np
+
+from database import get_catalog, get_meals_after
+from personalization import CATEGORIES, COST_LEVELS, HEALTH_TAGS
+
+NGRAM_DIMS = 64
+CO_EATEN_DIMS = 16
+# 各块的权重（平方后即该块在余弦相似度里所占的比例）
+CATEGORY_WEIGHT = 1.0
+TAG_WEIGHT = 0.6
+COST_WEIGHT = 0.4
+NAME_WEIGHT = 1.0
+CO_EATEN_WEIGHT = 0.8
+SIMILAR_K = 5
+
+CONTENT_DIMS = len(CATEGORIES) + len(HEALTH_TAGS) + len(COST_LEVELS) + NGRAM_DIMS
+
+
+def _unit(x):
+    norm = np.linalg.norm(x)
+    return x / norm if norm else x
+
+
+def _one_hot(values, value):
+    x = np.zeros(len(values), np.float32)
+    if value in values:
+        x[values.index(value)] = 1.0
+    return x
+
+
+def _name_ngrams(name):
+    """名称的单字和相邻两字计数，用 crc32 哈希到 NGRAM_DIMS 维（进程重启后保持一致）"""
+    x = np.zeros(NGRAM_DIMS, np.float32)
+    for gram in list(name) + [name[i:i + 2] for i in range(len(name) - 1)]:
+        x[zlib.crc32(gram.encode("utf-8")) % NGRAM_DIMS] += 1.0
+    return x
+
+
+def content_vector(food):
+    """食物本身属性的那几块（分类、健康标签、价位、名称），已按权重缩放"""
+    return np.concatenate([
+        _unit(_one_hot(CATEGORIES, food.get('category'))) * CATEGORY_WEIGHT,
+        _unit(_one_hot(HEALTH_TAGS, food.get('health_tag'))) * TAG_WEIGHT,
+        _unit(_one_hot(COST_LEVELS, food.get('cost_level'))) * COST_WEIGHT,
+        _unit(_name_ngrams(food['name'])) * NAME_WEIGHT,
+    ]).astype(np.float32)
+
+
+def _signature(food):
+    return food['name'], food.get('category'), food.get('health_tag'), food.get('cost_level')
+
+
+class SimilarityIndex:
+    """全部食物的特征矩阵（每行单位化），以及增量维护它所需的中间结果"""
+
+    def __init__(self):
+        self.version = None
+        self.ids = []
+        self.rows = {}          # 食物id → 行号
+        self.signatures = {}    # 食物id → 计算特征时用到的字段
+        self.content = np.zeros((0, CONTENT_DIMS), np.float32)
+        self.co_eaten = np.zeros((0, CO_EATEN_DIMS), np.float32)
+        self.matrix = np.zeros((0, CONTENT_DIMS + CO_EATEN_DIMS), np.float32)
+        self.active = np.zeros(0, bool)
+        # 查询时只在已启用的食物里找：这些行单独存一份连续的矩阵
+        self.search_ids = []
+        self.search_pos = {}    # 行号 → 在 search 中的行号
+        self.search = self.matrix
+        self._results = {}      # 查询结果缓存，索引有任何变化时清空
+        self.eaten = {}         # 食物id → {用户: 次数}
+        self.last_meal_id = 0
+        self._user_vectors = {}
+        self._lock = threading.Lock()
+
+    def _user_vector(self, user_id):
+        vector = self._user_vectors.get(user_id)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(str(user_id).encode("utf-8")))
+            vector = (rng.standard_normal(CO_EATEN_DIMS) / np.sqrt(CO_EATEN_DIMS)).astype(np.float32)
+            self._user_vectors[user_id] = vector
+        return vector
+
+    def _co_eaten_vector(self, food_id):
+        vector = np.zeros(CO_EATEN_DIMS, np.float32)
+        for user_id, n in self.eaten.get(food_id, {}).items():
+            vector += np.log1p(n) * self._user_vector(user_id)
+        return vector
+
+    def _compose(self, content, co_eaten):
+        """拼出最终的行并单位化"""
+        norms = np.linalg.norm(co_eaten, axis=1, keepdims=True)
+        co_eaten = np.divide(co_eaten, norms, out=np.zeros_like(co_eaten), where=norms > 0) * CO_EATEN_WEIGHT
+        full = np.hstack([content, co_eaten])
+        norms = np.linalg.norm(full, axis=1, keepdims=True)
+        return np.divide(full, norms, out=np.zeros_like(full), where=norms > 0).astype(np.float32)
+
+    def _sync_catalog(self, version, by_id):
+        """食物库变化后重建行：没改动的食物直接搬运原来的特征，只为新增和改动的食物计算"""
+        ids = list(by_id)
+        content = np.empty((len(ids), CONTENT_DIMS), np.float32)
+        co_eaten = np.empty((len(ids), CO_EATEN_DIMS), np.float32)
+        kept_new, kept_old = [], []
+        for i, food_id in enumerate(ids):
+            food = by_id[food_id]
+            old = self.rows.get(food_id)
+            if old is not None and self.signatures.get(food_id) == _signature(food):
+                kept_new.append(i)
+                kept_old.append(old)
+                continue
+            content[i] = content_vector(food)
+            co_eaten[i] = self._co_eaten_vector(food_id) if old is None else self.co_eaten[old]
+            self.signatures[food_id] = _signature(food)
+        if kept_new:
+            content[kept_new] = self.content[kept_old]
+            co_eaten[kept_new] = self.co_eaten[kept_old]
+
+        self.ids = ids
+        self.rows = {food_id: i for i, food_id in enumerate(ids)}
+        self.signatures = {food_id: self.signatures[food_id] for food_id in ids}
+        self.content, self.co_eaten = content, co_eaten
+        self.active = np.array([bool(by_id[food_id]['active']) for food_id in ids], bool)
+        self.matrix = self._compose(content, co_eaten)
+        self.version = version
+        self._refresh_search()
+
+    def _refresh_search(self):
+        rows = np.flatnonzero(self.active)
+        self.search_ids = [self.ids[r] for r in rows]
+        self.search_pos = {int(r): i for i, r in enumerate(rows)}
+        self.search = np.ascontiguousarray(self.matrix[rows])
+        self._results.clear()
+
+    def _sync_meals(self, meals):
+        """并入新的用餐记录，只重算被吃到的食物那几行"""
+        touched = set()
+        for meal_id, user_id, food_id in meals:
+            counts = self.eaten.setdefault(food_id, {})
+            counts[user_id] = counts.get(user_id, 0) + 1
+            touched.add(food_id)
+            self.last_meal_id = meal_id
+        rows = [self.rows[food_id] for food_id in touched if food_id in self.rows]
+        if rows:
+            for r in rows:
+                self.co_eaten[r] = self._co_eaten_vector(self.ids[r])
+            self.matrix[rows] = self._compose(self.content[rows], self.co_eaten[rows])
+            for r in rows:
+                if r in self.search_pos:
+                    self.search[self.search_pos[r]] = self.matrix[r]
+            self._results.clear()
+
+    def refresh(self, conn):
+        """按需增量更新（食物库版本、新的用餐记录）"""
+        version, by_id = get_catalog(conn)
+        with self._lock:
+            meals = get_meals_after(conn, self.last_meal_id)
+            if self.version != version:
+                # 先记下新的用餐，重建行时直接带上
+                self._sync_meals(meals)
+                self._sync_catalog(version, by_id)
+            elif meals:
+                self._sync_meals(meals)
+
+    def nearest(self, food_id, k=SIMILAR_K, exclude=()):
+        """与 food_id 最相似的 k 个已启用食物 [(食物id, 相似度)]，相似度从高到低"""
+        key = (food_id, k, frozenset(exclude))
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                return cached
+            r = self.rows.get(food_id)
+            if r is None or not self.search_ids:
+                return []
+            similarity = self.search @ self.matrix[r]
+            # 多取几个，去掉自己和被排除的之后仍有 k 个
+            m = min(k + 1 + len(exclude), len(similarity))
+            top = np.argpartition(-similarity, m - 1)[:m]
+            top = top[np.argsort(-similarity[top])]
+            result = [
+                (self.search_ids[i], float(similarity[i])) for i in top
+                if self.search_ids[i] != food_id and self.search_ids[i] not in exclude
+            ][:k]
+            self._results[key] = result
+            return result
+
+
+_index = SimilarityIndex()
+
+
+def refresh_index(conn):
+    """按需（增量）更新索引；进程启动时预热调用一次即完成全量构建"""
+    _index.refresh(conn)
+
+
+def similar_foods(conn, food_id, k=SIMILAR_K, exclude=()):
+    """
+    与指定食物最相似的 k 个已启用食物 [(食物, 相似度)]；exclude 为要排除的食物 id（如黑名单）。
+    conn 为正式数据库的连接（食物库和全部用户的饮食记录）
+    """
+    refresh_index(conn)
+    _, by_id = get_catalog(conn)
+    return [(by_id[other], similarity) for other, similarity in _index.nearest(food_id, k, exclude)
+            if other in by_id]
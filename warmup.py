@@ -0,0 +1,31 @@
+"""
+服务启动前的预热脚本：在 `streamlit run` 之前执行，
+提前建表/迁移/填充默认数据，并把常用表读入操作系统页缓存，
+第一个连接进来的用户不必再等待数据库初始化。
+
+用法：
+    python warmup.py && streamlit run app.py
+"""
+import time
+
+from database import get_connection, initialize_and_seed_database, get_active_foods
+
+
+def main():
+    start = time.perf_counter()
+    conn = get_connection()
+    initialize_and_seed_database(conn)
+    init_elapsed = time.perf_counter() - start
+
+    foods = get_active_foods(conn)
+    cursor = conn.cursor()
+    for table in ("users", "eat_history", "pantry"):
+        cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+    conn.close()
+
+    total = time.perf_counter() - start
+    print(f"✅ 预热完成：初始化 {init_elapsed * 1000:.0f} ms，共 {total * 1000:.0f} ms，已启用食物 {len(foods)} 个")
+
+
+if __name__ == "__main__":
+    main()